@@ -1,129 +1,26 @@
 import sys
-import xml.etree.ElementTree as ET
-import csv
-import re
 import os
+import bisect
+import functools
+import itertools
+import time
+from contextlib import closing
 from PyQt6.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, 
-                            QPushButton, QTableWidget, QTableWidgetItem, QHeaderView, 
+                            QPushButton, QTableView, QHeaderView, 
                             QLineEdit, QComboBox, QCheckBox, QDialog, QFormLayout,
                             QMessageBox, QLabel, QStackedWidget, QDialogButtonBox, QFileDialog,
-                            QFrame)
-from PyQt6.QtCore import Qt, QSize
+                            QFrame, QProgressBar)
+from PyQt6.QtCore import Qt, QSize, QAbstractTableModel, QModelIndex, QObject, QTimer, pyqtSignal
 from PyQt6.QtGui import QFont, QIcon, QPixmap, QPalette, QColor
-from thefuzz import fuzz
-
-def parse_complex_name(name):
-    # Remove any parentheses and their contents
-    name = re.sub(r'\([^)]*\)', '', name)
-    
-    # Split the name into parts
-    parts = [part.strip() for part in name.split()]
-    
-    # If we have multiple parts and they look like nickname + full name
-    if len(parts) >= 2:
-        first_part = parts[0].lower()
-        second_part = parts[1].lower()
-        
-        # Define nickname mappings where key is nickname and value is list of possible formal names
-        common_nicknames = {
-            'kate': ['kathryn', 'katherine', 'kathleen'],
-            'kathy': ['kathryn', 'katherine'],
-            'katie': ['katherine', 'kathryn'],
-            'beth': ['elizabeth'],
-            'liz': ['elizabeth'],
-            'lizzy': ['elizabeth'],
-            'betty': ['elizabeth'],
-            'meg': ['margaret'],
-            'maggie': ['margaret'],
-            'peggy': ['margaret'],
-            'abby': ['abigail'],
-            'gabby': ['gabriella'],
-            'maddie': ['madeline'],
-            'madi': ['madeleine'],
-            'alex': ['alexandra', 'alexandria'],
-            'sandy': ['sandra'],
-            'becky': ['rebecca'],
-            'vicky': ['victoria'],
-            'val': ['valerie'],
-            'sue': ['susan'],
-            'susie': ['susan'],
-            'tom': ['thomas'],
-            'sam': ['samuel'],
-            'mike': ['michael'],
-            'mick': ['michael'],
-            'jim': ['james'],
-            'jimmy': ['james'],
-            'bob': ['robert'],
-            'rob': ['robert'],
-            'dick': ['richard'],
-            'rick': ['richard'],
-            'bill': ['william'],
-            'will': ['william'],
-            'matt': ['matthew'],
-            'chris': ['christopher'],
-            'tony': ['anthony'],
-            'don': ['donald'],
-            'ed': ['edward'],
-            'ted': ['edward'],
-            'joe': ['joseph'],
-            'pete': ['peter'],
-            'dan': ['daniel'],
-            'danny': ['daniel'],
-            'nick': ['nicholas'],
-            'dave': ['david'],
-            'steve': ['stephen', 'steven'],
-            'andy': ['andrew'],
-            'drew': ['andrew'],
-            'fred': ['frederick'],
-            'ben': ['benjamin'],
-            'charlie': ['charles'],
-            'chuck': ['charles'],
-        }
-        
-        # Check if first part is a nickname and second part is its formal name
-        should_remove_first = (
-            (first_part in common_nicknames and second_part in common_nicknames[first_part]) or
-            (len(first_part) >= 2 and first_part in second_part)
-        )
-        
-        if should_remove_first:
-            parts = parts[1:]
-    
-    # Capitalize each part
-    parts = [part.capitalize() for part in parts]
-    
-    # Determine first and last name
-    if len(parts) > 2:
-        # If there are more than two parts, assume the last part is the last name
-        first_name = ' '.join(parts[:-1])
-        last_name = parts[-1]
-    elif len(parts) == 2:
-        # If there are two parts, assume first part is first name and second part is last name
-        first_name, last_name = parts
-    elif len(parts) == 1:
-        first_name = parts[0]
-        last_name = ""
-    else:
-        first_name = ""
-        last_name = ""
-    
-    return first_name.strip(), last_name.strip()
-
-def get_phone_type(phone_number):
-    if phone_number.startswith("61"):
-        return "Home"
-    elif phone_number.startswith("2"):
-        return "Home"
-    else:
-        return "Mobile"
-
-def format_phone_number(phone_number):
-    if phone_number.startswith("61"):
-        return phone_number[2:]
-    elif phone_number.startswith("2"):
-        return phone_number[1:]
-    else:
-        return phone_number
+from phonebooker.core import (CSV_IMPORT_GROUPS, DEFAULT_GROUPS, Contact, ContactStore, GroupRegistry,
+                              OperationCancelled, PhoneIndex, contact_sort_key, gc_paused, is_database_file,
+                              iter_xml_contacts, write_xml_phonebook)
+from phonebooker import journal, trace
+from phonebooker.cache import cached_contacts
+from phonebooker.journal import COMPACT_AFTER, EditJournal
+from phonebooker.phones import normalize_phone
+from phonebooker.vcard import convert_xml_to_vcf, convert_vcf_to_xml, iter_vcf_contacts, write_vcards
+from phonebooker.search import SIMILARITY_THRESHOLD, TrigramIndex, score_names
 
 class ThemeManager:
     """Enhanced theme management for modern, sleek styling"""
@@ -169,6 +66,12 @@ class ThemeManager:
                 'dark_gray': "#212529"
             }
 
+    @staticmethod
+    @functools.lru_cache(maxsize=None)
+    def stylesheet(is_dark_mode=False):
+        """get_stylesheet() for the dark or light theme, generated once per theme."""
+        return ThemeManager.get_stylesheet(ThemeManager.get_theme(is_dark_mode))
+
     @staticmethod
     def get_stylesheet(colors):
         return f"""
@@ -228,7 +131,7 @@ class ThemeManager:
             }}
             
             /* Table Widget */
-            QTableWidget {{
+            QTableView {{
                 background-color: {colors['secondary_bg']};
                 border: 1px solid {colors['border_color']};
                 border-radius: 10px;
@@ -236,12 +139,12 @@ class ThemeManager:
                 gridline-color: {colors['border_color']};
             }}
             
-            QTableWidget::item {{
+            QTableView::item {{
                 padding: 8px;
                 border-radius: 4px;
             }}
             
-            QTableWidget::item:selected {{
+            QTableView::item:selected {{
                 background-color: {colors['accent_color']};
                 color: {colors['white']};
             }}
@@ -358,35 +261,443 @@ class ModernButton(QPushButton):
         self.setCursor(Qt.CursorShape.PointingHandCursor)
         self.setFont(QFont("Arial", 12, QFont.Weight.Bold))
 
-class Contact:
-    def __init__(self, first_name, last_name, phone_type, phone_number, groups, company=""):
-        self.first_name = first_name
-        self.last_name = last_name
-        self.phone_type = phone_type
-        self.phone_number = phone_number
-        self.groups = groups
-        self.company = company
+# Contact fields searched for each entry of the search type dropdown
+SEARCH_TYPE_FIELDS = {
+    "All Fields": ("first_name", "last_name", "phone_type", "phone_number", "groups", "company"),
+    "Phone Only": ("phone_number",),
+    "Company Only": ("company",),
+    "Groups Only": ("groups",),
+}
+
+# Contacts added to the table per turn of the event loop after a background load or import
+APPLY_CHUNK_SIZE = 20000
+
+# Groups of duplicates listed when asking whether to merge them
+MERGE_PREVIEW_LIMIT = 10
+
+# Set PHONEBOOKER_JOURNAL=1 to save edits to a phonebook's journal instead of rewriting it every time
+JOURNAL_SAVES = os.environ.get("PHONEBOOKER_JOURNAL", "") == "1"
+
+class ContactTableModel(QAbstractTableModel):
+    """Table model over the app's ContactStore; cells are rendered on demand by the view.
+
+    A search filter is applied here rather than by hiding view rows, so the
+    view only ever knows about the contacts that are actually shown.
+    """
+
+    HEADERS = ["First Name", "Last Name", "Phone Type", "Phone Number", "Groups", "Company"]
+
+    def __init__(self, store, parent=None):
+        super().__init__(parent)
+        self.store = store
+        self.matches = None  # contact ids passing the search filter, None shows everything
+        self.rows = None  # contacts shown while filtering, in store order
+        self.row_keys = None  # store sort keys of self.rows, for binary search
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self.store) if self.rows is None else len(self.rows)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.HEADERS)
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if role == Qt.ItemDataRole.DisplayRole and index.isValid():
+            return self.cell_text(index.row(), index.column())
+        return None
+
+    def headerData(self, section, orientation, role=Qt.ItemDataRole.DisplayRole):
+        if role == Qt.ItemDataRole.DisplayRole and orientation == Qt.Orientation.Horizontal:
+            return self.HEADERS[section]
+        return None
+
+    def contact_at(self, row):
+        return self.store[row] if self.rows is None else self.rows[row]
+
+    def cell_text(self, row, column):
+        contact = self.contact_at(row)
+        if column == 0:
+            return contact.first_name
+        elif column == 1:
+            return contact.last_name
+        elif column == 2:
+            return contact.phone_type
+        elif column == 3:
+            return contact.phone_number
+        elif column == 4:
+            return ", ".join(contact.groups)
+        elif column == 5:
+            return contact.company
+        return ""
+
+    def reset(self):
+        """Show the whole store again after a bulk change to it."""
+        self.set_filter(None)
+
+    def set_filter(self, matches):
+        """Show only contacts whose id is in matches, or everything when matches is None."""
+        self.beginResetModel()
+        self.matches = matches
+        if matches is None:
+            self.rows = self.row_keys = None
+        else:
+            self.rows = []
+            self.row_keys = []
+            for key, contact in self.store.items():
+                if contact.contact_id in matches:
+                    self.row_keys.append(key)
+                    self.rows.append(contact)
+        self.endResetModel()
+
+    def _insert_filtered_row(self, contact):
+        key = self.store.key_of(contact.contact_id)
+        row = bisect.bisect_left(self.row_keys, key)
+        self.beginInsertRows(QModelIndex(), row, row)
+        self.row_keys.insert(row, key)
+        self.rows.insert(row, contact)
+        self.endInsertRows()
+
+    def add_matches(self, contacts):
+        """Reveal more contacts under the current filter as streamed search results arrive."""
+        if self.matches is None:
+            return
+        # Skip repeats and contacts deleted or edited while the search was running
+        new_rows = [contact for contact in contacts
+                    if contact.contact_id not in self.matches and contact in self.store]
+        if not new_rows:
+            return
+        self.matches.update(contact.contact_id for contact in new_rows)
+
+        # Results arrive in store order, so they normally extend the visible rows
+        keys = [self.store.key_of(contact.contact_id) for contact in new_rows]
+        if keys == sorted(keys) and (not self.row_keys or keys[0] > self.row_keys[-1]):
+            first = len(self.rows)
+            self.beginInsertRows(QModelIndex(), first, first + len(new_rows) - 1)
+            self.row_keys.extend(keys)
+            self.rows.extend(new_rows)
+            self.endInsertRows()
+            return
+
+        for contact in new_rows:
+            self._insert_filtered_row(contact)
+
+    def merge_items(self, items):
+        """Add a sorted chunk of (sort key, contact) pairs, e.g. from a store filled in the background."""
+        if self.rows is None and self.store.would_append(items):
+            first = len(self.store)
+            self.beginInsertRows(QModelIndex(), first, first + len(items) - 1)
+            self.store.merge_items(items)
+            self.endInsertRows()
+        else:
+            self.store.merge_items(items)
+            self.set_filter(self.matches)
+
+    def insert_contact(self, contact):
+        if self.rows is None:
+            row = self.store.insertion_index(contact)
+            self.beginInsertRows(QModelIndex(), row, row)
+            self.store.add(contact)
+            self.endInsertRows()
+        else:
+            # Newly added contacts stay visible even if they don't match the search
+            self.store.add(contact)
+            self.matches.add(contact.contact_id)
+            self._insert_filtered_row(contact)
+
+    def update_contact(self, contact_id, updated_contact):
+        contact = self.store.get(contact_id)
+        if contact_sort_key(updated_contact) != contact_sort_key(contact):
+            # The name changed, so the contact has to move to keep the list sorted
+            self.remove_contact(contact_id)
+            updated_contact.contact_id = contact_id
+            self.insert_contact(updated_contact)
+            return
+
+        row = self.store.replace(contact_id, updated_contact)
+        if self.rows is not None:
+            row = bisect.bisect_left(self.row_keys, self.store.key_of(contact_id))
+            self.rows[row] = updated_contact
+        self.dataChanged.emit(self.index(row, 0), self.index(row, self.columnCount() - 1))
+
+    def remove_contact(self, contact_id):
+        if self.rows is None:
+            row = self.store.index_of(contact_id)
+            self.beginRemoveRows(QModelIndex(), row, row)
+            self.store.remove(contact_id)
+            self.endRemoveRows()
+            return
+
+        key = self.store.key_of(contact_id)
+        row = bisect.bisect_left(self.row_keys, key)
+        self.matches.discard(contact_id)
+        if row < len(self.row_keys) and self.row_keys[row] == key:
+            self.beginRemoveRows(QModelIndex(), row, row)
+            del self.row_keys[row]
+            del self.rows[row]
+            self.store.remove(contact_id)
+            self.endRemoveRows()
+        else:
+            # Hidden by the filter
+            self.store.remove(contact_id)
+
+class DatabaseTableModel(ContactTableModel):
+    """Table model paging contacts out of a ContactDatabase on demand.
+
+    Only the pages the view has asked for are kept, up to CACHED_PAGES of
+    them. A page following one already loaded is found through the sort
+    index rather than by skipping rows. Edits go straight to the database,
+    after which the cached pages are dropped.
+    """
+
+    CACHED_PAGES = 200
+
+    def __init__(self, database, parent=None):
+        # Imported once a database is opened: it loads sqlite3, which startup can do without
+        from phonebooker.database import MATCH_ALL, PAGE_SIZE
+
+        super().__init__(ContactStore(), parent)
+        self.database = database
+        self.match_all = MATCH_ALL
+        self.page_size = PAGE_SIZE
+        self.search = MATCH_ALL
+        self._count = None
+        self._pages = {}
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        if self._count is None:
+            self._count = self.database.count(self.search)
+        return self._count
+
+    def contact_at(self, row):
+        page_number, offset = divmod(row, self.page_size)
+        page = self._pages.get(page_number)
+        if page is None:
+            if len(self._pages) >= self.CACHED_PAGES:
+                self._pages.clear()
+            previous = self._pages.get(page_number - 1)
+            after = self.database.sort_key(previous[-1]) if previous else None
+            page = self.database.contacts(self.search, page_number * self.page_size, self.page_size, after)
+            self._pages[page_number] = page
+        return page[offset]
 
-    @classmethod
-    def from_csv_row(cls, name, phone_number):
-        first_name, last_name = parse_complex_name(name)
-        phone_type = get_phone_type(phone_number)
-        phone_number = format_phone_number(phone_number)
-        return cls(first_name, last_name, phone_type, phone_number, ["Work"], "")
+    def refresh(self):
+        self.beginResetModel()
+        self._count = None
+        self._pages.clear()
+        self.endResetModel()
+
+    def reset(self):
+        self.set_filter(self.match_all)
+
+    def set_filter(self, search):
+        """Show the contacts matching search, a ContactFilter from ContactDatabase.search."""
+        self.search = self.match_all if search is None else search
+        self.refresh()
+
+    def insert_contact(self, contact):
+        self.database.add(contact)
+        self.refresh()
+
+    def update_contact(self, contact_id, updated_contact):
+        self.database.replace(contact_id, updated_contact)
+        self.refresh()
+
+    def remove_contact(self, contact_id):
+        self.database.remove(contact_id)
+        self.refresh()
+
+class NameSearchWorker(QObject):
+    """Runs the fuzzy "Name Only" search off the GUI thread.
+
+    Contacts are scored in batches, in list order, and each batch of matches
+    is emitted as soon as it is ready. Starting a new search or calling
+    cancel() bumps the generation so stale batches are dropped. Large
+    phonebooks are scored in a process pool, small ones on a thread.
+    """
+
+    matches_found = pyqtSignal(int, list)
+    search_finished = pyqtSignal(int)
+
+    BATCH_SIZE = 2000
+    PROCESS_POOL_THRESHOLD = 50000
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.generation = 0
+        # Threads and processes are started by the first search, not at launch
+        self._dispatcher = None
+        self._process_pool = None
+        # Futures of the searches not yet finished, and of the batches the latest one has in the pool
+        self._searches = []
+        self._batches = []
+
+    def start(self, contacts, query, case_sensitive, exact_match):
+        if self._dispatcher is None:
+            from concurrent.futures import ThreadPoolExecutor
+            self._dispatcher = ThreadPoolExecutor(max_workers=1, thread_name_prefix="name-search")
+        self.generation += 1
+        self._searches = [search for search in self._searches if not search.done()]
+        # Copy so later edits to the contact list can't affect this search
+        self._searches.append(self._dispatcher.submit(
+            self._run, self.generation, list(contacts), query, case_sensitive, exact_match))
+        return self.generation
+
+    def cancel(self):
+        self.generation += 1
+
+    def shutdown(self):
+        self.cancel()
+        # Cancelled here rather than with shutdown(cancel_futures=True), which needs Python 3.9
+        for future in self._searches + self._batches:
+            future.cancel()
+        if self._dispatcher is not None:
+            self._dispatcher.shutdown(wait=False)
+        if self._process_pool is not None:
+            self._process_pool.shutdown(wait=False)
+
+    def _run(self, generation, contacts, query, case_sensitive, exact_match):
+        with trace.span("name_search", contacts=len(contacts)) as span:
+            batches = [contacts[i:i + self.BATCH_SIZE] for i in range(0, len(contacts), self.BATCH_SIZE)]
+            if len(contacts) >= self.PROCESS_POOL_THRESHOLD and not exact_match:
+                results = self._score_in_processes(generation, batches, query, case_sensitive, exact_match)
+            else:
+                results = (self._score(batch, query, case_sensitive, exact_match) for batch in batches)
+
+            matches = 0
+            # Closing the results on a stale generation cancels the batches still queued for the pool
+            with closing(results):
+                for batch, positions in zip(batches, results):
+                    if generation != self.generation:
+                        span.set(cancelled=True)
+                        return
+                    if not exact_match:
+                        trace.count("fuzzy_comparisons", len(batch))
+                    if positions:
+                        matches += len(positions)
+                        self.matches_found.emit(generation, [batch[i] for i in positions])
+            span.set(matches=matches)
+            if generation == self.generation:
+                self.search_finished.emit(generation)
+
+    @staticmethod
+    def _names(batch):
+        return [f"{contact.first_name} {contact.last_name}" for contact in batch]
+
+    def _score(self, batch, query, case_sensitive, exact_match):
+        return score_names(query, self._names(batch), case_sensitive, exact_match, SIMILARITY_THRESHOLD)
+
+    def _score_in_processes(self, generation, batches, query, case_sensitive, exact_match):
+        """Yield positions per batch in order, keeping a bounded number of batches in flight."""
+        if self._process_pool is None:
+            from concurrent.futures import ProcessPoolExecutor
+            self._process_pool = ProcessPoolExecutor()
+        window = 2 * (os.cpu_count() or 1)
+        pending = self._batches = []
+        next_batch = 0
+        try:
+            while next_batch < len(batches) or pending:
+                while next_batch < len(batches) and len(pending) < window:
+                    pending.append(self._process_pool.submit(
+                        score_names, query, self._names(batches[next_batch]),
+                        case_sensitive, exact_match, SIMILARITY_THRESHOLD))
+                    next_batch += 1
+                future = pending.pop(0)
+                if generation != self.generation:
+                    return
+                yield future.result()
+        finally:
+            # Also reached when the caller closes the generator after a newer search started
+            for stale in pending:
+                stale.cancel()
+
+class TaskRunner(QObject):
+    """Runs one file load, save or import at a time on a worker thread.
+
+    The task is called with a progress callback taking (done, total). Once
+    cancel() has been called the callback raises OperationCancelled, which is
+    how a running task notices it should stop. Progress, results and errors
+    come back to the GUI thread as signals tagged with the generation of the
+    task, so anything from an abandoned task is dropped.
+    """
+
+    # Floats rather than ints: byte counts of large files overflow a C int
+    progress_changed = pyqtSignal(int, float, float)
+    task_finished = pyqtSignal(int, object)
+    task_failed = pyqtSignal(int, str)
+
+    # Seconds between progress signals, so a fast task doesn't flood the event loop
+    PROGRESS_INTERVAL = 0.05
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.generation = 0
+        self._executor = None
+        self._tasks = []  # futures of the tasks not yet finished
+
+    def start(self, task):
+        if self._executor is None:
+            from concurrent.futures import ThreadPoolExecutor
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="file-task")
+        self.generation += 1
+        self._tasks = [future for future in self._tasks if not future.done()]
+        self._tasks.append(self._executor.submit(self._run, self.generation, task))
+        return self.generation
+
+    def cancel(self):
+        self.generation += 1
+
+    def shutdown(self):
+        self.cancel()
+        # Cancelled here rather than with shutdown(cancel_futures=True), which needs Python 3.9
+        for future in self._tasks:
+            future.cancel()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+
+    def _run(self, generation, task):
+        last_report = 0.0
+
+        def progress(done, total):
+            nonlocal last_report
+            if generation != self.generation:
+                raise OperationCancelled()
+            now = time.monotonic()
+            if now - last_report >= self.PROGRESS_INTERVAL or done >= total:
+                last_report = now
+                self.progress_changed.emit(generation, done, total)
+
+        try:
+            result = task(progress)
+        except OperationCancelled:
+            return
+        except Exception as e:
+            self.task_failed.emit(generation, str(e))
+        else:
+            self.task_finished.emit(generation, result)
 
 class ContactDialog(QDialog):
+    """Form for adding or editing a contact.
+
+    Meant to be created once and reused: set_contact() fills in or clears
+    the form before each exec(), so the widgets and stylesheet are only
+    built the first time.
+    """
+
     def __init__(self, groups, phone_types, parent=None):
         super().__init__(parent)
         self.setWindowTitle("Contact Details")
-        self.groups = groups
+        self.groups = []
         self.phone_types = phone_types
         self.setup_ui()
+        self.set_groups(groups)
         
         # Apply theme
         app = QApplication.instance()
         is_dark = app.palette().color(QPalette.ColorRole.Window).lightness() < 128
-        colors = ThemeManager.get_theme(is_dark)
-        self.setStyleSheet(ThemeManager.get_stylesheet(colors))
+        self.setStyleSheet(ThemeManager.stylesheet(is_dark))
 
     def setup_ui(self):
         layout = QFormLayout(self)
@@ -405,19 +716,43 @@ class ContactDialog(QDialog):
         layout.addRow("Company:", self.company)
         
         self.group_checkboxes = []
-        group_layout = QVBoxLayout()
-        for group in self.groups:
-            checkbox = QCheckBox(group)
-            self.group_checkboxes.append(checkbox)
-            group_layout.addWidget(checkbox)
-        
-        layout.addRow("Groups:", group_layout)
+        self.group_layout = QVBoxLayout()
+        layout.addRow("Groups:", self.group_layout)
         
         button_box = QDialogButtonBox(QDialogButtonBox.StandardButton.Ok | QDialogButtonBox.StandardButton.Cancel)
         button_box.accepted.connect(self.accept)
         button_box.rejected.connect(self.reject)
         layout.addWidget(button_box)
 
+    def set_groups(self, groups):
+        """Show a checkbox per group, rebuilding the checkboxes only if the groups changed."""
+        groups = list(groups)
+        if groups == self.groups:
+            return
+        for checkbox in self.group_checkboxes:
+            self.group_layout.removeWidget(checkbox)
+            checkbox.deleteLater()
+        self.groups = groups
+        self.group_checkboxes = []
+        for group in groups:
+            checkbox = QCheckBox(group)
+            self.group_checkboxes.append(checkbox)
+            self.group_layout.addWidget(checkbox)
+
+    def set_contact(self, contact=None):
+        """Fill the form with contact's details, or clear it for a new contact."""
+        self.first_name.setText(contact.first_name if contact else "")
+        self.last_name.setText(contact.last_name if contact else "")
+        if contact:
+            self.phone_type.setCurrentText(contact.phone_type)
+        else:
+            self.phone_type.setCurrentIndex(0)
+        self.phone_number.setText(contact.phone_number if contact else "")
+        self.company.setText(contact.company if contact else "")
+        for cb in self.group_checkboxes:
+            cb.setChecked(contact is not None and contact.in_group(cb.text()))
+        self.first_name.setFocus()
+
     def apply_styles(self):
         self.setStyleSheet("""
             QDialog {
@@ -462,26 +797,46 @@ class PhonebookApp(QMainWindow):
         self.setGeometry(100, 100, 1000, 800)
         
         # Initialize core attributes
-        self.contacts = []
-        self.groups = ["Blocklist", "Allowlist", "Work", "Friends", "Family", "Blacklist", "Whitelist"]
+        self.contacts = ContactStore()
+        # The loaded phonebook's groups and their ids, which saving it keeps
+        self.group_registry = GroupRegistry.from_names(DEFAULT_GROUPS)
         self.phone_types = ["Home", "Work", "Mobile"]
+        self.search_index = TrigramIndex()
+        self.phone_index = PhoneIndex()
+        self.name_search = NameSearchWorker(self)
+        self.name_search.matches_found.connect(self.show_name_matches)
+        self.task_runner = TaskRunner(self)
+        self.task_runner.progress_changed.connect(self.show_task_progress)
+        self.task_runner.task_finished.connect(self.finish_task)
+        self.task_runner.task_failed.connect(self.fail_task)
+        self.task = None  # (generation, on_finished, error message) of the running file task
+        self.saved = None  # (filename, contacts revision) as of the last load or save
+        self.journal_entries = []  # edits since then, or None once there are changes the journal can't hold
+        self.database = None  # the open ContactDatabase when editing a .db phonebook
+        self._contact_dialog = None  # created on first use, see contact_dialog()
         
         # Detect system theme
         self.is_dark_mode = self.is_system_dark_mode()
         self.colors = ThemeManager.get_theme(self.is_dark_mode)
-        self.setStyleSheet(ThemeManager.get_stylesheet(self.colors))
+        self.setStyleSheet(ThemeManager.stylesheet(self.is_dark_mode))
         
         self.central_widget = QStackedWidget()
         self.setCentralWidget(self.central_widget)
+        # Views are built the first time they are shown
+        self.views = {}
         
-        self.setup_startup_menu()
-        self.setup_edit_view()
-        self.setup_convert_view()
-        
-        # Handle initial file
+        # Handle initial file: opening a phonebook goes straight to the edit view
         if len(sys.argv) > 1 and os.path.isfile(sys.argv[1]):
             self.show_edit_view()
             self.load_phonebook(sys.argv[1])
+        else:
+            self.show_startup_menu()
+
+    def closeEvent(self, event):
+        self.name_search.shutdown()
+        self.task_runner.shutdown()
+        self.close_database()
+        super().closeEvent(event)
 
     def is_system_dark_mode(self):
         app = QApplication.instance()
@@ -516,7 +871,7 @@ class PhonebookApp(QMainWindow):
                 color: {text_color};
             }}
             
-            QTableWidget {{
+            QTableView {{
                 background-color: {secondary_bg};
                 border: 1px solid {border_color};
                 border-radius: 8px;
@@ -524,7 +879,7 @@ class PhonebookApp(QMainWindow):
                 color: {text_color};
             }}
             
-            QTableWidget::item {{
+            QTableView::item {{
                 padding: 5px;
             }}
             
@@ -661,7 +1016,7 @@ class PhonebookApp(QMainWindow):
         layout.addWidget(quit_button, alignment=Qt.AlignmentFlag.AlignCenter)
         
         startup_widget.setLayout(layout)
-        self.central_widget.addWidget(startup_widget)
+        return startup_widget
 
     def setup_edit_view(self):
         edit_widget = QWidget()
@@ -732,28 +1087,44 @@ class PhonebookApp(QMainWindow):
         table_layout.addWidget(contacts_title)
         
         # Enhanced table widget
-        self.contacts_table = QTableWidget()
-        self.contacts_table.setColumnCount(6)
-        self.contacts_table.setHorizontalHeaderLabels([
-            "First Name", "Last Name", "Phone Type", 
-            "Phone Number", "Groups", "Company"
-        ])
+        self.contacts_model = ContactTableModel(self.contacts, self)
+        self.contacts_table = QTableView()
+        self.contacts_table.setModel(self.contacts_model)
         
         # Set table properties
-        self.contacts_table.setSelectionBehavior(QTableWidget.SelectionBehavior.SelectRows)
-        self.contacts_table.setSelectionMode(QTableWidget.SelectionMode.SingleSelection)
+        self.contacts_table.setSelectionBehavior(QTableView.SelectionBehavior.SelectRows)
+        self.contacts_table.setSelectionMode(QTableView.SelectionMode.SingleSelection)
         self.contacts_table.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeMode.Stretch)
-        self.contacts_table.setEditTriggers(QTableWidget.EditTrigger.NoEditTriggers)
+        self.contacts_table.setEditTriggers(QTableView.EditTrigger.NoEditTriggers)
         self.contacts_table.setAlternatingRowColors(True)
         self.contacts_table.verticalHeader().setVisible(False)
+        # Fixed row heights keep the view from measuring every row of large phonebooks
+        self.contacts_table.verticalHeader().setSectionResizeMode(QHeaderView.ResizeMode.Fixed)
         self.contacts_table.setShowGrid(True)
-        self.contacts_table.itemDoubleClicked.connect(self.edit_contact)
+        self.contacts_table.doubleClicked.connect(self.edit_contact)
         
         table_layout.addWidget(self.contacts_table)
         
         # Add table section to main layout
         main_layout.addWidget(table_section)
         
+        # Progress of background loads, saves and imports, hidden while idle
+        self.task_panel = QWidget()
+        task_layout = QHBoxLayout(self.task_panel)
+        task_layout.setSpacing(10)
+        self.task_label = QLabel()
+        self.task_progress = QProgressBar()
+        self.task_progress.setRange(0, 1000)
+        self.task_progress.setTextVisible(False)
+        self.task_cancel_button = QPushButton("Cancel")
+        self.task_cancel_button.setMinimumHeight(40)
+        self.task_cancel_button.clicked.connect(self.cancel_task)
+        task_layout.addWidget(self.task_label)
+        task_layout.addWidget(self.task_progress, stretch=1)
+        task_layout.addWidget(self.task_cancel_button)
+        self.task_panel.setVisible(False)
+        main_layout.addWidget(self.task_panel)
+        
         # Action Buttons Section
         button_container = QWidget()
         button_layout = QHBoxLayout(button_container)
@@ -766,21 +1137,27 @@ class PhonebookApp(QMainWindow):
             ("Save", self.save_phonebook),
             ("Load", lambda: self.load_phonebook()),
             ("Import CSV", self.import_csv),
+            ("Find Duplicates", self.find_duplicate_contacts),
+            ("Merge Phonebooks", self.merge_phonebooks),
             ("Back to Menu", self.show_startup_menu)
         ]
         
+        # Buttons that change or replace the contact list are disabled while a file task runs
+        self.contact_action_buttons = []
         for text, callback in buttons:
             btn = QPushButton(text)
             btn.setMinimumWidth(120)
             btn.setMinimumHeight(40)
             btn.clicked.connect(callback)
             button_layout.addWidget(btn)
+            if text != "Back to Menu":
+                self.contact_action_buttons.append(btn)
         
         # Add button container to main layout
         main_layout.addWidget(button_container)
         
         edit_widget.setLayout(main_layout)
-        self.central_widget.addWidget(edit_widget)
+        return edit_widget
 
     def setup_convert_view(self):
         convert_widget = QWidget()
@@ -809,46 +1186,82 @@ class PhonebookApp(QMainWindow):
         layout.addWidget(back_button, alignment=Qt.AlignmentFlag.AlignCenter)
         
         convert_widget.setLayout(layout)
-        self.central_widget.addWidget(convert_widget)
+        return convert_widget
+
+    def show_view(self, name, setup):
+        """Show the view called name, building it with setup() the first time."""
+        view = self.views.get(name)
+        if view is None:
+            view = self.views[name] = setup()
+            self.central_widget.addWidget(view)
+        self.central_widget.setCurrentWidget(view)
 
     def show_startup_menu(self):
-        self.central_widget.setCurrentIndex(0)
+        self.show_view("startup", self.setup_startup_menu)
 
     def show_edit_view(self):
-        self.central_widget.setCurrentIndex(1)
+        self.show_view("edit", self.setup_edit_view)
 
     def show_convert_view(self):
-        self.central_widget.setCurrentIndex(2)
+        self.show_view("convert", self.setup_convert_view)
+
+    def contact_dialog(self, contact=None):
+        """The reusable contact dialog, filled with contact, or cleared when adding one."""
+        if self._contact_dialog is None:
+            self._contact_dialog = ContactDialog(list(self.group_registry), self.phone_types, self)
+        self._contact_dialog.set_groups(self.group_registry)
+        self._contact_dialog.set_contact(contact)
+        return self._contact_dialog
 
     def add_contact(self):
-        dialog = ContactDialog(self.groups, self.phone_types, self)
+        dialog = self.contact_dialog()
         if dialog.exec():
             new_contact = dialog.get_contact()
-            self.contacts.append(new_contact)
-            self.refresh_contacts_table()
+            self.contacts_model.insert_contact(new_contact)
+            self.search_index.add(new_contact)
+            self.phone_index.add(new_contact)
+            self.record_edit(journal.added(new_contact))
 
-    def edit_contact(self, item):
-        row = item.row()
-        contact = self.contacts[row]
-        dialog = ContactDialog(self.groups, self.phone_types, self)
-        dialog.first_name.setText(contact.first_name)
-        dialog.last_name.setText(contact.last_name)
-        dialog.phone_type.setCurrentText(contact.phone_type)
-        dialog.phone_number.setText(contact.phone_number)
-        dialog.company.setText(contact.company)
-        for cb in dialog.group_checkboxes:
-            cb.setChecked(cb.text() in contact.groups)
-        
+    def edit_contact(self, index):
+        if self.task is not None:
+            return
+        contact = self.contacts_model.contact_at(index.row())
+        dialog = self.contact_dialog(contact)
         if dialog.exec():
             updated_contact = dialog.get_contact()
-            self.contacts[row] = updated_contact
-            self.refresh_contacts_table()
+            self.contacts_model.update_contact(contact.contact_id, updated_contact)
+            self.search_index.replace(contact, updated_contact)
+            self.phone_index.replace(contact, updated_contact)
+            self.record_edit(journal.edited(contact, updated_contact))
 
     def delete_contact(self):
-        current_row = self.contacts_table.currentRow()
+        current_row = self.contacts_table.currentIndex().row()
         if current_row > -1:
-            del self.contacts[current_row]
-            self.refresh_contacts_table()
+            contact = self.contacts_model.contact_at(current_row)
+            self.search_index.remove(contact)
+            self.phone_index.remove(contact)
+            self.contacts_model.remove_contact(contact.contact_id)
+            self.record_edit(journal.deleted(contact))
+
+    def record_edit(self, entry):
+        if self.journal_entries is not None:
+            self.journal_entries.append(entry)
+
+    def mark_saved(self, filename, revision):
+        self.saved = (filename, revision)
+        self.journal_entries = []
+
+    def journal_edits(self, filename):
+        """Edits to append to filename's journal instead of saving it in full, or None for a full save."""
+        if not JOURNAL_SAVES or self.journal_entries is None or self.saved is None or self.saved[0] != filename:
+            return None
+        edit_journal = EditJournal(filename)
+        if os.path.exists(edit_journal.path) and not edit_journal.is_current():
+            return None
+        if len(edit_journal) + len(self.journal_entries) > COMPACT_AFTER:
+            # Compact: the full save below takes in the journal and removes it
+            return None
+        return list(self.journal_entries)
 
     def filter_contacts(self):
         search_text = self.search_bar.text()
@@ -856,238 +1269,403 @@ class PhonebookApp(QMainWindow):
         case_sensitive = self.case_sensitive.isChecked()
         exact_match = self.exact_match.isChecked()
         
-        if not case_sensitive:
-            search_text = search_text.lower()
-        
-        # Minimum similarity ratio for fuzzy matching
-        SIMILARITY_THRESHOLD = 75  # Adjust this value to make matching more/less strict
-        
-        for row in range(self.contacts_table.rowCount()):
-            show = False
+        with trace.span("filter_contacts", search_type=search_type):
+            # Any search still running for an earlier query is now stale
+            self.name_search.cancel()
             
-            if search_type == "All Fields":
-                fields_to_search = range(self.contacts_table.columnCount())
-            elif search_type == "Name Only":
-                fields_to_search = [0, 1]  # First Name and Last Name columns
-            elif search_type == "Phone Only":
-                fields_to_search = [3]  # Phone Number column
-            elif search_type == "Company Only":
-                fields_to_search = [5]  # Company column
-            elif search_type == "Groups Only":
-                fields_to_search = [4]  # Groups column
+            # An empty search shows every contact
+            if not search_text:
+                self.contacts_model.set_filter(None)
+                return
+
+            if self.database is not None:
+                # Databases answer every search type from their full-text index, by substring
+                fields = ("first_name", "last_name") if search_type == "Name Only" else SEARCH_TYPE_FIELDS[search_type]
+                self.contacts_model.set_filter(self.database.search(search_text, fields, case_sensitive, exact_match))
+                return
+            
+            if not case_sensitive:
+                search_text = search_text.lower()
             
-            # Special handling for name search with fuzzy matching
             if search_type == "Name Only":
-                full_name = f"{self.contacts_table.item(row, 0).text()} {self.contacts_table.item(row, 1).text()}"
-                if not case_sensitive:
-                    full_name = full_name.lower()
-                
-                if exact_match:
-                    show = full_name == search_text
-                else:
-                    # Use token_set_ratio for better partial matching
-                    ratio = fuzz.token_set_ratio(search_text, full_name)
-                    show = ratio >= SIMILARITY_THRESHOLD
-            else:
-                for col in fields_to_search:
-                    item = self.contacts_table.item(row, col)
-                    if item:
-                        text = item.text()
-                        if not case_sensitive:
-                            text = text.lower()
-                        
-                        if exact_match:
-                            if text == search_text:
-                                show = True
-                                break
-                        else:
-                            # Use different fuzzy matching strategies depending on field type
-                            if col == 3:  # Phone number
-                                # For phone numbers, use simpler partial matching
-                                show = search_text in text
-                            else:
-                                # For other fields, use token_set_ratio
-                                ratio = fuzz.token_set_ratio(search_text, text)
-                                if ratio >= SIMILARITY_THRESHOLD:
-                                    show = True
-                                    break
+                # Fuzzy name scoring runs in the background; matches stream into the table
+                self.contacts_model.set_filter(set())
+                self.name_search.start(self.contacts, search_text, case_sensitive, exact_match)
+                return
             
-            self.contacts_table.setRowHidden(row, not show)
+            # The index scores each distinct field value once rather than every contact
+            matches = self.search_index.search(search_text, SEARCH_TYPE_FIELDS[search_type],
+                                               case_sensitive=case_sensitive, exact_match=exact_match)
+            self.contacts_model.set_filter(matches)
+
+    def show_name_matches(self, generation, contacts):
+        if generation == self.name_search.generation:
+            self.contacts_model.add_matches(contacts)
 
     def refresh_contacts_table(self):
-        self.contacts.sort(key=lambda x: (x.last_name.lower() if x.last_name else '', x.first_name.lower() if x.first_name else ''))
-        self.contacts_table.setRowCount(0)
-        for contact in self.contacts:
-            row_position = self.contacts_table.rowCount()
-            self.contacts_table.insertRow(row_position)
-            self.contacts_table.setItem(row_position, 0, QTableWidgetItem(contact.first_name))
-            self.contacts_table.setItem(row_position, 1, QTableWidgetItem(contact.last_name))
-            self.contacts_table.setItem(row_position, 2, QTableWidgetItem(contact.phone_type))
-            self.contacts_table.setItem(row_position, 3, QTableWidgetItem(contact.phone_number))
-            self.contacts_table.setItem(row_position, 4, QTableWidgetItem(", ".join(contact.groups)))
-            self.contacts_table.setItem(row_position, 5, QTableWidgetItem(contact.company))
+        with trace.span("refresh_contacts_table", contacts=len(self.contacts)):
+            self.contacts_model.reset()
+            self.search_index.rebuild(self.contacts)
+            self.filter_contacts()
 
-    def save_phonebook(self):
+    def run_task(self, name, label, task, on_finished, error_message, **span_args):
+        """Run task(progress) on the task runner, then call on_finished(result) on the GUI thread.
+
+        The task is traced as a span called name with span_args.
+        """
+        def traced_task(progress):
+            with trace.span(name, **span_args):
+                return task(progress)
+
+        generation = self.task_runner.start(traced_task)
+        self.task = (generation, on_finished, error_message)
+        self.task_label.setText(label)
+        self.task_progress.setValue(0)
+        self.task_cancel_button.setEnabled(True)
+        self.task_panel.setVisible(True)
+        for button in self.contact_action_buttons:
+            button.setEnabled(False)
+
+    def end_task(self):
+        self.task = None
+        self.task_panel.setVisible(False)
+        for button in self.contact_action_buttons:
+            button.setEnabled(True)
+
+    def is_current_task(self, generation):
+        return self.task is not None and self.task[0] == generation
+
+    def show_task_progress(self, generation, done, total):
+        if self.is_current_task(generation):
+            self.task_progress.setValue(int(1000 * done / total) if total else 1000)
+
+    def finish_task(self, generation, result):
+        if self.is_current_task(generation):
+            on_finished = self.task[1]
+            # Results are applied on the GUI thread and can't be abandoned half way
+            self.task_cancel_button.setEnabled(False)
+            on_finished(result)
+
+    def fail_task(self, generation, error):
+        if self.is_current_task(generation):
+            error_message = self.task[2]
+            self.end_task()
+            QMessageBox.critical(self, "Error", f"{error_message}:\n{error}")
+
+    def cancel_task(self):
+        self.task_runner.cancel()
+        self.end_task()
+        if self.database is not None:
+            # A cancelled import keeps the chunks it has committed
+            self.contacts_model.refresh()
+
+    def apply_contacts(self, store, on_done):
+        """Merge a store filled by a background task into the table in chunks.
+
+        Each chunk is applied in its own turn of the event loop so the window
+        keeps repainting while a large phonebook is added.
+        """
+        self.task_label.setText("Adding contacts...")
+        items = store.items()
+        total = len(store)
+        applied = 0
+        span = trace.span("apply_contacts", contacts=total)
+
+        def apply_chunk():
+            nonlocal applied
+            chunk = list(itertools.islice(items, APPLY_CHUNK_SIZE))
+            if not chunk:
+                span.end()
+                on_done()
+                return
+            self.contacts_model.merge_items(chunk)
+            applied += len(chunk)
+            self.task_progress.setValue(int(1000 * applied / total))
+            QTimer.singleShot(0, apply_chunk)
+
+        apply_chunk()
+
+    def ask_save_filename(self, title):
+        """A phonebook filename chosen to save to, given the extension of the selected format if it has none."""
         filename, selected_filter = QFileDialog.getSaveFileName(
-            self, "Save Phonebook", "", 
-            "XML Files (*.xml);;VCF Files (*.vcf)"
+            self, title, "", 
+            "XML Files (*.xml);;VCF Files (*.vcf);;Phonebook Databases (*.db)"
         )
+        if filename and not filename.endswith(('.xml', '.vcf')) and not is_database_file(filename):
+            if selected_filter == "XML Files (*.xml)":
+                filename += '.xml'
+            elif selected_filter == "Phonebook Databases (*.db)":
+                filename += '.db'
+            else:
+                filename += '.vcf'
+        return filename
+
+    def save_phonebook(self):
+        filename = self.ask_save_filename("Save Phonebook")
         if filename:
-            try:
-                print(f"Attempting to save to: {filename}")  # Debug print
-                print(f"Number of contacts to save: {len(self.contacts)}")  # Debug print
-                
-                if not filename.endswith(('.xml', '.vcf')):
-                    if selected_filter == "XML Files (*.xml)":
-                        filename += '.xml'
-                    else:
-                        filename += '.vcf'
-                
-                if filename.endswith('.xml'):
-                    print("Saving as XML")  # Debug print
-                    self.save_as_xml(filename)
-                elif filename.endswith('.vcf'):
-                    print("Saving as VCF")  # Debug print
-                    self.save_as_vcf(filename)
-                
-                # Verify file was created
-                if os.path.exists(filename):
-                    print(f"File successfully created at: {filename}")  # Debug print
-                    QMessageBox.information(self, "Success", f"Phonebook saved successfully to:\n{filename}")
-                else:
-                    print(f"File was not created at: {filename}")  # Debug print
-                    raise Exception("File was not created")
-                    
-            except Exception as e:
-                print(f"Error during save: {str(e)}")  # Debug print
-                QMessageBox.critical(self, "Error", f"Error saving phonebook:\n{str(e)}\nAttempted to save to: {filename}")
-
-    def save_as_xml(self, filename):
-        try:
-            root = ET.Element("AddressBook")
-            
-            # Save groups
-            for i, group in enumerate(self.groups, start=4):
-                pbgroup = ET.SubElement(root, "pbgroup")
-                ET.SubElement(pbgroup, "id").text = str(i)
-                ET.SubElement(pbgroup, "name").text = group
-            
-            # Save contacts
-            for contact in self.contacts:
-                contact_elem = ET.SubElement(root, "Contact")
-                ET.SubElement(contact_elem, "FirstName").text = contact.first_name
-                ET.SubElement(contact_elem, "LastName").text = contact.last_name
-                
-                phone = ET.SubElement(contact_elem, "Phone")
-                phone.set("type", contact.phone_type)
-                ET.SubElement(phone, "phonenumber").text = contact.phone_number
-                
-                for group in contact.groups:
-                    group_id = str(self.groups.index(group) + 4)
-                    ET.SubElement(contact_elem, "Group").text = group_id
-                
-                ET.SubElement(contact_elem, "Company").text = contact.company
-            
-            # Create directories if they don't exist
-            os.makedirs(os.path.dirname(filename), exist_ok=True)
-            
-            # Write the file with explicit open
-            with open(filename, 'wb') as f:
-                tree = ET.ElementTree(root)
-                tree.write(f, encoding="UTF-8", xml_declaration=True)
-            
-            print(f"XML file written to: {filename}")  # Debug print
-            
-        except Exception as e:
-            print(f"Error in save_as_xml: {str(e)}")  # Debug print
-            raise
-
-    def save_as_vcf(self, filename):
-        with open(filename, 'w', encoding='utf-8') as vcf_file:
-            for contact in self.contacts:
-                vcf_file.write("BEGIN:VCARD\n")
-                vcf_file.write("VERSION:3.0\n")
-                vcf_file.write(f"N:{contact.last_name};{contact.first_name};;;\n")
-                vcf_file.write(f"FN:{contact.first_name} {contact.last_name}\n")
-                vcf_file.write(f"TEL;TYPE={contact.phone_type}:{contact.phone_number}\n")
-                if contact.company:
-                    vcf_file.write(f"ORG:{contact.company}\n")
-                if contact.groups:
-                    vcf_file.write(f"CATEGORIES:{','.join(contact.groups)}\n")
-                vcf_file.write("END:VCARD\n\n")
+            if self.database is not None and os.path.abspath(filename) == os.path.abspath(self.database.path):
+                QMessageBox.information(self, "Success", "Changes to a phonebook database are saved as you make them.")
+                return
+
+            revision = self.contacts.revision
+            if self.saved == (filename, revision) and os.path.exists(filename):
+                QMessageBox.information(self, "Success", f"No changes since the phonebook was saved to:\n{filename}")
+                return
+
+            edits = self.journal_edits(filename)
+            groups = self.group_registry.copy()
+            if edits is not None:
+                task = lambda progress: EditJournal(filename).append(edits)
+            elif self.database is not None:
+                from phonebooker.database import ContactDatabase
+
+                # Exported from a connection of the worker's own; edits are disabled meanwhile
+                database_path = self.database.path
+
+                def task(progress):
+                    with ContactDatabase(database_path) as database:
+                        return self.write_phonebook(filename, database, groups, progress)
+            else:
+                # Contacts are replaced rather than modified on edit, so a shallow copy is a stable snapshot
+                contacts = list(self.contacts)
+
+                def task(progress):
+                    count = self.write_phonebook(filename, contacts, groups, progress)
+                    # Everything the journal held is in the file now
+                    EditJournal(filename).discard()
+                    return count
+
+            def on_saved(count):
+                self.end_task()
+                if self.database is None:
+                    self.mark_saved(filename, revision)
+                QMessageBox.information(self, "Success", f"Phonebook saved successfully to:\n{filename}")
+
+            self.run_task("save_phonebook", f"Saving {os.path.basename(filename)}...", task, on_saved,
+                          f"Error saving phonebook to {filename}", file=os.path.basename(filename),
+                          journal_edits=None if edits is None else len(edits))
+
+    def write_phonebook(self, filename, contacts, groups, progress):
+        """Write contacts to filename in the format its extension names."""
+        if filename.endswith('.xml'):
+            return self.save_as_xml(filename, contacts, groups, progress)
+        if is_database_file(filename):
+            from phonebooker.database import write_database
+            return write_database(filename, contacts, progress, groups)
+        return self.save_as_vcf(filename, contacts, progress)
+
+    def save_as_xml(self, filename, contacts=None, groups=None, progress=None):
+        return write_xml_phonebook(filename, self.contacts if contacts is None else contacts,
+                                   self.group_registry.copy() if groups is None else groups, progress)
+
+    def save_as_vcf(self, filename, contacts=None, progress=None):
+        return write_vcards(filename, self.contacts if contacts is None else contacts, progress=progress)
 
     def load_phonebook(self, filename=None):
         if not filename:
-            filename, _ = QFileDialog.getOpenFileName(self, "Load Phonebook", "", "XML Files (*.xml)")
-        if filename:
-            try:
-                tree = ET.parse(filename)
-                root = tree.getroot()
-                
-                self.contacts = []
-                
-                for contact_elem in root.findall("Contact"):
-                    first_name = contact_elem.find("FirstName").text if contact_elem.find("FirstName") is not None else ""
-                    last_name = contact_elem.find("LastName").text if contact_elem.find("LastName") is not None else ""
-                    
-                    phone = contact_elem.find("Phone")
-                    phone_type = phone.get("type") if phone is not None else "Mobile"
-                    phone_number = phone.find("phonenumber").text if phone is not None and phone.find("phonenumber") is not None else ""
-                    
-                    groups = []
-                    for group_elem in contact_elem.findall("Group"):
-                        group_id = int(group_elem.text)
-                        if 4 <= group_id < len(self.groups) + 4:
-                            groups.append(self.groups[group_id - 4])
-                    
-                    company = contact_elem.find("Company").text if contact_elem.find("Company") is not None else ""
-                    
-                    contact = Contact(first_name, last_name, phone_type, phone_number, groups, company)
-                    self.contacts.append(contact)
-                
+            filename, _ = QFileDialog.getOpenFileName(
+                self, "Load Phonebook", "",
+                "Phonebooks (*.xml *.vcf *.db);;XML Files (*.xml);;VCF Files (*.vcf);;Phonebook Databases (*.db)")
+        if filename and is_database_file(filename):
+            self.open_database(filename)
+            QMessageBox.information(self, "Success", "Phonebook loaded successfully!")
+        elif filename:
+            groups = GroupRegistry.from_names(DEFAULT_GROUPS)
+            read_contacts = iter_vcf_contacts if filename.lower().endswith(".vcf") else iter_xml_contacts
+
+            def task(progress):
+                # Sorting and indexing happen here too, off the GUI thread. Reopening an unchanged
+                # phonebook reads its sidecar cache instead of parsing it again
+                with gc_paused():
+                    contacts = cached_contacts(filename, read_contacts, groups, progress)
+                    edit_journal = EditJournal(filename)
+                    if edit_journal.is_current():
+                        contacts = edit_journal.replay(contacts)
+                    store = ContactStore(contacts)
+                    # Journaled edits may use groups the file's table doesn't list yet
+                    groups.add_contact_groups(store)
+                    return store, PhoneIndex(store)
+
+            def on_loaded(result):
+                store, phone_index = result
+                self.close_database()
+                self.name_search.cancel()
+                self.contacts.clear()
+                self.contacts_model.reset()
+                self.search_index.rebuild(self.contacts)
+                self.phone_index = phone_index
+                self.group_registry = groups
+                self.apply_contacts(store, on_applied)
+
+            def on_applied():
+                self.end_task()
+                self.mark_saved(filename, self.contacts.revision)
                 self.refresh_contacts_table()
                 QMessageBox.information(self, "Success", "Phonebook loaded successfully!")
-            except Exception as e:
-                QMessageBox.critical(self, "Error", f"Error loading phonebook: {str(e)}")
+
+            self.run_task("load_phonebook", f"Loading {os.path.basename(filename)}...", task, on_loaded,
+                          "Error loading phonebook", file=os.path.basename(filename))
+
+    def open_database(self, filename):
+        """Switch the edit view to a phonebook database, whose contacts are paged in as they are shown."""
+        from phonebooker.database import ContactDatabase, DatabasePhoneIndex
+
+        self.close_database()
+        self.name_search.cancel()
+        self.database = ContactDatabase(filename)
+        self.group_registry = self.database.group_registry()
+        self.contacts.clear()
+        self.search_index.rebuild(self.contacts)
+        self.phone_index = DatabasePhoneIndex(self.database)
+        self.saved = None
+        self.journal_entries = None
+        self.contacts_model = DatabaseTableModel(self.database, self)
+        self.contacts_table.setModel(self.contacts_model)
+        self.filter_contacts()
+
+    def close_database(self):
+        """Go back to editing contacts in memory, if a database was open."""
+        if self.database is None:
+            return
+        self.database.close()
+        self.database = None
+        self.phone_index = PhoneIndex()
+        self.contacts_model = ContactTableModel(self.contacts, self)
+        self.contacts_table.setModel(self.contacts_model)
 
     def is_duplicate_contact(self, phone_number):
         """Check if a contact with the given phone number already exists."""
-        formatted_number = format_phone_number(phone_number)
-        return any(contact.phone_number == formatted_number for contact in self.contacts)
+        return normalize_phone(phone_number).key in self.phone_index
 
     def import_csv(self):
         filename, _ = QFileDialog.getOpenFileName(self, "Import CSV File", "", "CSV Files (*.csv)")
-        if filename:
-            try:
-                duplicates_count = 0
-                added_count = 0
-                
-                with open(filename, 'r', newline='', encoding='utf-8') as csvfile:
-                    csv_reader = csv.reader(csvfile)
-                    next(csv_reader)  # Skip the header row
-                    for row in csv_reader:
-                        if len(row) >= 4:  # Ensure the row has at least 4 columns
-                            name = row[3]  # Column D (index 3) contains the name
-                            phone_number = row[2]  # Column C (index 2) contains the phone number
-                            
-                            # Check for duplicate before adding
-                            if not self.is_duplicate_contact(phone_number):
-                                new_contact = Contact.from_csv_row(name, phone_number)
-                                self.contacts.append(new_contact)
-                                added_count += 1
-                            else:
-                                duplicates_count += 1
-                
-                self.refresh_contacts_table()
-                
-                # Show summary message
-                message = f"CSV import completed:\n\n" \
-                         f"• {added_count} contacts added\n" \
-                         f"• {duplicates_count} duplicates skipped"
-                QMessageBox.information(self, "Import Summary", message)
-                
-            except Exception as e:
-                QMessageBox.critical(self, "Error", f"An error occurred during CSV import: {str(e)}")
+        if not filename:
+            return
+        from phonebooker.importer import import_csv_into_database, read_csv_contacts
+
+        def on_applied(report):
+            self.end_task()
+            # An import is too big to journal; the next save writes the file in full
+            self.journal_entries = None
+            self.refresh_contacts_table()
+            
+            # Show summary message
+            QMessageBox.information(self, "Import Summary", f"CSV import completed:\n\n{report.summary()}")
+
+        if self.database is not None:
+            from phonebooker.database import ContactDatabase
+
+            database_path = self.database.path
+
+            def task(progress):
+                # Committed chunk by chunk on the worker's own connection; a cancelled import resumes next time
+                with ContactDatabase(database_path) as database:
+                    return import_csv_into_database(filename, database, progress)
+
+            def on_finished(report):
+                for group in CSV_IMPORT_GROUPS:
+                    self.group_registry.add(group)
+                on_applied(report)
+        else:
+            phone_index = self.phone_index
+
+            def task(progress):
+                # phone_index is only read here; contact edits are disabled while the task runs
+                new_contacts, report = read_csv_contacts(filename, phone_index, progress)
+                return ContactStore(new_contacts), report
+
+            def on_finished(result):
+                store, report = result
+                self.group_registry.add_contact_groups(store)
+                for contact in store:
+                    self.phone_index.add(contact)
+                self.apply_contacts(store, lambda: on_applied(report))
+
+        self.run_task("import_csv", f"Importing {os.path.basename(filename)}...", task, on_finished,
+                      "An error occurred during CSV import", file=os.path.basename(filename),
+                      database=self.database is not None)
+
+    def merge_phonebooks(self):
+        """Merge phonebooks chosen by the user into a new one, which is then loaded."""
+        sources, _ = QFileDialog.getOpenFileNames(
+            self, "Phonebooks to Merge", "",
+            "Phonebooks (*.xml *.vcf *.csv *.db);;XML Files (*.xml);;VCF Files (*.vcf);;CSV Files (*.csv);;"
+            "Phonebook Databases (*.db)")
+        if not sources:
+            return
+        output = self.ask_save_filename("Save Merged Phonebook")
+        if not output:
+            return
+        if self.database is not None and os.path.abspath(output) == os.path.abspath(self.database.path):
+            QMessageBox.information(self, "Merge Phonebooks", "Choose another file: this phonebook database is open.")
+            return
+        from phonebooker.merge import merge_phonebooks
+
+        def on_merged(report):
+            self.end_task()
+            QMessageBox.information(self, "Merge Summary", f"Phonebooks merged into {output}:\n\n{report.summary()}")
+            self.load_phonebook(output)
+
+        self.run_task("merge_phonebooks", f"Merging {len(sources)} phonebooks...",
+                      lambda progress: merge_phonebooks(sources, output, progress=progress), on_merged,
+                      "Error merging phonebooks", sources=len(sources))
+
+    def find_duplicate_contacts(self):
+        from phonebooker.dedup import find_duplicates
+
+        if self.database is not None:
+            from phonebooker.database import ContactDatabase
+
+            database_path = self.database.path
+
+            def task(progress):
+                with ContactDatabase(database_path) as database:
+                    return find_duplicates(database, progress=progress)
+        else:
+            contacts = self.contacts
+
+            def task(progress):
+                # The store is only read here; contact edits are disabled while the task runs
+                return find_duplicates(contacts, progress=progress)
+
+        def on_finished(suggestions):
+            self.end_task()
+            if not suggestions:
+                QMessageBox.information(self, "Find Duplicates", "No duplicate contacts found.")
+                return
+            self.merge_duplicates(suggestions)
+
+        self.run_task("find_duplicate_contacts", "Looking for duplicates...", task, on_finished,
+                      "An error occurred while looking for duplicates")
+
+    def merge_duplicates(self, suggestions):
+        """Ask whether to merge the duplicates found, then merge every group at once."""
+        def describe(contact):
+            return f"{contact.first_name} {contact.last_name}".strip() or contact.phone_number
+
+        preview = "\n".join(" + ".join(map(describe, suggestion.contacts))
+                            for suggestion in suggestions[:MERGE_PREVIEW_LIMIT])
+        if len(suggestions) > MERGE_PREVIEW_LIMIT:
+            preview += f"\n...and {len(suggestions) - MERGE_PREVIEW_LIMIT} more"
+        answer = QMessageBox.question(
+            self, "Find Duplicates",
+            f"Found {len(suggestions)} groups of likely duplicates:\n\n{preview}\n\n"
+            "Merge each group into a single contact?")
+        if answer != QMessageBox.StandardButton.Yes:
+            return
+        from phonebooker.dedup import apply_merges
+
+        if self.database is not None:
+            apply_merges(self.database, suggestions)
+            self.contacts_model.refresh()
+            return
+        apply_merges(self.contacts, suggestions)
+        for suggestion in suggestions:
+            for contact in suggestion.contacts:
+                self.record_edit(journal.deleted(contact))
+            self.record_edit(journal.added(suggestion.merged))
+        self.phone_index.rebuild(self.contacts)
+        self.refresh_contacts_table()
 
     def convert_phonebook(self, source_format, target_format):
         input_filename, _ = QFileDialog.getOpenFileName(
@@ -1115,86 +1693,17 @@ class PhonebookApp(QMainWindow):
         except Exception as e:
             QMessageBox.critical(self, "Error", f"An error occurred during conversion: {str(e)}")
 
-    def convert_xml_to_vcf(self):
-        input_filename, _ = QFileDialog.getOpenFileName(self, "Select XML File", "", "XML Files (*.xml)")
-        if not input_filename:
-            return
+    def convert_xml_to_vcf(self, input_file, output_file):
+        return convert_xml_to_vcf(input_file, output_file, DEFAULT_GROUPS)
 
-        output_filename, _ = QFileDialog.getSaveFileName(self, "Save VCF File", "", "VCF Files (*.vcf)")
-        if not output_filename:
-            return
-
-        try:
-            tree = ET.parse(input_filename)
-            root = tree.getroot()
-
-            with open(output_filename, 'w', encoding='utf-8') as vcf_file:
-                for contact in root.findall("Contact"):
-                    vcf_file.write("BEGIN:VCARD\n")
-                    vcf_file.write("VERSION:3.0\n")
-                
-                    first_name = contact.find("FirstName").text if contact.find("FirstName") is not None else ""
-                    last_name = contact.find("LastName").text if contact.find("LastName") is not None else ""
-                    vcf_file.write(f"N:{last_name};{first_name};;;\n")
-                    vcf_file.write(f"FN:{first_name} {last_name}\n")
-                
-                    phone = contact.find("Phone")
-                    if phone is not None:
-                        phone_type = phone.get("type", "").upper()
-                        phone_number = phone.find("phonenumber").text if phone.find("phonenumber") is not None else ""
-                        vcf_file.write(f"TEL;TYPE={phone_type}:{phone_number}\n")
-                
-                    company = contact.find("Company")
-                    if company is not None and company.text:
-                        vcf_file.write(f"ORG:{company.text}\n")
-                
-                    for group in contact.findall("Group"):
-                        group_id = int(group.text)
-                        if 4 <= group_id < len(self.groups) + 4:
-                            vcf_file.write(f"CATEGORIES:{self.groups[group_id - 4]}\n")
-                
-                    vcf_file.write("END:VCARD\n\n")
-
-            QMessageBox.information(self, "Success", "Phonebook converted to VCF successfully!")
-        except Exception as e:
-            QMessageBox.critical(self, "Error", f"An error occurred during conversion: {str(e)}")
-            
     def convert_vcf_to_xml(self, input_file, output_file):
-        root = ET.Element("AddressBook")
-        current_contact = None
-        
-        with open(input_file, 'r', encoding='utf-8') as vcf:
-            for line in vcf:
-                line = line.strip()
-                if line == "BEGIN:VCARD":
-                    current_contact = ET.SubElement(root, "Contact")
-                elif line == "END:VCARD":
-                    current_contact = None
-                elif current_contact is not None:
-                    if line.startswith("N:"):
-                        parts = line[2:].split(';')
-                        if len(parts) >= 2:
-                            ET.SubElement(current_contact, "LastName").text = parts[0]
-                            ET.SubElement(current_contact, "FirstName").text = parts[1]
-                    elif line.startswith("TEL;"):
-                        phone = ET.SubElement(current_contact, "Phone")
-                        if "TYPE=" in line:
-                            phone_type = line.split("TYPE=")[1].split(':')[0]
-                            phone.set("type", phone_type)
-                        phone_number = line.split(":")[-1]
-                        ET.SubElement(phone, "phonenumber").text = phone_number
-                    elif line.startswith("ORG:"):
-                        ET.SubElement(current_contact, "Company").text = line[4:]
-                    elif line.startswith("CATEGORIES:"):
-                        group_name = line[11:]
-                        if group_name in self.groups:
-                            group_id = str(self.groups.index(group_name) + 4)
-                            ET.SubElement(current_contact, "Group").text = group_id
-
-        tree = ET.ElementTree(root)
-        tree.write(output_file, encoding="UTF-8", xml_declaration=True)
+        return convert_vcf_to_xml(input_file, output_file, DEFAULT_GROUPS)
 
 if __name__ == "__main__":
+    if getattr(sys, "frozen", False):
+        # Worker processes of a PyInstaller build start by running this executable
+        import multiprocessing
+        multiprocessing.freeze_support()
     app = QApplication(sys.argv)
     window = PhonebookApp()
     window.show()
@@ -0,0 +1,71 @@
+"""Measure the memory used by Contact objects with tracemalloc.
+
+Compares the slotted Contact from phonebooker.core against the original
+dict-backed layout with a per-contact list of group names.
+
+    python benchmarks/contact_memory.py --count 1000000
+"""
+import argparse
+import gc
+import os
+import random
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from phonebooker.core import DEFAULT_GROUPS, Contact
+
+
+class DictContact:
+    """The pre-__slots__ Contact layout."""
+
+    def __init__(self, first_name, last_name, phone_type, phone_number, groups, company=""):
+        self.first_name = first_name
+        self.last_name = last_name
+        self.phone_type = phone_type
+        self.phone_number = phone_number
+        self.groups = groups
+        self.company = company
+
+
+def contact_rows(count, seed=0):
+    rng = random.Random(seed)
+    first_names = ["John", "Jane", "Kate", "Michael", "Sarah", "David", "Emma", "Liam", "Olivia", "Noah"]
+    last_names = ["Smith", "Jones", "Williams", "Brown", "Taylor", "Wilson", "Nguyen", "Martin", "Lee", "White"]
+    companies = ["", "Acme", "Globex", "Initech", "Umbrella"]
+    for i in range(count):
+        yield (rng.choice(first_names), f"{rng.choice(last_names)}{i}",
+               # str() copies mimic values read from a file rather than shared literals
+               "".join(rng.choice(["Home", "Work", "Mobile"])),
+               str(400000000 + i),
+               ["".join(g) for g in rng.sample(DEFAULT_GROUPS, rng.randint(0, 2))],
+               "".join(rng.choice(companies)))
+
+
+def measure(cls, count):
+    """Bytes still allocated after building count contacts, field strings included."""
+    gc.collect()
+    tracemalloc.start()
+    contacts = [cls(*row) for row in contact_rows(count)]
+    gc.collect()
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del contacts
+    return current
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--count", type=int, default=1000000)
+    args = parser.parse_args(argv)
+
+    before = measure(DictContact, args.count)
+    after = measure(Contact, args.count)
+    for label, size in (("dict-backed Contact", before), ("slotted Contact", after)):
+        print(f"{label:>20}: {size / 2**20:8.1f} MiB, {size / args.count:6.1f} bytes/contact")
+    print(f"{'saving':>20}: {(1 - after / before) * 100:8.1f}%")
+
+
+if __name__ == "__main__":
+    main()
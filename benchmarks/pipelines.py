@@ -0,0 +1,380 @@
+"""Benchmark the phonebook pipelines headless on synthetic phonebooks.
+
+Every pipeline runs against seeded phonebooks from benchmarks/synthetic.py at
+each requested size. Results (throughput, latency percentiles and peak
+traced memory) are printed as JSON and can be checked against a stored
+baseline, in which case the exit status is 1 if anything regressed.
+
+    python benchmarks/pipelines.py --sizes 1000,10000,100000 --output results.json
+    python benchmarks/pipelines.py --baseline results.json
+"""
+import argparse
+import gc
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from phonebooker.cache import build_cache, read_cache, write_cache
+from phonebooker.core import ContactStore, PhoneIndex, iter_xml_contacts, parse_complex_name, write_xml_phonebook
+from phonebooker.database import ContactDatabase, convert_xml_to_db
+from phonebooker.dedup import find_duplicates
+from phonebooker.diff import diff_phonebooks
+from phonebooker.importer import read_csv_contacts
+from phonebooker.merge import merge_phonebooks
+from phonebooker.names import NameParser, DEFAULT_NICKNAME_FILE
+from phonebooker.phones import normalize_phones
+from phonebooker.search import TrigramIndex, score_names
+from phonebooker.vcard import convert_vcf_to_xml, convert_xml_to_vcf, write_vcards
+
+import synthetic
+
+# Per-call latency of parse_complex_name is sampled on this many names
+NAME_SAMPLE = 100000
+
+SEARCH_QUERIES = ["smith", "kate", "acme", "work", "nguyen", "globex", "jon", "4000012", "zz"]
+
+
+class Workspace:
+    """Generated input phonebooks, a scratch directory for outputs and a cache of loaded contacts."""
+
+    def __init__(self, data_dir, seed, scratch_dir):
+        self.data_dir = data_dir
+        self.seed = seed
+        self.scratch_dir = scratch_dir
+        self._contacts = {}
+
+    def phonebook(self, fmt, size):
+        return synthetic.phonebook_path(self.data_dir, fmt, size, self.seed)
+
+    def output(self, name):
+        return os.path.join(self.scratch_dir, name)
+
+    def contacts(self, size):
+        """The XML phonebook of this size loaded into a ContactStore, kept for the next caller."""
+        if size not in self._contacts:
+            self._contacts.clear()
+            self._contacts[size] = ContactStore(iter_xml_contacts(self.phonebook("xml", size)))
+        return self._contacts[size]
+
+
+def _load(workspace, size):
+    store = ContactStore(iter_xml_contacts(workspace.phonebook("xml", size)))
+    PhoneIndex(store)
+    return len(store)
+
+
+def _reopen(workspace, size):
+    filename = workspace.phonebook("xml", size)
+    contacts = read_cache(filename)
+    if contacts is None:
+        # Only the warm-up run parses the phonebook
+        contacts, data = build_cache(filename, iter_xml_contacts)
+        if data is not None:
+            write_cache(filename, data)
+    store = ContactStore(contacts)
+    PhoneIndex(store)
+    return len(store)
+
+
+def _import_csv(workspace, size):
+    contacts, report = read_csv_contacts(workspace.phonebook("csv", size))
+    ContactStore(contacts)
+    return report.added + report.duplicates
+
+
+def _save_xml(workspace, size):
+    return write_xml_phonebook(workspace.output("save.xml"), workspace.contacts(size))
+
+
+def _save_vcf(workspace, size):
+    return write_vcards(workspace.output("save.vcf"), workspace.contacts(size))
+
+
+def _convert_xml_to_vcf(workspace, size):
+    return convert_xml_to_vcf(workspace.phonebook("xml", size), workspace.output("convert.vcf"))
+
+
+def _convert_vcf_to_xml(workspace, size):
+    return convert_vcf_to_xml(workspace.phonebook("vcf", size), workspace.output("convert.xml"))
+
+
+def _convert_xml_to_db(workspace, size):
+    return convert_xml_to_db(workspace.phonebook("xml", size), workspace.output("convert.db"))
+
+
+def _find_duplicates(workspace, size):
+    store = workspace.contacts(size)
+    find_duplicates(store)
+    return len(store)
+
+
+def _merge(workspace, size):
+    # The XML and VCF phonebooks hold the same contacts, so half of what is read are duplicates
+    sources = [workspace.phonebook(fmt, size) for fmt in ("xml", "vcf", "csv")]
+    return merge_phonebooks(sources, workspace.output("merged.xml")).read
+
+
+def _diff(workspace, size):
+    # The same contacts in two formats: every contact is read, hashed and matched
+    diff_phonebooks(workspace.phonebook("xml", size), workspace.phonebook("vcf", size))
+    return 2 * size
+
+
+# name: function(workspace, size) -> items processed; each run is one latency sample
+FILE_PIPELINES = {
+    "load_phonebook": _load,
+    "reopen_phonebook": _reopen,
+    "import_csv": _import_csv,
+    "save_as_xml": _save_xml,
+    "save_as_vcf": _save_vcf,
+    "convert_xml_to_vcf": _convert_xml_to_vcf,
+    "convert_vcf_to_xml": _convert_vcf_to_xml,
+    "convert_xml_to_db": _convert_xml_to_db,
+    "find_duplicates": _find_duplicates,
+    "merge_phonebooks": _merge,
+    "diff_phonebooks": _diff,
+}
+
+
+def percentiles(samples):
+    ordered = sorted(samples)
+
+    def pick(fraction):
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+    return {"min": ordered[0], "p50": pick(0.5), "p90": pick(0.9), "p99": pick(0.99), "max": ordered[-1]}
+
+
+def summarize(items, samples):
+    """Result record for a pipeline; samples are in seconds, latency is reported in milliseconds."""
+    return {
+        "items": items,
+        "throughput": items * len(samples) / sum(samples),
+        "latency_ms": {name: value * 1000 for name, value in percentiles(samples).items()},
+    }
+
+
+def peak_memory(func, *args):
+    """Peak traced allocation, in MiB, while running func(*args)."""
+    gc.collect()
+    tracemalloc.start()
+    try:
+        func(*args)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak / 2**20
+
+
+def bench_file_pipeline(pipeline, workspace, size, repeat, measure_memory):
+    pipeline(workspace, size)  # warm up, generating any missing input file
+    samples = []
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        items = pipeline(workspace, size)
+        samples.append(time.perf_counter() - start)
+    result = summarize(items, samples)
+    if measure_memory:
+        result["peak_mib"] = peak_memory(pipeline, workspace, size)
+    return result
+
+
+def bench_parse_names(workspace, size, repeat, measure_memory):
+    """Per-call latency of parse_complex_name over the raw names of a CSV export."""
+    names = [raw_name for _, _, raw_name, *_ in synthetic.contacts(min(size, NAME_SAMPLE), workspace.seed)]
+    samples = []
+    clock = time.perf_counter
+    for _ in range(repeat):
+        for name in names:
+            start = clock()
+            parse_complex_name(name)
+            samples.append(clock() - start)
+    result = summarize(len(names), samples)
+    result["throughput"] = len(samples) / sum(samples)
+    if measure_memory:
+        result["peak_mib"] = peak_memory(lambda: [parse_complex_name(name) for name in names])
+    return result
+
+
+def bench_parse_names_batch(workspace, size, repeat, measure_memory):
+    """NameParser.parse_names over every raw name of a CSV export, starting from a cold cache each run."""
+    names = [raw_name for _, _, raw_name, *_ in synthetic.contacts(size, workspace.seed)]
+    samples = []
+    for _ in range(repeat):
+        parser = NameParser(nickname_file=DEFAULT_NICKNAME_FILE)
+        start = time.perf_counter()
+        parser.parse_names(names)
+        samples.append(time.perf_counter() - start)
+    result = summarize(len(names), samples)
+    if measure_memory:
+        result["peak_mib"] = peak_memory(lambda: NameParser(nickname_file=DEFAULT_NICKNAME_FILE).parse_names(names))
+    return result
+
+
+def bench_normalize_phones(workspace, size, repeat, measure_memory):
+    """normalize_phones over the raw numbers of a CSV export."""
+    numbers = [number for _, _, _, _, number, _, _ in synthetic.contacts(size, workspace.seed)]
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        normalize_phones(numbers)
+        samples.append(time.perf_counter() - start)
+    result = summarize(len(numbers), samples)
+    if measure_memory:
+        result["peak_mib"] = peak_memory(normalize_phones, numbers)
+    return result
+
+
+def bench_filter_contacts(workspace, size, repeat, measure_memory):
+    """Latency of the contacts table searches: "All Fields" through the search index, "Name Only" scoring."""
+    contacts = workspace.contacts(size)
+    index = TrigramIndex(contacts)
+    build_start = time.perf_counter()
+    len(index)  # the index is built on first use
+    build_time = time.perf_counter() - build_start
+    names = [f"{contact.first_name} {contact.last_name}" for contact in contacts]
+
+    rng = random.Random(workspace.seed)
+    samples = []
+    name_samples = []
+    for _ in range(repeat):
+        for query in rng.sample(SEARCH_QUERIES, len(SEARCH_QUERIES)):
+            start = time.perf_counter()
+            index.search(query)
+            samples.append(time.perf_counter() - start)
+        start = time.perf_counter()
+        score_names(rng.choice(SEARCH_QUERIES), names)
+        name_samples.append(time.perf_counter() - start)
+
+    result = summarize(len(contacts), samples)
+    result["index_build_ms"] = build_time * 1000
+    result["name_only"] = summarize(len(contacts), name_samples)
+    if measure_memory:
+        result["peak_mib"] = peak_memory(lambda: len(TrigramIndex(contacts)))
+    return result
+
+
+def bench_search_database(workspace, size, repeat, measure_memory):
+    """Latency of a database search: counting the matches and fetching the first page, as the edit view does."""
+    path = workspace.output("search.db")
+    if not os.path.exists(path):
+        convert_xml_to_db(workspace.phonebook("xml", size), path)
+    rng = random.Random(workspace.seed)
+    samples = []
+    with ContactDatabase(path) as database:
+        open_start = time.perf_counter()
+        count = len(database)
+        open_time = time.perf_counter() - open_start
+        for _ in range(repeat):
+            for query in rng.sample(SEARCH_QUERIES, len(SEARCH_QUERIES)):
+                start = time.perf_counter()
+                search = database.search(query)
+                database.count(search)
+                database.contacts(search)
+                samples.append(time.perf_counter() - start)
+    os.remove(path)
+    result = summarize(count, samples)
+    result["count_ms"] = open_time * 1000
+    return result
+
+
+def _file_benchmark(pipeline):
+    return lambda workspace, size, repeat, measure_memory: bench_file_pipeline(
+        pipeline, workspace, size, repeat, measure_memory)
+
+
+BENCHMARKS = {name: _file_benchmark(pipeline) for name, pipeline in FILE_PIPELINES.items()}
+BENCHMARKS["parse_complex_name"] = bench_parse_names
+BENCHMARKS["parse_names"] = bench_parse_names_batch
+BENCHMARKS["normalize_phones"] = bench_normalize_phones
+BENCHMARKS["filter_contacts"] = bench_filter_contacts
+BENCHMARKS["search_database"] = bench_search_database
+
+
+def run(names, sizes, seed, repeat, data_dir, measure_memory):
+    results = {}
+    with tempfile.TemporaryDirectory(prefix="phonebooker-bench-") as scratch_dir:
+        workspace = Workspace(data_dir, seed, scratch_dir)
+        for size in sizes:
+            for name in names:
+                result = BENCHMARKS[name](workspace, size, repeat, measure_memory)
+                results[f"{name}@{size}"] = result
+                print(f"{name}@{size}: {result['throughput']:,.0f} items/s, "
+                      f"p50 {result['latency_ms']['p50']:.3f} ms", file=sys.stderr)
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """Regressions against baseline results: throughput drops and peak memory growth beyond tolerance."""
+    regressions = []
+    for key, result in results.items():
+        before = baseline.get(key)
+        if before is None:
+            continue
+        if before.get("throughput") and result["throughput"] < before["throughput"] * (1 - tolerance):
+            regressions.append(f"{key}: throughput {result['throughput']:,.0f}/s, "
+                               f"baseline {before['throughput']:,.0f}/s")
+        if before.get("peak_mib") and result.get("peak_mib", 0) > before["peak_mib"] * (1 + tolerance):
+            regressions.append(f"{key}: peak memory {result['peak_mib']:.1f} MiB, "
+                               f"baseline {before['peak_mib']:.1f} MiB")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="1000,10000,100000",
+                        help="Comma separated phonebook sizes, e.g. 1000,10000,100000,1000000")
+    parser.add_argument("--only", help="Comma separated subset of: " + ", ".join(BENCHMARKS))
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--data-dir", default=os.path.join(tempfile.gettempdir(), "phonebooker-bench-data"),
+                        help="Where generated phonebooks are kept between runs")
+    parser.add_argument("--no-memory", action="store_true", help="Skip the (slower) peak memory runs")
+    parser.add_argument("-o", "--output", help="Write the JSON results here as well as to stdout")
+    parser.add_argument("--baseline", help="JSON results of an earlier run to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="Allowed relative slowdown or memory growth before flagging a regression")
+    args = parser.parse_args(argv)
+
+    names = args.only.split(",") if args.only else list(BENCHMARKS)
+    unknown = [name for name in names if name not in BENCHMARKS]
+    if unknown:
+        parser.error(f"unknown benchmark(s): {', '.join(unknown)}")
+    sizes = [int(size) for size in args.sizes.split(",")]
+
+    report = {
+        "meta": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "seed": args.seed,
+            "repeat": args.repeat,
+        },
+        "results": run(names, sizes, args.seed, args.repeat, args.data_dir, not args.no_memory),
+    }
+
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as output:
+            output.write(text + "\n")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as baseline_file:
+            baseline = json.load(baseline_file)["results"]
+        regressions = compare(report["results"], baseline, args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
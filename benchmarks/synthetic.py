@@ -0,0 +1,156 @@
+"""Seeded generator for realistic synthetic phonebooks.
+
+Writes XML and VCF phonebooks in the formats the app reads and CSV exports in
+the resources/Template.csv layout. The same seed and size always produce the
+same files, so benchmark runs on different machines or commits are comparable.
+
+    python benchmarks/synthetic.py --count 100000 --output-dir /tmp/phonebooks
+"""
+import argparse
+import os
+import random
+import sys
+from xml.sax.saxutils import escape, quoteattr
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from phonebooker.core import DEFAULT_GROUPS, GROUP_ID_OFFSET
+
+FIRST_NAMES = [
+    "James", "Mary", "John", "Patricia", "Robert", "Jennifer", "Michael", "Linda", "William", "Elizabeth",
+    "David", "Barbara", "Richard", "Susan", "Joseph", "Jessica", "Thomas", "Sarah", "Charles", "Karen",
+    "Christopher", "Nancy", "Daniel", "Margaret", "Matthew", "Kathryn", "Anthony", "Katherine", "Andrew",
+    "Rebecca", "Nicholas", "Victoria", "Samuel", "Abigail", "Benjamin", "Madeline", "Stephen", "Valerie",
+    "Edward", "Alexandra", "Liam", "Olivia", "Noah", "Emma", "Wei", "Mei", "Arjun", "Priya", "José",
+    "Zoë", "Siobhán", "Björn", "Ngoc", "Minh",
+]
+
+# Nickname forms that parse_complex_name drops when followed by the formal name
+NICKNAMES = {
+    "Kathryn": "Kate", "Katherine": "Katie", "Elizabeth": "Liz", "Margaret": "Maggie", "Michael": "Mike",
+    "William": "Bill", "Robert": "Bob", "Richard": "Rick", "Thomas": "Tom", "Daniel": "Dan",
+    "Andrew": "Andy", "Rebecca": "Becky", "Christopher": "Chris", "Samuel": "Sam",
+}
+
+LAST_NAMES = [
+    "Smith", "Jones", "Williams", "Brown", "Wilson", "Taylor", "Johnson", "White", "Martin", "Anderson",
+    "Thompson", "Nguyen", "Thomas", "Walker", "Harris", "Lee", "Ryan", "Robinson", "Kelly", "King",
+    "Davis", "Wright", "Evans", "Roberts", "Green", "Hall", "Wood", "Jackson", "Clarke", "Patel",
+    "Tran", "Chen", "Wang", "Li", "Singh", "O'Brien", "McDonald", "Van der Berg", "Müller", "García",
+]
+
+COMPANIES = ["", "", "", "Acme Corp", "Globex", "Initech", "Umbrella Pty Ltd", "Wayne Enterprises",
+             "Stark Industries", "Hooli", "Vandelay Industries", "Soylent & Co"]
+
+DEPARTMENTS = ["Sales", "IT", "HR", "Finance", "Legal", "Facilities"]
+
+PHONE_TYPES = ["Mobile", "Mobile", "Mobile", "Home", "Work"]
+
+# Share of CSV rows that repeat an earlier phone number
+CSV_DUPLICATE_RATE = 0.02
+
+
+def _phone_number(rng, index):
+    """A unique Australian-style number in one of the forms found in real exports."""
+    form = rng.random()
+    if form < 0.6:
+        return f"4{index:08d}"  # mobile
+    elif form < 0.8:
+        return f"612{index:08d}"  # landline with country code
+    return f"2{index:08d}"  # landline with area code
+
+
+def contacts(count, seed=0):
+    """Yield (first name, last name, raw name, phone type, phone number, groups, company) tuples.
+
+    raw name is the name as an HR export would write it, sometimes with a
+    nickname or a parenthesized department; the first and last name are
+    what the app should end up with.
+    """
+    rng = random.Random(seed)
+    for index in range(count):
+        first_name = rng.choice(FIRST_NAMES)
+        last_name = rng.choice(LAST_NAMES)
+        raw_name = f"{first_name} {last_name}"
+        roll = rng.random()
+        if roll < 0.1 and first_name in NICKNAMES:
+            raw_name = f"{NICKNAMES[first_name]} {raw_name}"
+        elif roll < 0.15:
+            raw_name = f"{raw_name} ({rng.choice(DEPARTMENTS)})"
+        elif roll < 0.2:
+            raw_name = raw_name.lower()
+        groups = rng.sample(DEFAULT_GROUPS[2:5], rng.choice((0, 1, 1, 1, 2)))
+        yield (first_name, last_name, raw_name, rng.choice(PHONE_TYPES), _phone_number(rng, index),
+               groups, rng.choice(COMPANIES))
+
+
+def write_xml(filename, count, seed=0):
+    group_ids = {group: i for i, group in enumerate(DEFAULT_GROUPS, start=GROUP_ID_OFFSET)}
+    with open(filename, "w", encoding="utf-8") as output:
+        output.write("<?xml version='1.0' encoding='UTF-8'?>\n<AddressBook>")
+        for group, group_id in group_ids.items():
+            output.write(f"<pbgroup><id>{group_id}</id><name>{escape(group)}</name></pbgroup>")
+        for first_name, last_name, _, phone_type, number, groups, company in contacts(count, seed):
+            group_elems = "".join(f"<Group>{group_ids[group]}</Group>" for group in groups)
+            output.write(f"<Contact><FirstName>{escape(first_name)}</FirstName>"
+                         f"<LastName>{escape(last_name)}</LastName>"
+                         f"<Phone type={quoteattr(phone_type)}><phonenumber>{number}</phonenumber></Phone>"
+                         f"{group_elems}<Company>{escape(company)}</Company></Contact>")
+        output.write("</AddressBook>")
+
+
+def write_vcf(filename, count, seed=0):
+    with open(filename, "w", encoding="utf-8") as output:
+        for first_name, last_name, _, phone_type, number, groups, company in contacts(count, seed):
+            card = ["BEGIN:VCARD", "VERSION:3.0", f"N:{last_name};{first_name};;;",
+                    f"FN:{first_name} {last_name}", f"TEL;TYPE={phone_type.upper()}:{number}"]
+            if company:
+                card.append(f"ORG:{company}")
+            card.extend(f"CATEGORIES:{group}" for group in groups)
+            card.append("END:VCARD\n\n")
+            output.write("\n".join(card))
+
+
+def write_csv(filename, count, seed=0):
+    """Write a CSV export in the resources/Template.csv layout, with some repeated numbers."""
+    rng = random.Random(seed + 1)
+    numbers = []
+    with open(filename, "w", encoding="utf-8", newline="") as output:
+        output.write("Template,Email,Phone Number,Name\r\n")
+        for _, last_name, raw_name, _, number, _, _ in contacts(count, seed):
+            if numbers and rng.random() < CSV_DUPLICATE_RATE:
+                number = rng.choice(numbers)
+            elif len(numbers) < 10000:
+                numbers.append(number)
+            email = f"{raw_name.split()[0].lower()}.{last_name.lower().replace(' ', '')}@example.com"
+            output.write(f",{email},{number},\"{raw_name}\"\r\n")
+
+
+WRITERS = {"xml": write_xml, "vcf": write_vcf, "csv": write_csv}
+
+
+def phonebook_path(data_dir, fmt, count, seed=0):
+    """Path of a generated phonebook, writing it first if it doesn't exist yet."""
+    filename = os.path.join(data_dir, f"synthetic-{count}-s{seed}.{fmt}")
+    if not os.path.exists(filename):
+        os.makedirs(data_dir, exist_ok=True)
+        partial = filename + ".part"
+        WRITERS[fmt](partial, count, seed)
+        os.replace(partial, filename)
+    return filename
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--count", type=int, default=10000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--formats", default="xml,vcf,csv", help="Comma separated list of xml, vcf and csv")
+    parser.add_argument("-o", "--output-dir", default=".")
+    args = parser.parse_args(argv)
+
+    for fmt in args.formats.split(","):
+        print(phonebook_path(args.output_dir, fmt, args.count, args.seed))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1 @@
+"""Qt-free building blocks shared by the PhoneBooker Pro GUI and command line."""
@@ -0,0 +1,221 @@
+"""Binary sidecar cache of parsed phonebooks, so reopening a large file skips parsing it.
+
+The contacts read from ``<phonebook>`` are kept in ``<phonebook>.pbcache``
+next to it. The cache records the phonebook's absolute path, size,
+modification time and a BLAKE2b hash of its content and of the group list
+it was read with, and is only used while all of them still match. When the
+phonebook has changed, the next read parses it as usual and writes a new
+cache on a background thread.
+
+Contacts are cached in contact_sort_key order, so a ContactStore built from
+them finds them already sorted. When they are read into a GroupRegistry,
+the registry as reading left it (the file's group table) is cached too.
+
+Layout, little-endian::
+
+    header  CACHE_HEADER: magic, format version, phonebook size, mtime_ns, digest,
+            contact count, group name count, registry entry count, text length in bytes
+    masks   a uint64 group mask per contact, bits numbered like the group names
+    text    UTF-8 fields separated by NUL: the phonebook path, the group names, the id and
+            name of each registry entry, then the first name, last name, phone type,
+            phone number and company of each contact
+
+Reading memory-maps the cache: the masks are used where they lie and the
+text is decoded from the mapping in one go.
+"""
+import mmap
+import os
+import struct
+import sys
+import threading
+
+from . import trace
+from .core import DEFAULT_GROUPS, GROUP_TABLE, Contact, GroupRegistry, contact_sort_key, gc_paused
+
+CACHE_SUFFIX = ".pbcache"
+
+CACHE_MAGIC = b"PBCACHE\0"
+CACHE_VERSION = 2
+CACHE_HEADER = struct.Struct("<8sIqq32sIIIQ")
+
+# Fields stored per contact, after the path and the group names
+CONTACT_FIELDS = 5
+
+# Bytes hashed between calls to a progress callback
+HASH_CHUNK_BYTES = 8 << 20
+
+# Masks are read in place, so they must be in the mapping's byte order
+CACHE_SUPPORTED = sys.byteorder == "little"
+
+
+def cache_path(filename):
+    return filename + CACHE_SUFFIX
+
+
+def _source_digest(filename, groups, progress=None):
+    """BLAKE2b digest of the phonebook in filename and of the group list it is read with."""
+    # Imported here: it loads OpenSSL, which app startup can do without
+    import hashlib
+
+    digest = hashlib.blake2b(repr(groups).encode("utf-8"), digest_size=32)
+    with open(filename, 'rb') as source:
+        total = os.fstat(source.fileno()).st_size
+        if total:
+            with mmap.mmap(source.fileno(), 0, access=mmap.ACCESS_READ) as mapped, memoryview(mapped) as view:
+                for start in range(0, total, HASH_CHUNK_BYTES):
+                    digest.update(view[start:start + HASH_CHUNK_BYTES])
+                    if progress is not None:
+                        progress(min(start + HASH_CHUNK_BYTES, total), total)
+    return digest.digest()
+
+
+def _stamp(filename):
+    stat = os.stat(filename)
+    return stat.st_size, stat.st_mtime_ns
+
+
+def encode_cache(filename, contacts, stamp, digest, registry=None):
+    """The cache file content for contacts read from filename, or None if they can't be cached.
+
+    stamp is the phonebook's (size, mtime_ns) and digest its _source_digest
+    from before it was read. registry is the GroupRegistry they were read
+    into, if any.
+    """
+    entries = [] if registry is None else list(registry.items())
+    contacts = list(contacts)
+    group_names = GROUP_TABLE.names
+    used_bits = 0
+    for contact in contacts:
+        used_bits |= contact.group_mask
+    if used_bits.bit_length() > 64:
+        return None
+    fields = [os.path.abspath(filename), *group_names[:used_bits.bit_length()]]
+    for group_id, name in entries:
+        fields += (str(group_id), name)
+    for contact in contacts:
+        fields += (contact.first_name, contact.last_name, contact.phone_type, contact.phone_number, contact.company)
+    text = "\0".join(fields)
+    # A NUL inside a field would shift every field after it
+    if text.count("\0") != len(fields) - 1:
+        return None
+    text = text.encode("utf-8")
+    header = CACHE_HEADER.pack(CACHE_MAGIC, CACHE_VERSION, *stamp, digest, len(contacts),
+                               used_bits.bit_length(), len(entries), len(text))
+    masks = struct.pack(f"<{len(contacts)}Q", *(contact.group_mask for contact in contacts))
+    return header + masks + text
+
+
+def write_cache(filename, data):
+    """Atomically replace the cache of filename with data; returns False if it couldn't be written.
+
+    Like write_contacts, data goes to a temporary file renamed over the
+    cache once complete; its name is unique to the writing thread, as
+    several loads may each be writing one.
+    """
+    path = cache_path(filename)
+    temp_path = f"{path}.{threading.get_ident()}.tmp"
+    try:
+        with open(temp_path, 'wb') as output:
+            output.write(data)
+        os.replace(temp_path, path)
+    except OSError:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        return False
+    return True
+
+
+def _decode(mapped, filename, groups, progress):
+    """(contacts, registry entries) from the cache in mapped, or None if it isn't current."""
+    (magic, version, size, mtime_ns, digest, count, group_count, entry_count,
+     text_length) = CACHE_HEADER.unpack_from(mapped)
+    if magic != CACHE_MAGIC or version != CACHE_VERSION or (size, mtime_ns) != _stamp(filename):
+        return None
+    masks_start = CACHE_HEADER.size
+    text_start = masks_start + 8 * count
+    if len(mapped) != text_start + text_length or digest != _source_digest(filename, groups, progress):
+        return None
+
+    with memoryview(mapped) as view, view[masks_start:text_start].cast("Q") as masks:
+        fields = str(view[text_start:], "utf-8").split("\0")
+        contacts_start = 1 + group_count + 2 * entry_count
+        if len(fields) != contacts_start + CONTACT_FIELDS * count or fields[0] != os.path.abspath(filename):
+            return None
+        group_names = fields[1:1 + group_count]
+        entries = fields[1 + group_count:contacts_start]
+        entries = [(int(group_id), name) for group_id, name in zip(entries[::2], entries[1::2])]
+        # The cache's group bits, renumbered for this process's GROUP_TABLE; few masks occur
+        group_masks = {0: 0}
+        contacts = []
+        append = contacts.append
+        values = iter(fields[contacts_start:])
+        for mask, first_name, last_name, phone_type, phone_number, company in zip(
+                masks, values, values, values, values, values):
+            group_mask = group_masks.get(mask)
+            if group_mask is None:
+                group_mask = group_masks[mask] = GROUP_TABLE.mask(
+                    name for bit, name in enumerate(group_names) if mask >> bit & 1)
+            contact = Contact(first_name, last_name, phone_type, phone_number, (), company)
+            contact.group_mask = group_mask
+            append(contact)
+    return contacts, entries
+
+
+@trace.traced("read_cache")
+def read_cache(filename, groups=DEFAULT_GROUPS, progress=None):
+    """The contacts cached for the phonebook in filename read with groups, or None if there is no current cache.
+
+    A GroupRegistry passed as groups is left as reading the phonebook would
+    leave it. progress, if given, is called with (bytes hashed, phonebook
+    size) while the phonebook's content is checked against the cache.
+    """
+    if not CACHE_SUPPORTED:
+        return None
+    try:
+        with open(cache_path(filename), 'rb') as cache, \
+                mmap.mmap(cache.fileno(), 0, access=mmap.ACCESS_READ) as mapped, gc_paused():
+            cached = _decode(mapped, filename, groups, progress)
+    except (OSError, ValueError, struct.error):
+        return None
+    if cached is None:
+        return None
+    contacts, entries = cached
+    if isinstance(groups, GroupRegistry):
+        groups.replace(entries)
+    trace.count("contacts_read", len(contacts))
+    return contacts
+
+
+def build_cache(filename, read_contacts, groups=DEFAULT_GROUPS, progress=None):
+    """Read the phonebook in filename with read_contacts, for caching.
+
+    Returns the contacts, sorted by contact_sort_key with contacts that sort
+    the same in file order, and the cache data to pass to write_cache, or
+    None if they can't be cached.
+    """
+    if not CACHE_SUPPORTED:
+        return sorted(read_contacts(filename, groups, progress), key=contact_sort_key), None
+    stamp = _stamp(filename)
+    digest = _source_digest(filename, groups)
+    contacts = sorted(read_contacts(filename, groups, progress), key=contact_sort_key)
+    # Cache only what was read from the file as it was hashed
+    if _stamp(filename) != stamp:
+        return contacts, None
+    registry = groups if isinstance(groups, GroupRegistry) else None
+    return contacts, encode_cache(filename, contacts, stamp, digest, registry)
+
+
+def cached_contacts(filename, read_contacts, groups=DEFAULT_GROUPS, progress=None):
+    """A list of the contacts read_contacts(filename, groups, progress) reads, from the cache when it is current.
+
+    Otherwise the phonebook is read with build_cache and the new cache is
+    written on a background thread, which doesn't hold up the caller.
+    Either way the contacts are in the order build_cache gives.
+    """
+    contacts = read_cache(filename, groups, progress)
+    if contacts is not None:
+        return contacts
+    contacts, data = build_cache(filename, read_contacts, groups, progress)
+    if data is not None:
+        threading.Thread(target=write_cache, args=(filename, data), name="phonebook-cache-writer").start()
+    return contacts
@@ -0,0 +1,311 @@
+"""Headless command line for PhoneBooker Pro.
+
+Examples::
+
+    python -m phonebooker convert phonebooks/ --to vcf --jobs 8
+    python -m phonebooker import contacts.csv phonebook.db
+    python -m phonebooker dedup phonebook.xml --apply
+    python -m phonebooker merge sales.xml support.vcf new_hires.csv -o directory.xml
+    python -m phonebooker diff yesterday.xml today.xml -o today.pbpatch
+    python -m phonebooker --trace trace.json convert big.xml --to db
+"""
+import argparse
+import functools
+import os
+import sqlite3
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from . import trace
+from .core import DEFAULT_GROUPS, ContactStore, GroupRegistry, iter_xml_contacts, write_xml_phonebook
+from .database import ContactDatabase, convert_db_to_vcf, convert_db_to_xml, convert_vcf_to_db, convert_xml_to_db
+from .dedup import DUPLICATE_THRESHOLD, apply_merges, find_duplicates
+from .diff import count_changes, diff_phonebooks, patch_phonebook
+from .importer import import_csv_into_database
+from .formats import READ_FORMATS
+from .merge import CONFLICT_RULES, DEFAULT_CONFLICT_RULE, merge_phonebooks
+from .vcard import VCARD_VERSIONS, convert_xml_to_vcf, convert_vcf_to_xml, iter_vcf_contacts, write_vcards
+
+CONVERTERS = {
+    ("xml", "vcf"): convert_xml_to_vcf,
+    ("vcf", "xml"): convert_vcf_to_xml,
+    ("xml", "db"): convert_xml_to_db,
+    ("vcf", "db"): convert_vcf_to_db,
+    ("db", "xml"): convert_db_to_xml,
+    ("db", "vcf"): convert_db_to_vcf,
+}
+
+# Target of each source format when --to isn't given; databases are only converted on request
+DEFAULT_TARGETS = {"xml": "vcf", "vcf": "xml"}
+
+# Readers and writers of the phonebook files dedup rewrites in place, as (filename, contacts, groups) -> count
+READERS = {"xml": iter_xml_contacts, "vcf": iter_vcf_contacts}
+WRITERS = {"xml": write_xml_phonebook, "vcf": lambda filename, contacts, groups: write_vcards(filename, contacts)}
+
+
+def _source_format(path):
+    return os.path.splitext(path)[1].lower().lstrip(".")
+
+
+def collect_sources(paths, source_formats):
+    """Expand files and directory trees into a sorted list of convertible files."""
+    sources = []
+    for path in paths:
+        if os.path.isdir(path):
+            for dirpath, _, filenames in os.walk(path):
+                for name in filenames:
+                    if _source_format(name) in source_formats:
+                        sources.append((os.path.join(dirpath, name), path))
+        elif os.path.isfile(path):
+            sources.append((path, os.path.dirname(path)))
+        else:
+            raise FileNotFoundError(f"No such file or directory: {path}")
+    return sorted(sources)
+
+
+def plan_conversions(paths, target_format=None, output_dir=None):
+    """Return (source, source_format, target, target_format) tuples for every input.
+
+    Outputs sit next to their source unless ``output_dir`` is given, in which
+    case the layout of each input directory is mirrored underneath it.
+    """
+    if target_format:
+        source_formats = {src for src, dst in CONVERTERS if dst == target_format}
+    else:
+        source_formats = set(DEFAULT_TARGETS)
+
+    tasks = []
+    for source, base in collect_sources(paths, source_formats):
+        source_format = _source_format(source)
+        if source_format not in source_formats:
+            raise ValueError(f"Cannot convert {source}: expected one of {sorted(source_formats)}")
+        dest_format = target_format or DEFAULT_TARGETS[source_format]
+        stem = os.path.splitext(source)[0]
+        if output_dir:
+            stem = os.path.join(output_dir, os.path.relpath(stem, base or "."))
+        tasks.append((source, source_format, f"{stem}.{dest_format}", dest_format))
+    return tasks
+
+
+def convert_file(task, vcard_version="3.0"):
+    """Convert a single file; runs inside a worker process."""
+    source, source_format, target, target_format = task
+    start = time.perf_counter()
+    try:
+        target_dir = os.path.dirname(target)
+        if target_dir:
+            os.makedirs(target_dir, exist_ok=True)
+        options = {"version": vcard_version} if target_format == "vcf" else {}
+        count = CONVERTERS[(source_format, target_format)](source, target, **options)
+        return source, target, count, time.perf_counter() - start, None
+    except Exception as e:
+        return source, target, 0, time.perf_counter() - start, str(e)
+
+
+def run_convert(args):
+    tasks = plan_conversions(args.paths, args.to, args.output_dir)
+    if not tasks:
+        print("No phonebooks found to convert", file=sys.stderr)
+        return 1
+
+    jobs = max(1, min(args.jobs or os.cpu_count() or 1, len(tasks)))
+    convert = functools.partial(convert_file, vcard_version=args.vcard_version)
+    start = time.perf_counter()
+    total_contacts = 0
+    failures = 0
+
+    if jobs == 1:
+        results = map(convert, tasks)
+        pool = None
+    else:
+        pool = ProcessPoolExecutor(max_workers=jobs)
+        results = (future.result() for future in as_completed([pool.submit(convert, t) for t in tasks]))
+
+    try:
+        for source, target, count, elapsed, error in results:
+            if error:
+                failures += 1
+                print(f"FAILED {source}: {error}", file=sys.stderr)
+            else:
+                total_contacts += count
+                print(f"{source} -> {target}: {count} contacts in {elapsed:.3f}s")
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+    print(f"Converted {len(tasks) - failures}/{len(tasks)} files, {total_contacts} contacts "
+          f"in {time.perf_counter() - start:.3f}s using {jobs} job(s)")
+    return 1 if failures else 0
+
+
+def run_import(args):
+    start = time.perf_counter()
+    with ContactDatabase(args.database) as database:
+        try:
+            report = import_csv_into_database(args.csv, database, jobs=args.jobs or None, restart=args.restart)
+        except KeyboardInterrupt:
+            print("Import interrupted; run the same command again to resume it", file=sys.stderr)
+            return 130
+    print(report.summary())
+    print(f"Imported {args.csv} into {args.database} in {time.perf_counter() - start:.3f}s")
+    return 0
+
+
+def _describe(contact):
+    name = f"{contact.first_name} {contact.last_name}".strip() or "(no name)"
+    return f"{name} <{contact.phone_number}>" if contact.phone_number else name
+
+
+def run_dedup(args):
+    start = time.perf_counter()
+    source_format = _source_format(args.phonebook)
+    if source_format == "db":
+        phonebook = ContactDatabase(args.phonebook)
+    elif source_format in READERS:
+        # Read into a registry so the rewritten file keeps its group ids and every category
+        groups = GroupRegistry.from_names(DEFAULT_GROUPS)
+        phonebook = ContactStore(READERS[source_format](args.phonebook, groups))
+    else:
+        raise ValueError(f"Cannot deduplicate {args.phonebook}: expected an .xml, .vcf or .db phonebook")
+
+    try:
+        suggestions = find_duplicates(phonebook, args.threshold)
+        for suggestion in suggestions:
+            print(f"{suggestion.score:3d}  {' + '.join(map(_describe, suggestion.contacts))} -> "
+                  f"{_describe(suggestion.merged)}")
+        duplicates = sum(len(suggestion.contacts) for suggestion in suggestions)
+        print(f"Found {len(suggestions)} groups of duplicates ({duplicates} contacts) "
+              f"in {time.perf_counter() - start:.3f}s")
+        if args.apply and suggestions:
+            apply_merges(phonebook, suggestions)
+            if source_format != "db":
+                WRITERS[source_format](args.phonebook, phonebook, groups)
+            print(f"Merged them into {len(suggestions)} contacts in {args.phonebook}")
+    finally:
+        if source_format == "db":
+            phonebook.close()
+    return 0
+
+
+def run_merge(args):
+    start = time.perf_counter()
+    # Expanded path by path: the order of the arguments is the order of precedence
+    sources = [source for path in args.sources for source, _ in collect_sources([path], READ_FORMATS)]
+    if not sources:
+        print("No phonebooks found to merge", file=sys.stderr)
+        return 1
+    report = merge_phonebooks(sources, args.output, args.rule)
+    print(report.summary())
+    print(f"Merged {len(sources)} phonebooks into {args.output} in {time.perf_counter() - start:.3f}s")
+    return 0
+
+
+def _describe_record(record):
+    first_name, last_name, _, phone_number = record[:4]
+    name = f"{first_name} {last_name}".strip() or "(no name)"
+    return f"{name} <{phone_number}>" if phone_number else name
+
+
+def run_diff(args):
+    start = time.perf_counter()
+    entries = diff_phonebooks(args.old, args.new, args.output)
+    if not args.quiet:
+        for operation, old, new in entries:
+            if operation == "add":
+                print(f"+ {_describe_record(new)}")
+            elif operation == "delete":
+                print(f"- {_describe_record(old)}")
+            else:
+                print(f"~ {_describe_record(old)} -> {_describe_record(new)}")
+    changes = count_changes(entries)
+    print(f"{changes['added']} added, {changes['modified']} modified, {changes['removed']} removed "
+          f"in {time.perf_counter() - start:.3f}s")
+    if args.output:
+        print(f"Wrote the changes to {args.output}")
+    return 0
+
+
+def run_patch(args):
+    start = time.perf_counter()
+    output = args.output or args.phonebook
+    count, missed = patch_phonebook(args.phonebook, args.patch, output)
+    print(f"Patched {args.phonebook} into {output}: {count} contacts in {time.perf_counter() - start:.3f}s")
+    if missed:
+        print(f"{missed} modified or removed contacts were not in {args.phonebook}; "
+              "modified ones were added as they are now", file=sys.stderr)
+    return 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="phonebooker", description="PhoneBooker Pro command line tools")
+    parser.add_argument("--trace", metavar="FILE",
+                        help="Write timings and counters to FILE: a Chrome trace, or JSON lines if it ends in .jsonl "
+                             f"(also enabled by {trace.TRACE_ENV}=FILE)")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    convert = subparsers.add_parser("convert", help="Convert phonebooks between XML, VCF and SQLite databases")
+    convert.add_argument("paths", nargs="+", help="Files or directories to convert (directories are searched recursively)")
+    convert.add_argument("--to", choices=["xml", "vcf", "db"],
+                         help="Target format; by default XML becomes VCF and VCF becomes XML")
+    convert.add_argument("--vcard-version", choices=VCARD_VERSIONS, default="3.0",
+                         help="vCard version of VCF output (default: 3.0)")
+    convert.add_argument("-o", "--output-dir", help="Write converted files here instead of next to the sources")
+    convert.add_argument("-j", "--jobs", type=int, default=0,
+                         help="Number of worker processes (default: one per CPU)")
+    convert.set_defaults(func=run_convert)
+
+    import_ = subparsers.add_parser("import", help="Import a CSV export into a phonebook database")
+    import_.add_argument("csv", help="CSV export in the resources/Template.csv layout")
+    import_.add_argument("database", help="Phonebook database to add the contacts to (created if missing)")
+    import_.add_argument("-j", "--jobs", type=int, default=0,
+                         help="Number of worker processes parsing rows (default: one per CPU for large files)")
+    import_.add_argument("--restart", action="store_true",
+                         help="Start from the top even if an earlier import of this file was interrupted")
+    import_.set_defaults(func=run_import)
+
+    dedup = subparsers.add_parser("dedup", help="Find contacts that are likely duplicates and optionally merge them")
+    dedup.add_argument("phonebook", help="XML, VCF or database phonebook")
+    dedup.add_argument("--threshold", type=int, default=DUPLICATE_THRESHOLD,
+                       help=f"Lowest similarity, 0-100, of contacts taken as duplicates (default: {DUPLICATE_THRESHOLD})")
+    dedup.add_argument("--apply", action="store_true", help="Merge every group found and save the phonebook")
+    dedup.set_defaults(func=run_dedup)
+
+    merge = subparsers.add_parser("merge",
+                                  help="Merge phonebooks into one, dropping contacts with the same name and number")
+    merge.add_argument("sources", nargs="+",
+                       help="XML, VCF, CSV or database phonebooks, or directories of them, in order of precedence")
+    merge.add_argument("-o", "--output", required=True, help="XML, VCF or database phonebook to write")
+    merge.add_argument("--rule", choices=list(CONFLICT_RULES), default=DEFAULT_CONFLICT_RULE,
+                       help="How contacts with the same name and number are merged: keep the first or last "
+                            "source's, or combine their groups and fill in a missing company "
+                            f"(default: {DEFAULT_CONFLICT_RULE})")
+    merge.set_defaults(func=run_merge)
+
+    diff = subparsers.add_parser("diff", help="List the contacts added, modified and removed between two phonebooks")
+    diff.add_argument("old", help="Earlier version: XML, VCF, CSV or database phonebook")
+    diff.add_argument("new", help="Later version, in any of the same formats")
+    diff.add_argument("-o", "--output", help="Save the changes as a patch file for the patch command")
+    diff.add_argument("-q", "--quiet", action="store_true", help="Only print the number of changes")
+    diff.set_defaults(func=run_diff)
+
+    patch = subparsers.add_parser("patch", help="Apply a patch file saved by diff to a copy of the old phonebook")
+    patch.add_argument("phonebook", help="XML, VCF, CSV or database phonebook to patch")
+    patch.add_argument("patch", help="Patch file saved by diff --output")
+    patch.add_argument("-o", "--output",
+                       help="XML, VCF or database phonebook to write instead of patching the phonebook in place")
+    patch.set_defaults(func=run_patch)
+
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if args.trace:
+        trace.enable(args.trace)
+    try:
+        with trace.span(args.command):
+            return args.func(args)
+    except (OSError, ValueError, sqlite3.Error) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
@@ -0,0 +1,698 @@
+"""Qt-free phonebook model, parsing helpers and file I/O.
+
+Everything in here must stay importable without PyQt6 so the converters can
+run headless (see ``phonebooker.cli``).
+"""
+import bisect
+import contextlib
+import gc
+import heapq
+import itertools
+import os
+import sys
+import unicodedata
+from operator import itemgetter
+
+from . import trace
+from .names import parse_complex_name
+from .phones import digits, normalize_phone
+
+DEFAULT_GROUPS = ["Blocklist", "Allowlist", "Work", "Friends", "Family", "Blacklist", "Whitelist"]
+
+# Group ids in the XML phonebook format start at 4
+GROUP_ID_OFFSET = 4
+
+# How many contacts or rows pass between calls to a progress callback
+PROGRESS_INTERVAL = 1000
+
+# Groups every contact imported from a CSV export starts in
+CSV_IMPORT_GROUPS = ("Work",)
+
+# Characters of serialized contacts collected before each write to disk
+WRITE_BUFFER_SIZE = 1 << 20
+
+# Extensions of phonebook databases (see phonebooker.database)
+DATABASE_SUFFIXES = (".db", ".sqlite")
+
+
+class OperationCancelled(Exception):
+    """Raised by a progress callback to abandon a load, save or import part way through."""
+
+
+@contextlib.contextmanager
+def gc_paused():
+    """Turn cyclic GC off for the duration: while millions of contacts are created, its passes are wasted work."""
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+
+
+def is_database_file(filename):
+    """Whether filename names a phonebook database; kept here so checking doesn't load sqlite3."""
+    return filename.lower().endswith(DATABASE_SUFFIXES)
+
+
+def get_phone_type(phone_number):
+    return normalize_phone(phone_number).phone_type
+
+def format_phone_number(phone_number):
+    return normalize_phone(phone_number).number
+
+class GroupTable:
+    """Assigns every group name a bit so a contact's groups fit in a single int."""
+
+    def __init__(self, names=()):
+        self.names = []
+        self._bits = {}
+        self._decoded = {0: ()}
+        for name in names:
+            self.bit(name)
+
+    def bit(self, name):
+        """Return the bit for name, registering it if it is new."""
+        bit = self._bits.get(name)
+        if bit is None:
+            bit = 1 << len(self.names)
+            self.names.append(sys.intern(name))
+            self._bits[name] = bit
+        return bit
+
+    def mask(self, names):
+        mask = 0
+        for name in names:
+            mask |= self.bit(name)
+        return mask
+
+    def contains(self, mask, name):
+        """Bit test for membership of name in mask; unknown names are never members."""
+        return bool(mask & self._bits.get(name, 0))
+
+    def decode(self, mask):
+        """Group names for mask, in table order."""
+        names = self._decoded.get(mask)
+        if names is None:
+            names = tuple(name for i, name in enumerate(self.names) if mask >> i & 1)
+            self._decoded[mask] = names
+        return names
+
+
+# Shared by every Contact; the default groups get the lowest bits
+GROUP_TABLE = GroupTable(DEFAULT_GROUPS)
+
+
+class GroupRegistry:
+    """The group table of one phonebook: group ids and names, each looked up from the other in one dict access.
+
+    XML phonebooks list their groups as <pbgroup> id and name pairs and
+    refer to them by id. A registry filled from a file keeps the file's ids,
+    so saving writes the same ids back. Groups the file didn't have are
+    given the id after the highest in use, and never one below
+    GROUP_ID_OFFSET. Iterating gives the group names in table order.
+    """
+
+    def __init__(self, entries=()):
+        self._names = {}
+        self._ids = {}
+        self._next_id = GROUP_ID_OFFSET
+        for group_id, name in entries:
+            self.assign(group_id, name)
+
+    @classmethod
+    def from_names(cls, names):
+        """A registry numbering names from GROUP_ID_OFFSET, as phonebooks without a group table are read."""
+        return cls(enumerate(names, start=GROUP_ID_OFFSET))
+
+    def __len__(self):
+        return len(self._ids)
+
+    def __iter__(self):
+        return iter(self._ids)
+
+    def __contains__(self, name):
+        return name in self._ids
+
+    def __eq__(self, other):
+        return isinstance(other, GroupRegistry) and self._names == other._names
+
+    def __repr__(self):
+        # Stable for equal registries; the sidecar cache hashes it
+        return f"GroupRegistry({list(self.items())!r})"
+
+    def items(self):
+        """(group id, name) pairs in table order."""
+        return self._names.items()
+
+    def name(self, group_id):
+        """The name of the group with group_id, or None if there is none."""
+        return self._names.get(group_id)
+
+    def id(self, name):
+        """The id of the group called name, or None if there is none."""
+        return self._ids.get(name)
+
+    def assign(self, group_id, name):
+        """Record the group table entry group_id: name.
+
+        A table naming two ids the same gives both ids that name, and the
+        name the first id.
+        """
+        previous = self._names.get(group_id)
+        if previous is not None and self._ids.get(previous) == group_id:
+            del self._ids[previous]
+        self._names[group_id] = name
+        self._ids.setdefault(name, group_id)
+        self._next_id = max(self._next_id, group_id + 1)
+
+    def add(self, name):
+        """The id of the group called name, creating the group if it is new."""
+        group_id = self._ids.get(name)
+        if group_id is None:
+            group_id = self._next_id
+            self.assign(group_id, name)
+        return group_id
+
+    def add_contact_groups(self, contacts):
+        """Add every group one of contacts is in."""
+        used = 0
+        for contact in contacts:
+            used |= contact.group_mask
+        for name in GROUP_TABLE.decode(used):
+            self.add(name)
+
+    def replace(self, entries):
+        """Make the registry hold entries, (group id, name) pairs, and nothing else."""
+        self._names.clear()
+        self._ids.clear()
+        self._next_id = GROUP_ID_OFFSET
+        for group_id, name in entries:
+            self.assign(group_id, name)
+
+    def copy(self):
+        return GroupRegistry(self.items())
+
+
+def group_registry(groups):
+    """groups as a GroupRegistry: itself if it is one, else a registry numbering a list of names."""
+    return groups if isinstance(groups, GroupRegistry) else GroupRegistry.from_names(groups)
+
+
+class Contact:
+    """A phonebook entry.
+
+    Slotted to keep large phonebooks small: group membership is stored as a
+    bitmask over GROUP_TABLE and phone types and companies are interned, since
+    they repeat across most of a directory.
+    """
+
+    __slots__ = ("contact_id", "first_name", "last_name", "phone_type", "phone_number", "group_mask", "company")
+
+    def __init__(self, first_name, last_name, phone_type, phone_number, groups, company=""):
+        self.contact_id = None  # assigned by ContactStore
+        self.first_name = first_name
+        self.last_name = last_name
+        self.phone_type = sys.intern(phone_type)
+        self.phone_number = phone_number
+        self.group_mask = GROUP_TABLE.mask(groups)
+        self.company = sys.intern(company)
+
+    @property
+    def groups(self):
+        return GROUP_TABLE.decode(self.group_mask)
+
+    @groups.setter
+    def groups(self, groups):
+        self.group_mask = GROUP_TABLE.mask(groups)
+
+    def in_group(self, name):
+        return GROUP_TABLE.contains(self.group_mask, name)
+
+    @classmethod
+    def from_csv_row(cls, name, phone_number, phone=None):
+        """Contact for a CSV row; phone is normalize_phone(phone_number) if the caller already has it."""
+        first_name, last_name = parse_complex_name(name)
+        if phone is None:
+            phone = normalize_phone(phone_number)
+        return cls(first_name, last_name, phone.phone_type, phone.number, CSV_IMPORT_GROUPS, "")
+
+
+def collation_key(text):
+    """Unicode-normalized, casefolded form of text for sorting."""
+    return unicodedata.normalize("NFKC", text).casefold() if text else ''
+
+
+def contact_sort_key(contact):
+    """Sort key for the contact list: last name, then first name."""
+    return (collation_key(contact.last_name), collation_key(contact.first_name))
+
+
+# Process-wide so contact ids never collide, even between stores
+_contact_ids = itertools.count(1)
+
+
+class ContactStore:
+    """Contacts kept sorted by contact_sort_key, each addressed by a stable contact_id.
+
+    Sort keys are computed once per contact and kept in a list parallel to
+    the contacts, so adding, replacing or removing one contact is a binary
+    search plus a list insert, and extend() merges a sorted batch in one pass.
+    Keys end with the contact id, which makes them unique.
+
+    revision goes up with every change, so callers can tell whether the
+    store changed since they last looked (for example since the last save).
+    """
+
+    def __init__(self, contacts=()):
+        self._contacts = []
+        self._keys = []
+        self._key_by_id = {}
+        self.revision = 0
+        self.extend(contacts)
+
+    def __len__(self):
+        return len(self._contacts)
+
+    def __iter__(self):
+        return iter(self._contacts)
+
+    def __getitem__(self, index):
+        return self._contacts[index]
+
+    def __contains__(self, contact):
+        index = self.index_of(contact.contact_id)
+        return index >= 0 and self._contacts[index] is contact
+
+    def _key(self, contact):
+        if contact.contact_id is None:
+            contact.contact_id = next(_contact_ids)
+        return contact_sort_key(contact) + (contact.contact_id,)
+
+    def items(self):
+        """(sort key, contact) pairs in order."""
+        return zip(self._keys, self._contacts)
+
+    def key_of(self, contact_id):
+        return self._key_by_id.get(contact_id)
+
+    def index_of(self, contact_id):
+        """Position of the contact with contact_id, or -1 if it isn't stored."""
+        key = self._key_by_id.get(contact_id)
+        if key is None:
+            return -1
+        return bisect.bisect_left(self._keys, key)
+
+    def get(self, contact_id):
+        index = self.index_of(contact_id)
+        return self._contacts[index] if index >= 0 else None
+
+    def insertion_index(self, contact):
+        """Position add() will put contact at; assigns its contact_id if it has none."""
+        return bisect.bisect_left(self._keys, self._key(contact))
+
+    def add(self, contact):
+        key = self._key(contact)
+        index = bisect.bisect_left(self._keys, key)
+        self._keys.insert(index, key)
+        self._contacts.insert(index, contact)
+        self._key_by_id[contact.contact_id] = key
+        self.revision += 1
+        return index
+
+    def remove(self, contact_id):
+        index = self.index_of(contact_id)
+        if index < 0:
+            raise KeyError(contact_id)
+        del self._keys[index]
+        contact = self._contacts.pop(index)
+        del self._key_by_id[contact_id]
+        self.revision += 1
+        return contact
+
+    def remove_many(self, contact_ids):
+        """Remove every stored contact whose id is in the set contact_ids in one pass; returns them."""
+        removed = [contact for contact in self._contacts if contact.contact_id in contact_ids]
+        if not removed:
+            return removed
+        kept = [(key, contact) for key, contact in zip(self._keys, self._contacts)
+                if contact.contact_id not in contact_ids]
+        self._keys = [key for key, _ in kept]
+        self._contacts = [contact for _, contact in kept]
+        for contact in removed:
+            del self._key_by_id[contact.contact_id]
+        self.revision += 1
+        return removed
+
+    def replace(self, contact_id, contact):
+        """Swap in a new version of a contact, keeping its id; returns its new position."""
+        self.remove(contact_id)
+        contact.contact_id = contact_id
+        return self.add(contact)
+
+    def extend(self, contacts):
+        self.merge_items(sorted(((self._key(contact), contact) for contact in contacts), key=itemgetter(0)))
+
+    def would_append(self, items):
+        """Whether merge_items(items) only adds contacts after the current last one."""
+        return not self._keys or not items or items[0][0] > self._keys[-1]
+
+    def merge_items(self, items):
+        """Add a list of (sort key, contact) pairs that is already sorted, like another store's items().
+
+        Pairs sorting after every stored contact are appended; anything else
+        is heap-merged in a single pass. This lets a store filled on a worker
+        thread be handed over in chunks without re-sorting.
+        """
+        if not items:
+            return
+        self.revision += 1
+        if self.would_append(items):
+            for key, contact in items:
+                self._keys.append(key)
+                self._contacts.append(contact)
+                self._key_by_id[key[-1]] = key
+            return
+        keys = []
+        ordered = []
+        for key, contact in heapq.merge(zip(self._keys, self._contacts), items, key=itemgetter(0)):
+            keys.append(key)
+            ordered.append(contact)
+        self._keys = keys
+        self._contacts = ordered
+        self._key_by_id = {key[-1]: key for key in keys}
+
+    def clear(self):
+        self._contacts = []
+        self._keys = []
+        self._key_by_id = {}
+        self.revision += 1
+
+    def set_contacts(self, contacts):
+        self.clear()
+        self.extend(contacts)
+
+
+def phone_key(phone_number):
+    """Normalized phone number used to detect duplicates: digits only.
+
+    Stored numbers are already normalized; raw numbers from an import are
+    keyed with normalize_phone(raw).key, which gives the same key.
+    """
+    return digits(phone_number)
+
+
+class PhoneIndex:
+    """Hash index of the phone numbers in a contact list for O(1) duplicate checks."""
+
+    def __init__(self, contacts=()):
+        self._counts = {}
+        self.rebuild(contacts)
+
+    def __contains__(self, key):
+        return key in self._counts
+
+    def __len__(self):
+        return len(self._counts)
+
+    def rebuild(self, contacts):
+        self._counts.clear()
+        for contact in contacts:
+            self.add(contact)
+
+    def add(self, contact):
+        key = phone_key(contact.phone_number)
+        # Contacts without a number are never duplicates of each other
+        if key:
+            self._counts[key] = self._counts.get(key, 0) + 1
+
+    def remove(self, contact):
+        key = phone_key(contact.phone_number)
+        count = self._counts.get(key)
+        if count is None:
+            return
+        if count > 1:
+            self._counts[key] = count - 1
+        else:
+            del self._counts[key]
+
+    def replace(self, old_contact, new_contact):
+        self.remove(old_contact)
+        self.add(new_contact)
+
+
+class ImportReport:
+    """Outcome of a CSV import."""
+
+    def __init__(self):
+        self.added = 0
+        self.existing_duplicates = 0
+        self.file_duplicates = 0
+        self.skipped_rows = 0
+        self.resumed_rows = 0  # rows imported before an interruption, when an import was resumed
+
+    @property
+    def duplicates(self):
+        return self.existing_duplicates + self.file_duplicates
+
+    def summary(self):
+        lines = [
+            f"• {self.added} contacts added",
+            f"• {self.existing_duplicates} duplicates of existing contacts skipped",
+            f"• {self.file_duplicates} duplicates within the file skipped",
+        ]
+        if self.skipped_rows:
+            lines.append(f"• {self.skipped_rows} incomplete rows skipped")
+        if self.resumed_rows:
+            lines.append(f"• resumed after {self.resumed_rows} rows imported earlier (counted above)")
+        return "\n".join(lines)
+
+
+def _contact_from_element(contact_elem, group_names):
+    """Build a Contact from a <Contact> element in a single pass over its children.
+
+    group_names maps group ids to names; groups with other ids are dropped.
+    """
+    first_name = last_name = company = None
+    phone_type = "Mobile"
+    phone_number = None
+    contact_groups = []
+    seen_phone = False
+
+    for child in contact_elem:
+        tag = child.tag
+        if tag == "FirstName":
+            if first_name is None:
+                first_name = child.text or ""
+        elif tag == "LastName":
+            if last_name is None:
+                last_name = child.text or ""
+        elif tag == "Phone":
+            if not seen_phone:
+                seen_phone = True
+                phone_type = child.get("type", "Mobile")
+                number_elem = child.find("phonenumber")
+                if number_elem is not None:
+                    phone_number = number_elem.text
+        elif tag == "Group":
+            name = group_names.get(int(child.text))
+            if name is not None:
+                contact_groups.append(name)
+        elif tag == "Company":
+            if company is None:
+                company = child.text or ""
+
+    return Contact(first_name or "", last_name or "", phone_type, phone_number or "",
+                   contact_groups, company or "")
+
+
+def _pbgroup_entry(pbgroup_elem):
+    """The (group id, name) of a <pbgroup> element, or None if it has no numeric id."""
+    try:
+        group_id = int(pbgroup_elem.findtext("id"))
+    except (TypeError, ValueError):
+        return None
+    return group_id, pbgroup_elem.findtext("name") or ""
+
+
+def iter_xml_contacts(filename, groups=DEFAULT_GROUPS, progress=None):
+    """Stream Contact objects out of an XML phonebook.
+
+    Group ids are looked up in the file's own <pbgroup> table. A file
+    without one is read with groups numbered from GROUP_ID_OFFSET, as it
+    was written. groups is a list of names or a GroupRegistry; a registry
+    is replaced by the file's table, if it has one, so the caller can save
+    the contacts with the same ids.
+
+    The file is parsed incrementally and every <Contact> element is discarded as
+    soon as it has been turned into a Contact, so peak memory does not depend
+    on the size of the file. progress, if given, is called with
+    (bytes read, file size) as the file is parsed.
+    """
+    # Imported here: most runs of the app never parse XML, and it is slow to import
+    from xml.etree.ElementTree import iterparse
+
+    registry = group_registry(groups)
+    # The file's group table; it comes before the contacts
+    table = []
+    group_names = None
+
+    with open(filename, 'rb') as source:
+        total = os.fstat(source.fileno()).st_size
+        count = 0
+        depth = 0
+        root = None
+        for event, elem in iterparse(source, events=("start", "end")):
+            if event == "start":
+                if root is None:
+                    root = elem
+                depth += 1
+                continue
+
+            depth -= 1
+            # Only direct children of the root are contacts, like root.findall("Contact")
+            if depth == 1:
+                if elem.tag == "Contact":
+                    if group_names is None:
+                        if table:
+                            registry.replace(table)
+                        group_names = dict(registry.items())
+                    yield _contact_from_element(elem, group_names)
+                    count += 1
+                    if progress is not None and count % PROGRESS_INTERVAL == 0:
+                        progress(source.tell(), total)
+                elif elem.tag == "pbgroup" and group_names is None:
+                    entry = _pbgroup_entry(elem)
+                    if entry is not None:
+                        table.append(entry)
+                root.clear()
+
+        if table and group_names is None:
+            registry.replace(table)
+        trace.count("contacts_read", count)
+        if progress is not None:
+            progress(total, total)
+
+
+def fsync_directory(directory):
+    """Flush a rename or new file in directory to disk, where the platform allows opening directories."""
+    try:
+        fd = os.open(directory or os.curdir, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+@trace.traced("write_contacts")
+def write_contacts(filename, contacts, serialize, progress=None, header="", footer=""):
+    """Stream serialize(contact) for every contact into filename and return the number written.
+
+    Serialized contacts are collected and written in chunks of about
+    WRITE_BUFFER_SIZE characters, so a large export makes few write calls.
+    contacts can be any iterable; it must have a length if progress is given,
+    which is then called with (contacts written, total).
+
+    The file is replaced atomically: everything goes to filename + ".tmp",
+    which is fsynced and renamed over filename only once complete. If
+    progress cancels or writing fails, the temporary file is removed and
+    filename is left as it was.
+    """
+    total = len(contacts) if progress is not None else None
+    directory = os.path.dirname(filename)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    temp_filename = filename + ".tmp"
+    count = 0
+    try:
+        with open(temp_filename, 'w', encoding='utf-8', newline='') as output:
+            buffer = [header]
+            buffered = len(header)
+            for count, contact in enumerate(contacts, start=1):
+                text = serialize(contact)
+                buffer.append(text)
+                buffered += len(text)
+                if buffered >= WRITE_BUFFER_SIZE:
+                    output.write("".join(buffer))
+                    buffer.clear()
+                    buffered = 0
+                if progress is not None and count % PROGRESS_INTERVAL == 0:
+                    progress(count, total)
+            buffer.append(footer)
+            output.write("".join(buffer))
+            output.flush()
+            os.fsync(output.fileno())
+        if os.path.exists(filename):
+            # Keep the permissions of the file being replaced
+            os.chmod(temp_filename, os.stat(filename).st_mode & 0o7777)
+        os.replace(temp_filename, filename)
+    except BaseException:
+        if os.path.exists(temp_filename):
+            os.remove(temp_filename)
+        raise
+    fsync_directory(directory)
+    trace.count("contacts_written", count)
+    if progress is not None:
+        progress(total, total)
+    return count
+
+
+_XML_TEXT_ESCAPES = str.maketrans({"&": "&amp;", "<": "&lt;", ">": "&gt;"})
+_XML_ATTRIBUTE_ESCAPES = str.maketrans({"&": "&amp;", "<": "&lt;", ">": "&gt;", '"': "&quot;",
+                                        "\r": "&#13;", "\n": "&#10;", "\t": "&#09;"})
+
+
+def _escape_xml_attribute(value):
+    return value.translate(_XML_ATTRIBUTE_ESCAPES)
+
+
+def _xml_element(tag, text):
+    """A text-only element, written exactly as ElementTree would write it."""
+    if not text:
+        return f"<{tag} />"
+    if "&" in text or "<" in text or ">" in text:
+        text = text.translate(_XML_TEXT_ESCAPES)
+    return f"<{tag}>{text}</{tag}>"
+
+
+def write_xml_phonebook(filename, contacts, groups=DEFAULT_GROUPS, progress=None):
+    """Save contacts as an XML phonebook and return the number written.
+
+    groups is a list of names, numbered from GROUP_ID_OFFSET, or a
+    GroupRegistry, whose ids are kept; it becomes the <pbgroup> table.
+    Groups of contacts in a list or ContactStore that aren't in it are added
+    to it first. Other contacts, such as an iterator that can only be read
+    once, are only put in the groups given, so register theirs beforehand.
+
+    Contacts are serialized one <Contact> element at a time, straight to
+    text, rather than as one document tree. progress is passed on to
+    write_contacts.
+    """
+    registry = group_registry(groups)
+    if isinstance(contacts, (list, tuple, ContactStore)):
+        registry.add_contact_groups(contacts)
+    # The <Group> elements of each group mask, built once per mask
+    group_elems = {}
+    group_tags = {group: f"<Group>{registry.id(group)}</Group>" for group in registry}
+
+    header = "<?xml version='1.0' encoding='UTF-8'?>\n<AddressBook>" + "".join(
+        f"<pbgroup>{_xml_element('id', str(group_id))}{_xml_element('name', group)}</pbgroup>"
+        for group_id, group in registry.items())
+
+    def serialize(contact):
+        elems = group_elems.get(contact.group_mask)
+        if elems is None:
+            elems = group_elems[contact.group_mask] = "".join(
+                [group_tags[group] for group in contact.groups if group in group_tags])
+        return (f"<Contact>{_xml_element('FirstName', contact.first_name)}"
+                f"{_xml_element('LastName', contact.last_name)}"
+                f"<Phone type=\"{_escape_xml_attribute(contact.phone_type)}\">"
+                f"{_xml_element('phonenumber', contact.phone_number)}</Phone>"
+                f"{elems}{_xml_element('Company', contact.company)}</Contact>")
+
+    return write_contacts(filename, contacts, serialize, progress, header, "</AddressBook>")
@@ -0,0 +1,498 @@
+"""SQLite storage for phonebooks too large to keep in memory.
+
+A phonebook database (``.db``) holds one row per contact, with indexed
+columns for the sort order and the phone key, and an FTS5 trigram index
+over every searchable field. Opening one only counts its rows, the GUI
+pages through it PAGE_SIZE contacts at a time, and searches are answered
+by the full-text index instead of by scanning. Edits are committed as they
+are made. Imports and exports are bulk operations: XML and VCF contacts
+are streamed in with executemany() in a single transaction, CSV imports
+commit chunk by chunk with a checkpoint (see phonebooker.importer), and
+exports stream rows back out in sort order.
+
+Searches match by substring, in line with the "Phone Only" search of an
+in-memory phonebook. Fuzzy scoring is not available here.
+"""
+import itertools
+import os
+import re
+import sqlite3
+from collections import namedtuple
+
+from . import trace
+from .core import (DEFAULT_GROUPS, Contact, GroupRegistry, collation_key, fsync_directory, group_registry,
+                   iter_xml_contacts, phone_key, write_xml_phonebook)
+from .vcard import iter_vcf_contacts, write_vcards
+
+# Contacts fetched per query when paging through a database
+PAGE_SIZE = 500
+
+# Contacts inserted per executemany() call of a bulk insert
+INSERT_BATCH_SIZE = 10000
+
+# Column of each search field; "groups" is an SQL keyword
+FIELD_COLUMNS = {
+    "first_name": "first_name",
+    "last_name": "last_name",
+    "phone_type": "phone_type",
+    "phone_number": "phone_number",
+    "groups": "group_names",
+    "company": "company",
+}
+
+# Separates the groups of a contact in its group_names column. A separator or
+# backslash inside a group name is escaped with a backslash, so databases
+# written before escaping read the same unless a name holds a backslash
+GROUP_SEPARATOR = ", "
+
+_COLUMNS = "first_name, last_name, phone_type, phone_number, group_names, company"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS contacts (
+    id INTEGER PRIMARY KEY,
+    first_name TEXT NOT NULL,
+    last_name TEXT NOT NULL,
+    phone_type TEXT NOT NULL,
+    phone_number TEXT NOT NULL,
+    group_names TEXT NOT NULL,
+    company TEXT NOT NULL,
+    sort_last TEXT NOT NULL,
+    sort_first TEXT NOT NULL,
+    phone_key TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS contacts_sort ON contacts (sort_last, sort_first, id);
+CREATE INDEX IF NOT EXISTS contacts_phone_key ON contacts (phone_key);
+CREATE TABLE IF NOT EXISTS import_checkpoints (
+    source TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    rows INTEGER NOT NULL,
+    first_id INTEGER NOT NULL,
+    added INTEGER NOT NULL,
+    existing_duplicates INTEGER NOT NULL,
+    file_duplicates INTEGER NOT NULL,
+    skipped_rows INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS phonebook_groups (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL
+);
+"""
+
+_FTS_SCHEMA = f"""
+CREATE VIRTUAL TABLE IF NOT EXISTS contacts_fts USING fts5(
+    {_COLUMNS}, content='contacts', content_rowid='id', tokenize='trigram'
+);
+"""
+
+# Keep the external content FTS table in step with contacts. Run one statement at a time:
+# executescript() would commit the transaction of a bulk insert.
+_FTS_TRIGGERS = (
+    f"""CREATE TRIGGER IF NOT EXISTS contacts_fts_insert AFTER INSERT ON contacts BEGIN
+        INSERT INTO contacts_fts (rowid, {_COLUMNS})
+        VALUES (new.id, new.first_name, new.last_name, new.phone_type, new.phone_number, new.group_names,
+                new.company);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS contacts_fts_delete AFTER DELETE ON contacts BEGIN
+        INSERT INTO contacts_fts (contacts_fts, rowid, {_COLUMNS})
+        VALUES ('delete', old.id, old.first_name, old.last_name, old.phone_type, old.phone_number,
+                old.group_names, old.company);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS contacts_fts_update AFTER UPDATE ON contacts BEGIN
+        INSERT INTO contacts_fts (contacts_fts, rowid, {_COLUMNS})
+        VALUES ('delete', old.id, old.first_name, old.last_name, old.phone_type, old.phone_number,
+                old.group_names, old.company);
+        INSERT INTO contacts_fts (rowid, {_COLUMNS})
+        VALUES (new.id, new.first_name, new.last_name, new.phone_type, new.phone_number, new.group_names,
+                new.company);
+    END""",
+)
+
+_DROP_FTS_TRIGGERS = (
+    "DROP TRIGGER IF EXISTS contacts_fts_insert",
+    "DROP TRIGGER IF EXISTS contacts_fts_delete",
+    "DROP TRIGGER IF EXISTS contacts_fts_update",
+)
+
+_SELECT = f"SELECT id, {_COLUMNS} FROM contacts"
+_ORDER = " ORDER BY sort_last, sort_first, id"
+_INSERT = (f"INSERT INTO contacts ({_COLUMNS}, sort_last, sort_first, phone_key) "
+           f"VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)")
+_UPDATE = ("UPDATE contacts SET first_name = ?, last_name = ?, phone_type = ?, phone_number = ?, "
+           "group_names = ?, company = ?, sort_last = ?, sort_first = ?, phone_key = ? WHERE id = ?")
+
+# Progress of an interrupted CSV import (see phonebooker.importer): the source file as it was, the rows
+# taken in, the last contact id before the import began and the report counts so far
+ImportCheckpoint = namedtuple("ImportCheckpoint", "source size mtime_ns rows first_id added existing_duplicates "
+                                                  "file_duplicates skipped_rows")
+
+# A WHERE clause and its parameters, as returned by ContactDatabase.search
+ContactFilter = namedtuple("ContactFilter", "where params")
+
+MATCH_ALL = ContactFilter("1", ())
+
+
+def _join_groups(groups):
+    """The group_names column text of groups."""
+    return GROUP_SEPARATOR.join(group.replace("\\", "\\\\").replace(GROUP_SEPARATOR, "\\" + GROUP_SEPARATOR)
+                                for group in groups)
+
+
+def _split_groups(group_names):
+    """The groups whose group_names column text is group_names; the inverse of _join_groups."""
+    if "\\" not in group_names:
+        return group_names.split(GROUP_SEPARATOR)
+    groups = []
+    current = []
+    i = 0
+    while i < len(group_names):
+        if group_names[i] == "\\" and i + 1 < len(group_names):
+            current.append(group_names[i + 1])
+            i += 2
+        elif group_names.startswith(GROUP_SEPARATOR, i):
+            groups.append("".join(current))
+            current = []
+            i += len(GROUP_SEPARATOR)
+        else:
+            current.append(group_names[i])
+            i += 1
+    groups.append("".join(current))
+    return groups
+
+
+def _row(contact):
+    return (contact.first_name, contact.last_name, contact.phone_type, contact.phone_number,
+            _join_groups(contact.groups), contact.company,
+            collation_key(contact.last_name), collation_key(contact.first_name), phone_key(contact.phone_number))
+
+
+def _contact(row):
+    contact_id, first_name, last_name, phone_type, phone_number, group_names, company = row
+    contact = Contact(first_name, last_name, phone_type, phone_number,
+                      _split_groups(group_names) if group_names else (), company)
+    contact.contact_id = contact_id
+    return contact
+
+
+_LIKE_SPECIAL = re.compile(r"[%_\\]")
+
+_FTS_MATCH = "SELECT rowid FROM contacts_fts WHERE contacts_fts MATCH ?"
+
+
+def _fts_query(text, columns):
+    """FTS5 query for text anywhere in columns, quoted as a phrase so no character is special."""
+    return "{" + " ".join(columns) + "} : \"" + text.replace('"', '""') + '"'
+
+
+class ContactDatabase:
+    """A phonebook stored in SQLite, addressed like a ContactStore by contact_id (the row id).
+
+    len() and iteration (in sort order) make a database a drop-in source
+    for write_xml_phonebook and write_vcards. A connection belongs to the
+    thread that opened it, so background tasks open their own
+    ContactDatabase on the same file; WAL mode lets them write while the
+    GUI keeps reading.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._connection = sqlite3.connect(path, isolation_level=None)
+        self._connection.execute("PRAGMA journal_mode = WAL")
+        self._connection.execute("PRAGMA synchronous = NORMAL")
+        self._connection.create_function("casefold", 1, str.casefold, deterministic=True)
+        self._connection.executescript(_SCHEMA)
+        try:
+            self._connection.executescript(_FTS_SCHEMA)
+            self._execute_all(_FTS_TRIGGERS)
+            self.has_fts = True
+        except sqlite3.OperationalError:
+            # SQLite built without FTS5 or its trigram tokenizer: searches scan the table instead
+            self.has_fts = False
+
+    def close(self):
+        self._connection.close()
+
+    def checkpoint(self):
+        """Fold the write-ahead log back into the database file."""
+        self._connection.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+    def _execute_all(self, statements):
+        for statement in statements:
+            self._connection.execute(statement)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self):
+        return self.count()
+
+    def __iter__(self):
+        """Every contact in sort order, streamed from a cursor."""
+        return map(_contact, self._connection.execute(_SELECT + _ORDER))
+
+    def count(self, search=MATCH_ALL):
+        return self._connection.execute(f"SELECT count(*) FROM contacts WHERE {search.where}",
+                                        search.params).fetchone()[0]
+
+    @staticmethod
+    def sort_key(contact):
+        """Position of contact in the database's sort order, for contacts(after=...)."""
+        return collation_key(contact.last_name), collation_key(contact.first_name), contact.contact_id
+
+    def contacts(self, search=MATCH_ALL, offset=0, limit=PAGE_SIZE, after=None):
+        """A page of contacts matching search, in sort order.
+
+        With after, a sort_key() of the contact before the page, the page is
+        found with the sort index instead of by skipping offset rows.
+        """
+        where = search.where
+        params = list(search.params)
+        if after is not None:
+            where = f"({where}) AND (sort_last, sort_first, id) > (?, ?, ?)"
+            params.extend(after)
+            offset = 0
+        rows = self._connection.execute(f"{_SELECT} WHERE {where}{_ORDER} LIMIT ? OFFSET ?",
+                                        params + [limit, offset])
+        return [_contact(row) for row in rows]
+
+    def get(self, contact_id):
+        row = self._connection.execute(f"{_SELECT} WHERE id = ?", (contact_id,)).fetchone()
+        return None if row is None else _contact(row)
+
+    def has_phone_key(self, key, max_id=None):
+        """Whether a contact has phone key key; with max_id, only contacts up to that id count."""
+        if max_id is None:
+            row = self._connection.execute("SELECT 1 FROM contacts WHERE phone_key = ? LIMIT 1", (key,))
+        else:
+            row = self._connection.execute("SELECT 1 FROM contacts WHERE phone_key = ? AND id <= ? LIMIT 1",
+                                           (key, max_id))
+        return row.fetchone() is not None
+
+    def last_id(self):
+        """The highest contact id so far; contacts added later get higher ids."""
+        return self._connection.execute("SELECT coalesce(max(id), 0) FROM contacts").fetchone()[0]
+
+    def phone_keys_after(self, contact_id):
+        """The set of phone keys of contacts with ids above contact_id."""
+        return {key for key, in self._connection.execute(
+            "SELECT phone_key FROM contacts WHERE id > ? AND phone_key != ''", (contact_id,))}
+
+    def import_checkpoint(self, source):
+        """The ImportCheckpoint of an unfinished import of the file at path source, or None."""
+        row = self._connection.execute("SELECT * FROM import_checkpoints WHERE source = ?", (source,)).fetchone()
+        return None if row is None else ImportCheckpoint(*row)
+
+    def clear_import_checkpoint(self, source):
+        self._connection.execute("DELETE FROM import_checkpoints WHERE source = ?", (source,))
+
+    def group_registry(self, groups=DEFAULT_GROUPS):
+        """The database's GroupRegistry: the group table it was saved with, or groups if it has none.
+
+        Groups its contacts are in that the table lacks are added, so the
+        registry covers every contact when the database is exported.
+        """
+        entries = self._connection.execute("SELECT id, name FROM phonebook_groups ORDER BY id").fetchall()
+        registry = GroupRegistry(entries) if entries else group_registry(groups).copy()
+        for group_names, in self._connection.execute(
+                "SELECT DISTINCT group_names FROM contacts WHERE group_names != ''"):
+            for group in _split_groups(group_names):
+                registry.add(group)
+        return registry
+
+    def save_group_registry(self, registry):
+        """Store registry as the database's group table, replacing the one it had, in one transaction."""
+        connection = self._connection
+        connection.execute("BEGIN")
+        try:
+            connection.execute("DELETE FROM phonebook_groups")
+            connection.executemany("INSERT INTO phonebook_groups (id, name) VALUES (?, ?)", registry.items())
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        connection.execute("COMMIT")
+
+    def add(self, contact):
+        """Insert contact and give it its row id as contact_id."""
+        contact.contact_id = self._connection.execute(_INSERT, _row(contact)).lastrowid
+        return contact.contact_id
+
+    def replace(self, contact_id, contact):
+        if self._connection.execute(_UPDATE, _row(contact) + (contact_id,)).rowcount == 0:
+            raise KeyError(contact_id)
+        contact.contact_id = contact_id
+
+    def remove(self, contact_id):
+        if self._connection.execute("DELETE FROM contacts WHERE id = ?", (contact_id,)).rowcount == 0:
+            raise KeyError(contact_id)
+
+    def remove_many(self, contact_ids):
+        """Delete the contacts with the given ids in one transaction; ids no longer present are ignored."""
+        connection = self._connection
+        connection.execute("BEGIN")
+        try:
+            connection.executemany("DELETE FROM contacts WHERE id = ?", ((contact_id,) for contact_id in contact_ids))
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        connection.execute("COMMIT")
+
+    def insert_many(self, contacts, progress=None, checkpoint=None):
+        """Insert contacts in bulk, in one transaction, and return how many were inserted.
+
+        contacts can be any iterable; it must have a length if progress is
+        given, which is then called with (contacts inserted, total). If
+        progress cancels, nothing is inserted. An ImportCheckpoint given as
+        checkpoint is committed in the same transaction. The full-text index
+        is not updated row by row: the new rows are added to it in one
+        statement at the end, which is several times faster.
+        """
+        total = len(contacts) if progress is not None else None
+        rows = map(_row, contacts)
+        connection = self._connection
+        count = 0
+        connection.execute("BEGIN")
+        try:
+            # Row ids are handed out in increasing order, so the new rows are the ones after last_id
+            last_id = self.last_id()
+            if self.has_fts:
+                self._execute_all(_DROP_FTS_TRIGGERS)
+            while True:
+                batch = list(itertools.islice(rows, INSERT_BATCH_SIZE))
+                if not batch:
+                    break
+                connection.executemany(_INSERT, batch)
+                count += len(batch)
+                if progress is not None:
+                    progress(count, total)
+            if self.has_fts:
+                connection.execute(f"INSERT INTO contacts_fts (rowid, {_COLUMNS}) "
+                                   f"SELECT id, {_COLUMNS} FROM contacts WHERE id > ?", (last_id,))
+                self._execute_all(_FTS_TRIGGERS)
+            if checkpoint is not None:
+                connection.execute("INSERT OR REPLACE INTO import_checkpoints VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                                   checkpoint)
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        connection.execute("COMMIT")
+        trace.count("rows_inserted", count)
+        if progress is not None:
+            progress(total, total)
+        return count
+
+    def search(self, text, fields=tuple(FIELD_COLUMNS), case_sensitive=False, exact_match=False):
+        """A ContactFilter for contacts whose text in any of fields contains (or equals) text.
+
+        The trigram index narrows the candidates whenever text is at least
+        three characters long; shorter queries scan the table.
+        """
+        columns = [FIELD_COLUMNS[field] for field in fields]
+        use_index = self.has_fts and len(text) >= 3
+        if use_index and not case_sensitive and not exact_match:
+            # A trigram match is exactly a case-insensitive substring test
+            return ContactFilter(f"id IN ({_FTS_MATCH})", (_fts_query(text, columns),))
+
+        if case_sensitive:
+            needle = text
+            test = "{} = ?" if exact_match else "instr({}, ?) > 0"
+        elif text.isascii():
+            # SQLite's LIKE and NOCASE fold ASCII only, which is all an ASCII needle can match
+            needle = text if exact_match else "%" + _LIKE_SPECIAL.sub(r"\\\g<0>", text) + "%"
+            test = "{} = ? COLLATE NOCASE" if exact_match else "{} LIKE ? ESCAPE '\\'"
+        else:
+            needle = text.casefold()
+            test = "casefold({}) = ?" if exact_match else "instr(casefold({}), ?) > 0"
+        where = " OR ".join(test.format(column) for column in columns)
+        params = (needle,) * len(columns)
+        if use_index:
+            where = f"id IN ({_FTS_MATCH}) AND ({where})"
+            params = (_fts_query(text, columns),) + params
+        return ContactFilter(where, params)
+
+
+class DatabasePhoneIndex:
+    """Answers `key in index` like a PhoneIndex, from the phone key index of a database.
+
+    With max_id, contacts added after the one with that id are left out.
+    The database keeps its phone keys up to date itself, so add, remove and
+    replace do nothing.
+    """
+
+    def __init__(self, database, max_id=None):
+        self.database = database
+        self.max_id = max_id
+
+    def __contains__(self, key):
+        return self.database.has_phone_key(key, self.max_id)
+
+    def add(self, contact):
+        pass
+
+    def remove(self, contact):
+        pass
+
+    def replace(self, old_contact, new_contact):
+        pass
+
+
+@trace.traced("write_database")
+def write_database(filename, contacts, progress=None, groups=None):
+    """Write contacts to a new phonebook database at filename, replacing it atomically.
+
+    groups, a GroupRegistry, is stored as the database's group table once
+    every contact has been read, so a registry the contacts are being read
+    into is complete by then. Like write_contacts, the database is built
+    next to filename and renamed over it once complete. Returns the number
+    of contacts written.
+    """
+    directory = os.path.dirname(filename)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    temp_filename = filename + ".tmp"
+    for leftover in (temp_filename, temp_filename + "-wal", temp_filename + "-shm"):
+        if os.path.exists(leftover):
+            os.remove(leftover)
+    try:
+        with ContactDatabase(temp_filename) as database:
+            count = database.insert_many(contacts, progress)
+            if groups is not None:
+                database.save_group_registry(groups)
+            database.checkpoint()
+        os.replace(temp_filename, filename)
+    except BaseException:
+        if os.path.exists(temp_filename):
+            os.remove(temp_filename)
+        raise
+    finally:
+        for leftover in (temp_filename + "-wal", temp_filename + "-shm"):
+            if os.path.exists(leftover):
+                os.remove(leftover)
+    fsync_directory(directory)
+    return count
+
+
+@trace.traced("convert_xml_to_db")
+def convert_xml_to_db(input_file, output_file, groups=DEFAULT_GROUPS):
+    registry = group_registry(groups)
+    return write_database(output_file, iter_xml_contacts(input_file, registry), groups=registry)
+
+
+@trace.traced("convert_vcf_to_db")
+def convert_vcf_to_db(input_file, output_file, groups=DEFAULT_GROUPS):
+    registry = group_registry(groups)
+    return write_database(output_file, iter_vcf_contacts(input_file, registry), groups=registry)
+
+
+@trace.traced("convert_db_to_xml")
+def convert_db_to_xml(input_file, output_file, groups=DEFAULT_GROUPS):
+    with ContactDatabase(input_file) as database:
+        return write_xml_phonebook(output_file, database, database.group_registry(groups))
+
+
+@trace.traced("convert_db_to_vcf")
+def convert_db_to_vcf(input_file, output_file, version="3.0"):
+    with ContactDatabase(input_file) as database:
+        return write_vcards(output_file, database, version)
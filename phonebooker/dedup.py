@@ -0,0 +1,283 @@
+"""Fuzzy detection and merging of duplicate contacts.
+
+Scoring every pair of contacts is quadratic, so contacts are first grouped
+into blocks by cheap blocking keys, and only contacts sharing a block are
+scored:
+
+- the last PHONE_SUFFIX_DIGITS digits of the phone number, which survive a
+  number being reformatted or given a country or trunk prefix;
+- the Soundex code of the last name with the initial of the first name and
+  of the formal names it is a nickname of, so "Kate Smith" and
+  "Kathryn Smyth" share a block;
+- the sorted name tokens, which catch first and last names given swapped.
+
+Pairs scoring at least the threshold are joined into clusters, and each
+cluster becomes a MergeSuggestion holding the contact that would replace it.
+"""
+import functools
+import operator
+import unicodedata
+from collections import namedtuple
+
+from thefuzz import fuzz
+
+from . import trace
+from .core import PROGRESS_INTERVAL, Contact, phone_key
+from .database import ContactDatabase
+from .names import default_parser
+from .search import normalize
+
+# Minimum score for two contacts to be suggested as duplicates
+DUPLICATE_THRESHOLD = 85
+
+# Trailing digits two numbers must share to be the same number in another format
+PHONE_SUFFIX_DIGITS = 7
+
+# Blocks with more contacts than this are not scored: a key that many contacts
+# share (a switchboard number, a very common name) says little about any pair
+MAX_BLOCK_SIZE = 200
+
+# Taken off the name score of contacts with different phone numbers. Large
+# directories hold many namesakes, so at the default threshold two different
+# numbers always mean two people
+DIFFERENT_PHONE_PENALTY = 20
+
+# The contacts found to be one person, the contact that would replace them and the lowest pair score joining them
+MergeSuggestion = namedtuple("MergeSuggestion", "contacts merged score")
+
+# What is compared of a contact, worked out once rather than for every pair it is in
+_Profile = namedtuple("_Profile", "phone_suffix first_names last_name full_name")
+
+_SOUNDEX_DIGITS = {letter: digit
+                   for digit, letters in (("1", "bfpv"), ("2", "cgjkqsxz"), ("3", "dt"),
+                                          ("4", "l"), ("5", "mn"), ("6", "r"))
+                   for letter in letters}
+
+
+def soundex(name):
+    """The American Soundex code of name ("Smith" and "Smyth" are both "S530"), or "" if it has no letters."""
+    letters = [c for c in unicodedata.normalize("NFKD", name.lower()) if "a" <= c <= "z"]
+    if not letters:
+        return ""
+    code = letters[0].upper()
+    previous = _SOUNDEX_DIGITS.get(letters[0], "")
+    for letter in letters[1:]:
+        digit = _SOUNDEX_DIGITS.get(letter, "")
+        if digit and digit != previous:
+            code += digit
+            if len(code) == 4:
+                break
+        # H and W don't separate letters with the same code; vowels do
+        if letter not in "hw":
+            previous = digit
+    return code.ljust(4, "0")
+
+
+def first_name_forms(first_name):
+    """first_name normalized, followed by the formal names its first word is a nickname of."""
+    name = normalize(first_name)
+    if not name:
+        return ()
+    return (name,) + default_parser.formal_names(name.split()[0])
+
+
+def _profile(contact):
+    key = phone_key(contact.phone_number)
+    last_name = normalize(contact.last_name)
+    forms = first_name_forms(contact.first_name)
+    full_name = f"{forms[0]} {last_name}".strip() if forms else last_name
+    return _Profile(key[-PHONE_SUFFIX_DIGITS:], forms, last_name, full_name)
+
+
+def _blocking_keys(profile):
+    keys = set()
+    if profile.phone_suffix:
+        keys.add(("phone", profile.phone_suffix))
+    if profile.full_name:
+        keys.add(("tokens", " ".join(sorted(profile.full_name.split()))))
+    surname_code = soundex(profile.last_name)
+    if surname_code:
+        keys.update(("sound", surname_code, form[:1]) for form in profile.first_names or ("",))
+    return keys
+
+
+def blocking_keys(contact):
+    """The set of blocking keys of contact; only contacts sharing a key are compared."""
+    return _blocking_keys(_profile(contact))
+
+
+def _first_name_score(forms, other_forms):
+    if not forms or not other_forms:
+        return 100 if forms == other_forms else 0
+    if set(forms) & set(other_forms):
+        return 100
+    return max(fuzz.ratio(form, other_form) for form in forms for other_form in other_forms)
+
+
+def _score(profile, other):
+    same_phone = profile.phone_suffix and profile.phone_suffix == other.phone_suffix
+    if not profile.full_name or not other.full_name:
+        # A contact with no name is only ever the same as another with its number
+        return 100 if same_phone else 0
+    name_score = max((_first_name_score(profile.first_names, other.first_names) + 2 * fuzz.ratio(
+        profile.last_name, other.last_name)) // 3, fuzz.token_sort_ratio(profile.full_name, other.full_name))
+    if same_phone:
+        return (100 + name_score) // 2
+    if profile.phone_suffix and other.phone_suffix:
+        return name_score - DIFFERENT_PHONE_PENALTY
+    return name_score
+
+
+def similarity(contact, other_contact):
+    """How likely two contacts are the same person, from 0 to 100.
+
+    Names are compared with nicknames matching their formal names; a shared
+    phone number raises the score and two different numbers lower it.
+    """
+    return _score(_profile(contact), _profile(other_contact))
+
+
+def _name_completeness(contact):
+    first_word = contact.first_name.split()[0] if contact.first_name.strip() else ""
+    return (not default_parser.formal_names(first_word), len(contact.first_name) + len(contact.last_name),
+            bool(contact.phone_number))
+
+
+def merge_contacts(contacts):
+    """A new Contact combining duplicates.
+
+    The name is the most complete one, preferring formal first names over
+    nicknames. The number comes from the same contact if it has one, groups
+    are combined and a missing company is taken from the others.
+    """
+    named = max(contacts, key=_name_completeness)
+    numbered = named if named.phone_number else next(
+        (contact for contact in contacts if contact.phone_number), named)
+    company = named.company or next((contact.company for contact in contacts if contact.company), "")
+    merged = Contact(named.first_name, named.last_name, numbered.phone_type, numbered.phone_number, (), company)
+    merged.group_mask = functools.reduce(operator.or_, (contact.group_mask for contact in contacts), 0)
+    return merged
+
+
+def _matching_pairs(profiles, blocks, threshold, numbers_must_agree, progress):
+    """{(position, later position): score} for the pairs sharing a block that score at least threshold."""
+    pairs = {}
+    scored = 0
+    for done, block in enumerate(blocks):
+        if progress is not None and done % PROGRESS_INTERVAL == 0:
+            progress(done, len(blocks))
+        # Blocks list positions in increasing order
+        for index, position in enumerate(block):
+            profile = profiles[position]
+            phone_suffix = profile.phone_suffix
+            for other_position in block[index + 1:]:
+                other = profiles[other_position]
+                if numbers_must_agree and phone_suffix and other.phone_suffix and phone_suffix != other.phone_suffix:
+                    continue
+                pair = (position, other_position)
+                if pair in pairs:
+                    continue
+                score = _score(profile, other)
+                scored += 1
+                if score >= threshold:
+                    pairs[pair] = score
+    trace.count("fuzzy_comparisons", scored)
+    if progress is not None:
+        progress(len(blocks), len(blocks))
+    return pairs
+
+
+def _drop_ambiguous(pairs, profiles):
+    """pairs without those of contacts lacking a number whose best matches have different numbers.
+
+    A "John Smith" without a number matching two John Smiths with numbers
+    could be either of them, so it is left alone.
+    """
+    best = {}
+    for (position, other_position), score in pairs.items():
+        for unnumbered, partner in ((position, other_position), (other_position, position)):
+            phone_suffix = profiles[partner].phone_suffix
+            if profiles[unnumbered].phone_suffix or not phone_suffix:
+                continue
+            best_score, phone_suffixes = best.get(unnumbered, (-1, None))
+            if score > best_score:
+                best[unnumbered] = (score, {phone_suffix})
+            elif score == best_score:
+                phone_suffixes.add(phone_suffix)
+    ambiguous = {position for position, (_, phone_suffixes) in best.items() if len(phone_suffixes) > 1}
+    if not ambiguous:
+        return pairs
+    return {pair: score for pair, score in pairs.items() if ambiguous.isdisjoint(pair)}
+
+
+@trace.traced("find_duplicates")
+def find_duplicates(contacts, threshold=DUPLICATE_THRESHOLD, progress=None):
+    """MergeSuggestions for the groups of likely duplicates in contacts, best first.
+
+    The best scoring pairs are joined first. While the threshold is above
+    what two different numbers can score, no group ends up with two
+    different numbers, so namesakes aren't chained together through a
+    contact that has none. progress, if given, is called with (blocks
+    scored, total blocks). Suggestions never share a contact.
+    """
+    contacts = list(contacts)
+    profiles = [_profile(contact) for contact in contacts]
+    blocks = {}
+    for position, profile in enumerate(profiles):
+        for key in _blocking_keys(profile):
+            blocks.setdefault(key, []).append(position)
+    blocks = [block for block in blocks.values() if 1 < len(block) <= MAX_BLOCK_SIZE]
+    trace.count("dedup_blocks", len(blocks))
+
+    numbers_must_agree = threshold > 100 - DIFFERENT_PHONE_PENALTY
+    pairs = _drop_ambiguous(_matching_pairs(profiles, blocks, threshold, numbers_must_agree, progress), profiles)
+
+    parent = list(range(len(contacts)))
+    # The number of each cluster and the lowest score of the pairs that joined it, kept at its root
+    phone_suffixes = [profile.phone_suffix for profile in profiles]
+    cluster_scores = {}
+
+    def find(position):
+        while parent[position] != position:
+            parent[position] = parent[parent[position]]
+            position = parent[position]
+        return position
+
+    for (position, other_position), score in sorted(pairs.items(), key=lambda item: -item[1]):
+        root, other_root = find(position), find(other_position)
+        if root == other_root:
+            continue
+        phone_suffix, other_phone_suffix = phone_suffixes[root], phone_suffixes[other_root]
+        if numbers_must_agree and phone_suffix and other_phone_suffix and phone_suffix != other_phone_suffix:
+            continue
+        parent[other_root] = root
+        phone_suffixes[root] = phone_suffix or other_phone_suffix
+        cluster_scores[root] = min(score, cluster_scores.pop(root, score), cluster_scores.pop(other_root, score))
+
+    clusters = {}
+    for position in range(len(contacts)):
+        root = find(position)
+        if root in cluster_scores:
+            clusters.setdefault(root, []).append(contacts[position])
+    suggestions = [MergeSuggestion(cluster, merge_contacts(cluster), cluster_scores[root])
+                   for root, cluster in clusters.items()]
+    suggestions.sort(key=lambda suggestion: -suggestion.score)
+    return suggestions
+
+
+def apply_merges(target, suggestions):
+    """Replace the contacts of every suggestion by its merged contact in a ContactStore or ContactDatabase.
+
+    A store is updated in one pass. A database gets the merged contacts
+    before the duplicates are deleted, so an interruption in between loses
+    nothing. Returns the merged contacts.
+    """
+    contact_ids = {contact.contact_id for suggestion in suggestions for contact in suggestion.contacts}
+    merged = [suggestion.merged for suggestion in suggestions]
+    if isinstance(target, ContactDatabase):
+        target.insert_many(merged)
+        target.remove_many(contact_ids)
+    else:
+        target.remove_many(contact_ids)
+        target.extend(merged)
+    return merged
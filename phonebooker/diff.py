@@ -0,0 +1,155 @@
+"""Diffs between two versions of a phonebook, saved as patches that apply to another copy.
+
+A patch holds the contacts added, removed and modified between an old and a
+new phonebook as journal entries (see phonebooker.journal): ``["add", None,
+new]``, ``["delete", old, None]`` and ``["edit", old, new]``, where old and
+new are contact records. It is written as JSON lines after a header line
+with PATCH_VERSION and the number of each kind of change, conventionally to
+``<name>.pbpatch``. Applying it finds each old contact by its record, like
+replaying a journal. Records list groups by name in sorted order, so a
+patch applies in any session and to copies with their own group tables.
+
+Diffing takes linear time. Contacts with the same record in both phonebooks
+are matched through a hash table of the old phonebook's records. The
+contacts left over are paired as modified by their identity: first their
+name and normalized number, then their name alone, so a changed number is
+one edit rather than a removal and an addition.
+"""
+import json
+from collections import Counter, defaultdict, deque
+
+from . import trace
+from .core import (DEFAULT_GROUPS, collation_key, contact_sort_key, gc_paused, group_registry, phone_key,
+                   write_contacts)
+from .formats import iter_phonebook, write_phonebook
+from .journal import apply_entries, contact_record, frozen_record
+
+PATCH_SUFFIX = ".pbpatch"
+PATCH_VERSION = 1
+
+# Journal operations and what the patch header calls them
+CHANGE_NAMES = {"add": "added", "edit": "modified", "delete": "removed"}
+
+
+def _name_key(record):
+    first_name, last_name = record[:2]
+    return collation_key(last_name), collation_key(first_name)
+
+
+def _identity(record):
+    return _name_key(record) + (phone_key(record[3]),)
+
+
+def _pair(old_records, new_records, key):
+    """(pairs of old and new records with the same key, old records left over, new records left over).
+
+    Records sharing a key are paired in the order given.
+    """
+    waiting = defaultdict(deque)
+    for record in old_records:
+        waiting[key(record)].append(record)
+    pairs = []
+    new_left = []
+    for record in new_records:
+        same_key = waiting.get(key(record))
+        if same_key:
+            pairs.append((same_key.popleft(), record))
+        else:
+            new_left.append(record)
+    return pairs, [record for same_key in waiting.values() for record in same_key], new_left
+
+
+@trace.traced("diff_contacts")
+def diff_contacts(old_contacts, new_contacts):
+    """Journal entries that turn old_contacts into new_contacts, in name order.
+
+    Only the records of old_contacts are held at once; new_contacts can be
+    any iterable, read once.
+    """
+    unchanged = Counter(contact_record(contact) for contact in old_contacts)
+    new_records = []
+    for contact in new_contacts:
+        record = contact_record(contact)
+        if unchanged[record]:
+            unchanged[record] -= 1
+        else:
+            new_records.append(record)
+    old_records = list((+unchanged).elements())
+
+    same_number, old_records, new_records = _pair(old_records, new_records, _identity)
+    same_name, old_records, new_records = _pair(old_records, new_records, _name_key)
+    entries = [("edit", old, new) for old, new in same_number + same_name]
+    entries += [("delete", old, None) for old in old_records]
+    entries += [("add", None, new) for new in new_records]
+    entries.sort(key=lambda entry: _name_key(entry[2] or entry[1]))
+    trace.count("contacts_changed", len(entries))
+    return entries
+
+
+def count_changes(entries):
+    """{"added": count, "modified": count, "removed": count} of entries."""
+    counts = Counter(operation for operation, _, _ in entries)
+    return {name: counts[operation] for operation, name in CHANGE_NAMES.items()}
+
+
+def write_patch(filename, entries):
+    """Save entries as a patch file, replacing filename atomically like the other writers."""
+    header = json.dumps({"patch": PATCH_VERSION, **count_changes(entries)}) + "\n"
+    return write_contacts(filename, entries, lambda entry: json.dumps(entry, ensure_ascii=False) + "\n",
+                          header=header)
+
+
+def read_patch(filename):
+    """The entries of the patch file filename, as (operation, old record, new record).
+
+    Raises ValueError if filename isn't a patch of a version this reads.
+    """
+    with open(filename, encoding='utf-8') as patch:
+        try:
+            header = json.loads(patch.readline())
+            if not isinstance(header, dict) or header.get("patch") != PATCH_VERSION:
+                raise ValueError
+            entries = []
+            for line in patch:
+                operation, old, new = json.loads(line)
+                if operation not in CHANGE_NAMES:
+                    raise ValueError
+                entries.append((operation, frozen_record(old), frozen_record(new)))
+        except (ValueError, TypeError, IndexError):
+            raise ValueError(f"{filename} is not a phonebook patch of version {PATCH_VERSION}") from None
+    return entries
+
+
+@trace.traced("diff_phonebooks")
+def diff_phonebooks(old_file, new_file, patch_file=None, groups=DEFAULT_GROUPS):
+    """The entries of diff_contacts between two phonebooks of any format, also saved to patch_file if given.
+
+    groups is what phonebooks without a group table of their own are read
+    with.
+    """
+    with gc_paused():
+        old_contacts = iter_phonebook(old_file, group_registry(groups).copy())
+        new_contacts = iter_phonebook(new_file, group_registry(groups).copy())
+        entries = diff_contacts(old_contacts, new_contacts)
+    if patch_file is not None:
+        write_patch(patch_file, entries)
+    return entries
+
+
+@trace.traced("patch_phonebook")
+def patch_phonebook(filename, patch_file, output=None, groups=DEFAULT_GROUPS):
+    """Apply the patch in patch_file to the phonebook in filename, saving the result to output.
+
+    output defaults to filename itself and may be of another format. The
+    contacts are written sorted, with the phonebook's groups and ids and
+    any groups the patch adds. Returns the number of contacts written and
+    the number of edits and deletes whose old contact wasn't found (see
+    apply_entries).
+    """
+    entries = read_patch(patch_file)
+    registry = group_registry(groups).copy()
+    with gc_paused():
+        contacts, missed = apply_entries(iter_phonebook(filename, registry), entries)
+        contacts.sort(key=contact_sort_key)
+        registry.add_contact_groups(contacts)
+        return write_phonebook(filename if output is None else output, contacts, registry), missed
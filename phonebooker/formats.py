@@ -0,0 +1,62 @@
+"""Reading and writing phonebooks of every supported format, chosen by file extension."""
+import itertools
+import os
+
+from .core import CSV_IMPORT_GROUPS, is_database_file, iter_xml_contacts, write_xml_phonebook
+from .database import ContactDatabase, write_database
+from .importer import default_jobs, iter_csv_import
+from .vcard import iter_vcf_contacts, write_vcards
+
+READ_FORMATS = ("xml", "vcf", "csv", "db")
+WRITE_FORMATS = ("xml", "vcf", "db")
+
+
+def phonebook_format(filename):
+    """"xml", "vcf", "csv" or "db" for a phonebook in filename, going by its extension."""
+    if is_database_file(filename):
+        return "db"
+    return os.path.splitext(filename)[1].lower().lstrip(".")
+
+
+def _iter_database(filename, registry):
+    with ContactDatabase(filename) as database:
+        registry.replace(database.group_registry(registry).items())
+        yield from database
+
+
+def iter_phonebook(filename, registry):
+    """The contacts of the phonebook in filename, read lazily; registry, a GroupRegistry, gets its groups.
+
+    Like iter_xml_contacts, the registry is complete once the contacts have
+    been read. Rows of a CSV export that repeat an earlier number are
+    skipped, as in a CSV import.
+    """
+    source_format = phonebook_format(filename)
+    if source_format == "xml":
+        return iter_xml_contacts(filename, registry)
+    if source_format == "vcf":
+        return iter_vcf_contacts(filename, registry)
+    if source_format == "db":
+        return _iter_database(filename, registry)
+    if source_format == "csv":
+        for group in CSV_IMPORT_GROUPS:
+            registry.add(group)
+        chunks = iter_csv_import(filename, jobs=default_jobs(filename))
+        return itertools.chain.from_iterable(chunk.contacts for chunk in chunks)
+    raise ValueError(f"Cannot read {filename}: expected one of {', '.join(READ_FORMATS)}")
+
+
+def write_phonebook(filename, contacts, registry):
+    """Write contacts from any iterable to filename in the format its extension names.
+
+    registry, a GroupRegistry covering the contacts' groups, becomes the
+    group table of an XML phonebook or database. Returns the number written.
+    """
+    target_format = phonebook_format(filename)
+    if target_format == "xml":
+        return write_xml_phonebook(filename, contacts, registry)
+    if target_format == "vcf":
+        return write_vcards(filename, contacts)
+    if target_format == "db":
+        return write_database(filename, contacts, groups=registry)
+    raise ValueError(f"Cannot write {filename}: expected one of {', '.join(WRITE_FORMATS)}")
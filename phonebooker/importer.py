@@ -0,0 +1,211 @@
+"""Chunked CSV import, with names and numbers parsed in a process pool.
+
+The CSV is read CHUNK_ROWS rows at a time and each chunk's names and phone
+numbers are parsed by worker processes. Only a few chunks are in flight at
+once, so memory stays bounded however long the file is. Parsed chunks come
+back in file order and are deduplicated and turned into Contacts on the
+calling side, so the outcome is the same as a serial import.
+
+An import into a phonebook database commits a checkpoint with every chunk.
+If the import is interrupted, importing the same, unchanged file again
+continues after the last committed chunk.
+"""
+import collections
+import csv
+import itertools
+import os
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+from . import trace
+from .core import CSV_IMPORT_GROUPS, Contact, ImportReport, PhoneIndex, gc_paused
+from .database import DatabasePhoneIndex, ImportCheckpoint
+from .names import parse_complex_name
+from .phones import normalize_phone
+
+# Rows read and parsed as one unit of work
+CHUNK_ROWS = 10000
+
+# Files smaller than this are parsed in-process: starting workers would cost more than they save
+PARALLEL_MIN_BYTES = 8 << 20
+
+# Rows imported so far (counting from the first data row) and the new contacts of the latest chunk
+CsvChunk = namedtuple("CsvChunk", "rows contacts")
+
+
+def parse_rows(rows):
+    """Parse CSV rows into (phone key, first name, last name, phone type, number) tuples.
+
+    Returns the parsed rows and the number of incomplete rows left out.
+    Runs in the worker processes, so it takes and returns plain lists.
+    """
+    normalize = normalize_phone
+    parse_name = parse_complex_name
+    parsed = []
+    append = parsed.append
+    for row in rows:
+        if len(row) < 4:
+            continue
+        # Column C (index 2) holds the phone number and column D (index 3) the name
+        phone_type, number, key = normalize(row[2])
+        append((key, *parse_name(row[3]), phone_type, number))
+    return parsed, len(rows) - len(parsed)
+
+
+def default_jobs(filename):
+    """Worker processes worth using for filename: one per CPU, or none for small files."""
+    if os.path.getsize(filename) < PARALLEL_MIN_BYTES:
+        return 1
+    return os.cpu_count() or 1
+
+
+def _read_chunks(csvfile, start_row):
+    """Yield (rows read, bytes read, rows) per chunk of csvfile."""
+    reader = csv.reader(csvfile)
+    next(reader, None)  # Skip the header row
+    # Rows imported before a resumed import was interrupted
+    collections.deque(itertools.islice(reader, start_row), maxlen=0)
+    rows_read = start_row
+    while True:
+        rows = list(itertools.islice(reader, CHUNK_ROWS))
+        if not rows:
+            return
+        rows_read += len(rows)
+        # The text layer hides its position while iterating; the byte buffer under it doesn't
+        yield rows_read, csvfile.buffer.tell(), rows
+
+
+def _parse_in_pool(pool, chunks, window):
+    """Parse chunks in pool, yielding them in order with at most window chunks in flight.
+
+    Closing the generator cancels the chunks still waiting in the pool.
+    """
+    pending = collections.deque()
+    try:
+        for rows_read, position, rows in chunks:
+            pending.append((rows_read, position, pool.submit(parse_rows, rows)))
+            if len(pending) >= window:
+                rows_read, position, future = pending.popleft()
+                yield rows_read, position, future.result()
+        while pending:
+            rows_read, position, future = pending.popleft()
+            yield rows_read, position, future.result()
+    finally:
+        for _, _, future in pending:
+            future.cancel()
+
+
+def iter_csv_import(filename, phone_index=None, progress=None, jobs=1, start_row=0, report=None, seen=None):
+    """Import a CSV export in the resources/Template.csv layout chunk by chunk, yielding a CsvChunk per chunk.
+
+    Rows whose phone number is in phone_index, or repeats one in seen or
+    earlier in the file, are skipped; seen is updated, phone_index is not.
+    report is updated as each chunk is yielded. progress, if given, is
+    called with (bytes read, file size) before each chunk. With jobs > 1,
+    rows are parsed by that many worker processes. start_row skips rows a
+    resumed import has already taken in.
+    """
+    if phone_index is None:
+        phone_index = PhoneIndex()
+    if report is None:
+        report = ImportReport()
+    if seen is None:
+        seen = set()
+
+    with open(filename, 'r', newline='', encoding='utf-8') as csvfile:
+        total = os.fstat(csvfile.fileno()).st_size
+        chunks = _read_chunks(csvfile, start_row)
+        pool = ProcessPoolExecutor(max_workers=jobs) if jobs > 1 else None
+        if pool is None:
+            parsed_chunks = ((rows_read, position, parse_rows(rows)) for rows_read, position, rows in chunks)
+        else:
+            parsed_chunks = _parse_in_pool(pool, chunks, 2 * jobs)
+        try:
+            for rows_read, position, (parsed, incomplete) in parsed_chunks:
+                if progress is not None:
+                    progress(position, total)
+                report.skipped_rows += incomplete
+                contacts = []
+                existing_duplicates = file_duplicates = 0
+                for key, first_name, last_name, phone_type, number in parsed:
+                    if key and key in phone_index:
+                        existing_duplicates += 1
+                    elif key and key in seen:
+                        file_duplicates += 1
+                    else:
+                        if key:
+                            seen.add(key)
+                        contacts.append(Contact(first_name, last_name, phone_type, number, CSV_IMPORT_GROUPS, ""))
+                report.added += len(contacts)
+                report.existing_duplicates += existing_duplicates
+                report.file_duplicates += file_duplicates
+                trace.count("csv_rows", len(parsed) + incomplete)
+                yield CsvChunk(rows_read, contacts)
+        finally:
+            # Closing cancels the chunks still queued, as shutdown(cancel_futures=True) needs Python 3.9
+            parsed_chunks.close()
+            if pool is not None:
+                pool.shutdown(wait=False)
+
+    if progress is not None:
+        progress(total, total)
+
+
+def read_csv_contacts(filename, phone_index=None, progress=None, jobs=None):
+    """Read contacts from a CSV export in the resources/Template.csv layout.
+
+    Rows whose phone number is already in phone_index, or that repeat a number
+    seen earlier in the same file, are skipped. phone_index is not modified.
+    progress, if given, is called with (bytes read, file size) as rows are read.
+    jobs is the number of worker processes, by default default_jobs(filename).
+    Returns the new contacts and an ImportReport.
+    """
+    if jobs is None:
+        jobs = default_jobs(filename)
+    report = ImportReport()
+    contacts = []
+    with gc_paused():
+        for chunk in iter_csv_import(filename, phone_index, progress, jobs, report=report):
+            contacts.extend(chunk.contacts)
+    return contacts, report
+
+
+def import_csv_into_database(filename, database, progress=None, jobs=None, restart=False):
+    """Import a CSV export into a ContactDatabase, resuming an interrupted import of the same file.
+
+    Each chunk is committed together with a checkpoint. A checkpoint only
+    applies while the file's size and modification time are unchanged;
+    restart ignores it. Numbers already in the database before the import
+    began count as existing duplicates. Returns the ImportReport.
+    """
+    if jobs is None:
+        jobs = default_jobs(filename)
+    source = os.path.abspath(filename)
+    stat = os.stat(filename)
+    checkpoint = None if restart else database.import_checkpoint(source)
+    if checkpoint is not None and (checkpoint.size, checkpoint.mtime_ns) != (stat.st_size, stat.st_mtime_ns):
+        checkpoint = None
+
+    report = ImportReport()
+    if checkpoint is None:
+        first_id = database.last_id()
+        start_row = 0
+        seen = set()
+    else:
+        first_id = checkpoint.first_id
+        start_row = report.resumed_rows = checkpoint.rows
+        report.added = checkpoint.added
+        report.existing_duplicates = checkpoint.existing_duplicates
+        report.file_duplicates = checkpoint.file_duplicates
+        report.skipped_rows = checkpoint.skipped_rows
+        seen = database.phone_keys_after(first_id)
+
+    # Contacts this import adds are in the database too, but they are duplicates within the file
+    phone_index = DatabasePhoneIndex(database, first_id)
+    with gc_paused():
+        for chunk in iter_csv_import(filename, phone_index, progress, jobs, start_row, report, seen):
+            database.insert_many(chunk.contacts, checkpoint=ImportCheckpoint(
+                source, stat.st_size, stat.st_mtime_ns, chunk.rows, first_id, report.added,
+                report.existing_duplicates, report.file_duplicates, report.skipped_rows))
+    database.clear_import_checkpoint(source)
+    return report
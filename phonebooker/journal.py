@@ -0,0 +1,173 @@
+"""Append-only journal of contact edits made since a phonebook was last saved in full.
+
+Saving a huge phonebook after changing one contact shouldn't mean writing
+every contact again. Instead the edit is appended to ``<phonebook>.journal``
+next to the phonebook, and the two are merged (compacted) into a full save
+once the journal grows past COMPACT_AFTER entries.
+
+The journal is JSON lines. The first line records the size and modification
+time of the phonebook it applies to, so a journal left behind by a crash
+between a full save and deleting the journal is recognized as stale and
+ignored. Each following line is one edit: ``["add", None, new]``,
+``["edit", old, new]`` or ``["delete", old, None]``, where old and new are
+contact records (see contact_record). Contacts in the phonebook carry no
+persistent id, so edits find the contact they apply to by its record.
+"""
+import json
+import os
+from collections import defaultdict
+
+from .core import Contact, fsync_directory
+
+JOURNAL_SUFFIX = ".journal"
+
+# Journal entries after which the next save rewrites the phonebook in full
+COMPACT_AFTER = 10000
+
+
+def journal_path(filename):
+    return filename + JOURNAL_SUFFIX
+
+
+def contact_record(contact):
+    """The fields of contact as a hashable tuple that round trips through JSON.
+
+    Groups are sorted by name: contact.groups follows the order groups were
+    first seen in this process, which another session needn't share.
+    """
+    return (contact.first_name, contact.last_name, contact.phone_type, contact.phone_number,
+            tuple(sorted(contact.groups)), contact.company)
+
+
+def _record_contact(record):
+    first_name, last_name, phone_type, phone_number, groups, company = record
+    return Contact(first_name, last_name, phone_type, phone_number, groups, company)
+
+
+def frozen_record(record):
+    """A contact record read back from JSON as the hashable tuple contact_record gave; JSON makes tuples lists.
+
+    Groups are sorted here too, as journals written before contact_record
+    sorted them hold them in their session's order.
+    """
+    return None if record is None else tuple(record[:4]) + (tuple(sorted(record[4])), record[5])
+
+
+def added(contact):
+    return ("add", None, contact_record(contact))
+
+
+def edited(contact, updated_contact):
+    return ("edit", contact_record(contact), contact_record(updated_contact))
+
+
+def deleted(contact):
+    return ("delete", contact_record(contact), None)
+
+
+def _file_stamp(filename):
+    stat = os.stat(filename)
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+class EditJournal:
+    """The journal of edits to the phonebook in filename."""
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.path = journal_path(filename)
+
+    def _is_base(self, stamp_line):
+        try:
+            return json.loads(stamp_line).get("base") == _file_stamp(self.filename)
+        except (ValueError, AttributeError, OSError):
+            return False
+
+    def is_current(self):
+        """Whether the journal exists and belongs to the phonebook as it is on disk."""
+        try:
+            with open(self.path, encoding='utf-8') as journal:
+                return self._is_base(journal.readline())
+        except FileNotFoundError:
+            return False
+
+    def entries(self):
+        """Journal entries as (operation, old record, new record), or [] if there is no current journal.
+
+        A torn last line, left by a crash while appending, is dropped.
+        """
+        try:
+            journal = open(self.path, encoding='utf-8')
+        except FileNotFoundError:
+            return []
+        entries = []
+        with journal:
+            if not self._is_base(journal.readline()):
+                return []
+            for line in journal:
+                try:
+                    operation, old, new = json.loads(line)
+                except ValueError:
+                    break
+                entries.append((operation, frozen_record(old), frozen_record(new)))
+        return entries
+
+    def __len__(self):
+        return len(self.entries())
+
+    def append(self, entries):
+        """Append entries durably and return how many were written.
+
+        A new journal is started if there is none, or if the one on disk is
+        stale.
+        """
+        lines = [json.dumps(entry, ensure_ascii=False) + "\n" for entry in entries]
+        if not lines:
+            return 0
+        if not self.is_current():
+            self.discard()
+            header = json.dumps({"base": _file_stamp(self.filename)}) + "\n"
+        else:
+            header = ""
+        with open(self.path, 'a', encoding='utf-8', newline='') as journal:
+            journal.write(header + "".join(lines))
+            journal.flush()
+            os.fsync(journal.fileno())
+        if header:
+            fsync_directory(os.path.dirname(self.path))
+        return len(lines)
+
+    def discard(self):
+        """Delete the journal, once its edits are in the phonebook itself."""
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def replay(self, contacts):
+        """contacts from the phonebook with the journal's edits applied, as a list (see apply_entries)."""
+        return apply_entries(contacts, self.entries())[0]
+
+
+def apply_entries(contacts, entries):
+    """contacts with the edits of journal entries applied, as a list, and the number of edits that missed.
+
+    Contacts whose record matches nothing in entries are passed through
+    untouched; an edit or delete of a contact that isn't there misses, and
+    only adds its new version, if any.
+    """
+    contacts = list(contacts)
+    if not entries:
+        return contacts, 0
+    positions = defaultdict(list)
+    for position, contact in enumerate(contacts):
+        positions[contact_record(contact)].append(position)
+    missed = 0
+    for operation, old, new in entries:
+        if old is not None:
+            if positions.get(old):
+                contacts[positions[old].pop()] = None
+            else:
+                missed += 1
+        if new is not None:
+            positions[new].append(len(contacts))
+            contacts.append(_record_contact(new))
+    return [contact for contact in contacts if contact is not None], missed
@@ -0,0 +1,205 @@
+"""Streaming merge of several phonebooks into one, with duplicates dropped on the way.
+
+Every source, an XML, VCF or CSV file or a phonebook database, is read and
+sorted by contact_sort_key (the order of the contact list) in runs of
+RUN_CONTACTS contacts, and each run is spilled to a temporary file. The runs
+are then merged with a heap, reading SPILL_BATCH contacts of each back at a
+time, and written out as one sorted stream. Memory is bounded by the number
+of runs rather than by the number of contacts. Databases are stored in the
+same order, so they are merged straight from their cursor without spilling.
+
+Contacts are duplicates when they have the same name, as contact_sort_key
+compares names, and the same phone_key. As the merge goes by name, only the
+contacts of one name are held at once; contacts sharing a number under
+different names are left for find_duplicates. Each set of duplicates becomes
+one contact as the chosen CONFLICT_RULES entry decides.
+"""
+import functools
+import heapq
+import itertools
+import operator
+import os
+import pickle
+import tempfile
+from contextlib import ExitStack
+from operator import itemgetter
+
+from . import trace
+from .core import DEFAULT_GROUPS, PROGRESS_INTERVAL, Contact, contact_sort_key, gc_paused, group_registry, phone_key
+from .database import ContactDatabase
+from .formats import READ_FORMATS, WRITE_FORMATS, iter_phonebook, phonebook_format, write_phonebook
+
+# Contacts sorted in memory at once; each sorted run is spilled to its own temporary file
+RUN_CONTACTS = 50000
+
+# Contacts pickled together in a run, and read back from it at once during the merge
+SPILL_BATCH = 1000
+
+
+class MergeReport:
+    """Outcome of a merge.
+
+    Only contacts with the same name and number count as duplicates; see
+    the module docstring.
+    """
+
+    def __init__(self, sources=0):
+        self.sources = sources
+        self.read = 0
+        self.written = 0
+
+    @property
+    def duplicates(self):
+        return self.read - self.written
+
+    def summary(self):
+        return "\n".join([
+            f"• {self.read} contacts read from {self.sources} phonebooks",
+            f"• {self.duplicates} contacts with the same name and number merged",
+            f"• {self.written} contacts written",
+        ])
+
+
+def keep_first(duplicates):
+    """The duplicate from the source listed first."""
+    return duplicates[0]
+
+
+def keep_last(duplicates):
+    """The duplicate from the source listed last."""
+    return duplicates[-1]
+
+
+def combine(duplicates):
+    """The duplicate from the source listed first, in the groups of all of them and with a company if any has one."""
+    first = duplicates[0]
+    company = first.company or next((contact.company for contact in duplicates if contact.company), "")
+    merged = Contact(first.first_name, first.last_name, first.phone_type, first.phone_number, (), company)
+    merged.group_mask = functools.reduce(operator.or_, (contact.group_mask for contact in duplicates), 0)
+    return merged
+
+
+# How a set of duplicates, in source order, becomes one contact
+CONFLICT_RULES = {"first": keep_first, "last": keep_last, "combine": combine}
+DEFAULT_CONFLICT_RULE = "combine"
+
+
+def _spill(records):
+    """A temporary file holding records, pickled SPILL_BATCH at a time."""
+    run = tempfile.TemporaryFile()
+    for start in range(0, len(records), SPILL_BATCH):
+        pickle.dump(records[start:start + SPILL_BATCH], run, pickle.HIGHEST_PROTOCOL)
+    run.seek(0)
+    return run
+
+
+def _read_run(run):
+    """(sort key, Contact) pairs of a spilled run, in order."""
+    with run:
+        while True:
+            try:
+                records = pickle.load(run)
+            except EOFError:
+                return
+            for key, first_name, last_name, phone_type, phone_number, group_mask, company in records:
+                contact = Contact(first_name, last_name, phone_type, phone_number, (), company)
+                contact.group_mask = group_mask
+                yield key, contact
+
+
+def _sorted_runs(contacts, report, progress_step):
+    """Spill contacts as runs of up to RUN_CONTACTS contacts, each sorted by contact_sort_key."""
+    runs = []
+    contacts = iter(contacts)
+    while True:
+        records = [(contact_sort_key(contact), contact.first_name, contact.last_name, contact.phone_type,
+                    contact.phone_number, contact.group_mask, contact.company)
+                   for contact in itertools.islice(contacts, RUN_CONTACTS)]
+        if not records:
+            return runs
+        # Sorting on the key alone keeps contacts of the same name in file order
+        records.sort(key=itemgetter(0))
+        runs.append(_spill(records))
+        report.read += len(records)
+        progress_step()
+
+
+def _deduplicated(merged, resolve):
+    """One contact per name and phone_key of the (sort key, Contact) pairs in merged."""
+    for _, same_name in itertools.groupby(merged, key=itemgetter(0)):
+        same_name = [contact for _, contact in same_name]
+        if len(same_name) == 1:
+            yield same_name[0]
+            continue
+        duplicates = {}
+        for contact in same_name:
+            duplicates.setdefault(phone_key(contact.phone_number), []).append(contact)
+        for contacts in duplicates.values():
+            yield contacts[0] if len(contacts) == 1 else resolve(contacts)
+
+
+@trace.traced("merge_phonebooks")
+def merge_phonebooks(sources, output, rule=DEFAULT_CONFLICT_RULE, groups=DEFAULT_GROUPS, progress=None):
+    """Merge the phonebooks in sources into a new phonebook at output and return a MergeReport.
+
+    Duplicates are resolved with CONFLICT_RULES[rule], which gets them in
+    the order of sources and, within a source, in file order. Each source's
+    groups are read by its own group table, or by groups if it has none;
+    the output keeps the ids of the first source's groups and numbers
+    groups new to later sources after them. output may be one of the
+    sources. progress, if given, is called with (sources read, number of
+    sources) while they are sorted and then with (contacts merged, contacts
+    read) while they are merged and written.
+    """
+    for source in sources:
+        if phonebook_format(source) not in READ_FORMATS:
+            raise ValueError(f"Cannot merge {source}: expected one of {', '.join(READ_FORMATS)}")
+    if phonebook_format(output) not in WRITE_FORMATS:
+        raise ValueError(f"Cannot merge into {output}: expected one of {', '.join(WRITE_FORMATS)}")
+    if rule not in CONFLICT_RULES:
+        raise ValueError(f"Unknown conflict rule {rule!r}: expected one of {', '.join(CONFLICT_RULES)}")
+    report = MergeReport(len(sources))
+    registry = None
+
+    with ExitStack() as stack, gc_paused():
+        streams = []
+        for done, source in enumerate(sources):
+            if progress is not None:
+                progress(done, len(sources))
+            source_registry = group_registry(groups).copy()
+            if phonebook_format(source) == "db" and os.path.abspath(source) != os.path.abspath(output):
+                database = stack.enter_context(ContactDatabase(source))
+                source_registry = database.group_registry(groups)
+                report.read += len(database)
+                # Stored in contact_sort_key order already
+                streams.append((contact_sort_key(contact), contact) for contact in database)
+            else:
+                # A database that is also the output is spilled like a file, as writing replaces it
+                step = (lambda: None) if progress is None else functools.partial(progress, done, len(sources))
+                runs = _sorted_runs(iter_phonebook(source, source_registry), report, step)
+                for run in runs:
+                    stack.callback(run.close)
+                streams.extend(_read_run(run) for run in runs)
+            if registry is None:
+                registry = source_registry
+            else:
+                for group in source_registry:
+                    registry.add(group)
+        if registry is None:
+            registry = group_registry(groups).copy()
+
+        # Ties go to the earlier stream, which keeps duplicates in source order
+        merged = heapq.merge(*streams, key=itemgetter(0))
+        contacts = _deduplicated(merged, CONFLICT_RULES[rule])
+        if progress is not None:
+            contacts = _reporting_progress(contacts, report, progress)
+        report.written = write_phonebook(output, contacts, registry)
+    trace.count("merge_duplicates", report.duplicates)
+    return report
+
+
+def _reporting_progress(contacts, report, progress):
+    for count, contact in enumerate(contacts, start=1):
+        if count % PROGRESS_INTERVAL == 0:
+            progress(count, report.read)
+        yield contact
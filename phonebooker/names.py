@@ -0,0 +1,173 @@
+"""Parsing of raw contact names, as found in CSV exports, into first and last names."""
+import csv
+import functools
+import os
+import re
+
+# Path of the larger nickname table shipped in resources/, loaded on first use
+DEFAULT_NICKNAME_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                     "resources", "nicknames.csv")
+
+# Built-in nickname mappings: key is the nickname, value the formal names it is short for
+COMMON_NICKNAMES = {
+    'kate': ['kathryn', 'katherine', 'kathleen'],
+    'kathy': ['kathryn', 'katherine'],
+    'katie': ['katherine', 'kathryn'],
+    'beth': ['elizabeth'],
+    'liz': ['elizabeth'],
+    'lizzy': ['elizabeth'],
+    'betty': ['elizabeth'],
+    'meg': ['margaret'],
+    'maggie': ['margaret'],
+    'peggy': ['margaret'],
+    'abby': ['abigail'],
+    'gabby': ['gabriella'],
+    'maddie': ['madeline'],
+    'madi': ['madeleine'],
+    'alex': ['alexandra', 'alexandria'],
+    'sandy': ['sandra'],
+    'becky': ['rebecca'],
+    'vicky': ['victoria'],
+    'val': ['valerie'],
+    'sue': ['susan'],
+    'susie': ['susan'],
+    'tom': ['thomas'],
+    'sam': ['samuel'],
+    'mike': ['michael'],
+    'mick': ['michael'],
+    'jim': ['james'],
+    'jimmy': ['james'],
+    'bob': ['robert'],
+    'rob': ['robert'],
+    'dick': ['richard'],
+    'rick': ['richard'],
+    'bill': ['william'],
+    'will': ['william'],
+    'matt': ['matthew'],
+    'chris': ['christopher'],
+    'tony': ['anthony'],
+    'don': ['donald'],
+    'ed': ['edward'],
+    'ted': ['edward'],
+    'joe': ['joseph'],
+    'pete': ['peter'],
+    'dan': ['daniel'],
+    'danny': ['daniel'],
+    'nick': ['nicholas'],
+    'dave': ['david'],
+    'steve': ['stephen', 'steven'],
+    'andy': ['andrew'],
+    'drew': ['andrew'],
+    'fred': ['frederick'],
+    'ben': ['benjamin'],
+    'charlie': ['charles'],
+    'chuck': ['charles'],
+}
+
+_PARENTHESIZED = re.compile(r'\([^)]*\)')
+
+
+def _pair(nickname, formal_name):
+    return f"{nickname} {formal_name}"
+
+
+def read_nickname_file(filename):
+    """Yield (nickname, formal name) pairs from a CSV of formal names each followed by their nicknames."""
+    with open(filename, newline='', encoding='utf-8') as nickname_file:
+        for row in csv.reader(nickname_file):
+            if not row or row[0].startswith('#'):
+                continue
+            formal_name = row[0].strip().lower()
+            for nickname in row[1:]:
+                nickname = nickname.strip().lower()
+                if nickname:
+                    yield nickname, formal_name
+
+
+class NameParser:
+    """Splits raw names into (first name, last name), dropping a leading nickname.
+
+    "Kate Kathryn Smith" becomes ("Kathryn", "Smith"). Nicknames come from
+    the nicknames mapping plus, if given, a CSV file that is only read the
+    first time a name could need it, so creating a parser is cheap. The
+    table is stored as one set of "nickname formal" strings, which makes a
+    lookup a single hash probe. Parsed names are memoized, since exports
+    tend to repeat the same raw names.
+    """
+
+    def __init__(self, nicknames=COMMON_NICKNAMES, nickname_file=None, cache_size=65536):
+        self._nicknames = nicknames
+        self._nickname_file = nickname_file
+        self._pairs = None
+        self._formal_names = None
+        self.parse = functools.lru_cache(maxsize=cache_size)(self._parse)
+
+    def _nickname_items(self):
+        for nickname, formal_names in self._nicknames.items():
+            for formal_name in formal_names:
+                yield nickname, formal_name
+        if self._nickname_file and os.path.exists(self._nickname_file):
+            yield from read_nickname_file(self._nickname_file)
+
+    def nickname_pairs(self):
+        """The frozenset of "nickname formal" strings, loading the nickname file on first use."""
+        if self._pairs is None:
+            self._pairs = frozenset(_pair(nickname, formal_name) for nickname, formal_name in self._nickname_items())
+        return self._pairs
+
+    def formal_names(self, nickname):
+        """The lowercase formal names nickname is short for, as a tuple (empty if it is no known nickname)."""
+        if self._formal_names is None:
+            formal_names = {}
+            for known_nickname, formal_name in self._nickname_items():
+                formal_names.setdefault(known_nickname, []).append(formal_name)
+            self._formal_names = {known_nickname: tuple(names) for known_nickname, names in formal_names.items()}
+        return self._formal_names.get(nickname.lower(), ())
+
+    def is_nickname_of(self, nickname, name):
+        return _pair(nickname.lower(), name.lower()) in self.nickname_pairs()
+
+    def _parse(self, name):
+        # Remove any parentheses and their contents
+        parts = _PARENTHESIZED.sub('', name).split()
+
+        # If we have multiple parts and they look like nickname + full name
+        if len(parts) >= 2:
+            first_part = parts[0].lower()
+            second_part = parts[1].lower()
+            if (len(first_part) >= 2 and first_part in second_part) or \
+                    _pair(first_part, second_part) in self.nickname_pairs():
+                parts = parts[1:]
+
+        # Capitalize each part
+        parts = [part.capitalize() for part in parts]
+
+        if len(parts) > 2:
+            # If there are more than two parts, assume the last part is the last name
+            return ' '.join(parts[:-1]), parts[-1]
+        elif len(parts) == 2:
+            return parts[0], parts[1]
+        elif len(parts) == 1:
+            return parts[0], ""
+        return "", ""
+
+    def parse_names(self, names):
+        """Parse every raw name in names, returning a list of (first name, last name) tuples."""
+        parse = self.parse
+        return [parse(name) for name in names]
+
+    def clear_cache(self):
+        self.parse.cache_clear()
+
+
+default_parser = NameParser(nickname_file=DEFAULT_NICKNAME_FILE)
+
+
+def parse_complex_name(name):
+    """Split a raw name into (first name, last name) with the default parser."""
+    return default_parser.parse(name)
+
+
+def parse_names(names):
+    """Batch form of parse_complex_name."""
+    return default_parser.parse_names(names)
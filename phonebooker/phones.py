@@ -0,0 +1,113 @@
+"""Table-driven phone number normalization.
+
+A numbering plan is a list of rules ``(prefix, phone type, digits to strip)``.
+The rules are compiled into a prefix trie over digits, and every number is
+classified, stripped of its country or trunk prefix and reduced to a
+canonical key in a single walk of that trie.
+"""
+import csv
+import re
+from collections import namedtuple
+
+# The rules PhoneBooker Pro has always applied: numbers starting with the
+# country code 61 or the area code 2 are landlines and lose that prefix,
+# everything else is a mobile and is kept as it is. Mobiles written in
+# international form (+61 4...) stay mobiles, as they were before "+" was
+# skipped while matching
+DEFAULT_NUMBERING_PLAN = (
+    ("614", "Mobile", 0),
+    ("61", "Home", 2),
+    ("2", "Home", 1),
+    ("", "Mobile", 0),
+)
+
+# Characters skipped over while matching a prefix, so "+61 2..." matches like "612..."
+SEPARATORS = " +-.()/"
+
+NormalizedPhone = namedtuple("NormalizedPhone", "phone_type number key")
+
+_NON_DIGITS = re.compile(r'\D')
+
+
+def digits(text):
+    """The decimal digits of text, as used for duplicate detection."""
+    if text.isdecimal():
+        return text
+    return _NON_DIGITS.sub('', text)
+
+
+def read_numbering_plan(filename):
+    """Read (prefix, phone type, digits to strip) rules from a CSV file with a header row.
+
+    An empty prefix gives the rule for numbers no other prefix matches.
+    """
+    with open(filename, newline='', encoding='utf-8') as plan_file:
+        reader = csv.reader(plan_file)
+        next(reader, None)
+        return [(prefix.strip(), phone_type.strip(), int(strip))
+                for prefix, phone_type, strip in (row for row in reader if row and not row[0].startswith('#'))]
+
+
+class PhoneNormalizer:
+    """Normalizes raw phone numbers according to a numbering plan.
+
+    The longest matching prefix wins. Its rule gives the phone type and how
+    many leading digits to strip. Separators before and inside the prefix
+    are skipped while matching.
+    """
+
+    def __init__(self, plan=DEFAULT_NUMBERING_PLAN):
+        # Trie of dicts keyed by digit; the rule of a node is stored under None
+        self._root = {}
+        for prefix, phone_type, strip in plan:
+            if strip > len(prefix):
+                raise ValueError(f"Cannot strip {strip} digits from prefix {prefix!r}")
+            node = self._root
+            for digit in prefix:
+                node = node.setdefault(digit, {})
+            node[None] = (phone_type, strip)
+        if None not in self._root:
+            raise ValueError("Numbering plan needs a rule with an empty prefix")
+
+    @classmethod
+    def from_file(cls, filename):
+        return cls(read_numbering_plan(filename))
+
+    def normalize(self, raw):
+        """Return a NormalizedPhone with the type, the stripped number and its canonical key."""
+        node = self._root
+        phone_type, strip = node[None]
+        # Index in raw just past each digit matched so far
+        ends = []
+        for i, char in enumerate(raw):
+            if char in SEPARATORS:
+                continue
+            node = node.get(char)
+            if node is None:
+                break
+            ends.append(i + 1)
+            rule = node.get(None)
+            if rule is not None:
+                phone_type, strip = rule
+
+        if strip:
+            number = raw[ends[strip - 1]:].lstrip(SEPARATORS)
+        else:
+            number = raw
+        return NormalizedPhone(phone_type, number, digits(number))
+
+    def normalize_many(self, numbers):
+        """Normalize every number in numbers, returning a list of NormalizedPhone."""
+        normalize = self.normalize
+        return [normalize(number) for number in numbers]
+
+
+default_normalizer = PhoneNormalizer()
+
+
+def normalize_phone(raw):
+    return default_normalizer.normalize(raw)
+
+
+def normalize_phones(numbers):
+    return default_normalizer.normalize_many(numbers)
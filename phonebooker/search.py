@@ -0,0 +1,242 @@
+"""Fuzzy matching of contact fields, and the index that keeps searches of large phonebooks fast."""
+import gc
+import re
+
+from . import trace
+
+# Minimum similarity ratio for fuzzy matching
+SIMILARITY_THRESHOLD = 75
+
+SEARCH_FIELDS = ("first_name", "last_name", "phone_type", "phone_number", "groups", "company")
+
+# Phone numbers are matched by substring rather than fuzzily
+SUBSTRING_FIELDS = ("phone_number",)
+
+_NON_ALNUM = re.compile(r'[\W_]+')
+
+
+def field_text(contact, field):
+    """Return the text of a contact field as it is shown in the contacts table."""
+    if field == "groups":
+        return ", ".join(contact.groups)
+    return getattr(contact, field)
+
+
+def normalize(text):
+    """Lowercase and strip punctuation the same way thefuzz preprocesses strings."""
+    return _NON_ALNUM.sub(' ', text).lower().strip()
+
+
+def score_names(query, names, case_sensitive=False, exact_match=False, threshold=SIMILARITY_THRESHOLD):
+    """Return the positions in names that match query the way the "Name Only" search does.
+
+    Kept at module level so it can be sent to a process pool.
+    """
+    # Imported on first use: thefuzz and its backend are among the slowest imports of the app
+    from thefuzz import fuzz
+
+    if not case_sensitive:
+        query = query.lower()
+    positions = []
+    for position, name in enumerate(names):
+        if not case_sensitive:
+            name = name.lower()
+        if exact_match:
+            matched = name == query
+        else:
+            # Use token_set_ratio for better partial matching
+            matched = fuzz.token_set_ratio(query, name) >= threshold
+        if matched:
+            positions.append(position)
+    return positions
+
+
+def word_key(text):
+    """The words of text as token_set_ratio compares them: processed the way thefuzz does, deduplicated and sorted.
+
+    thefuzz drops Latin-1 letters before comparing (force_ascii), so "Zoë"
+    has the key "zo". Texts with the same key score the same against any query.
+    """
+    from thefuzz import utils
+
+    return " ".join(sorted(set(utils.full_process(text, force_ascii=True).split())))
+
+
+def substring_trigrams(text):
+    """Unpadded trigrams; every trigram of a substring also occurs in the containing string."""
+    text = text.lower()
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class TrigramIndex:
+    """Index from field values to the contacts holding them.
+
+    Phone numbers, matched by substring, are indexed by trigram. Other
+    fields are indexed by word_key and every distinct key is scored once
+    per search: a shared trigram is no bound on token_set_ratio ("nguyn"
+    scores 80 against "nuyen"), so they can't be narrowed by trigram
+    without missing matches. Contacts are tracked by contact_id (see ContactStore), so edits
+    should remove the old Contact and add its replacement. rebuild() only
+    records the contact list; the index is built from it on the first
+    search, so loading a phonebook never pays for an index that may not be
+    used.
+    """
+
+    def __init__(self, contacts=()):
+        self._pending = None
+        self._contacts = {}
+        # Trigram postings of substring fields, contacts by word key of the others
+        self._postings = {field: {} for field in SEARCH_FIELDS}
+        self._entries = {}
+        # Many contacts share field values (groups, phone types, companies)
+        self._entry_cache = {field: {} for field in SEARCH_FIELDS}
+        self.rebuild(contacts)
+
+    def __len__(self):
+        self._build_pending()
+        return len(self._contacts)
+
+    def rebuild(self, contacts):
+        """Reindex contacts on next use.
+
+        The list is kept by reference: contacts added to or removed from it
+        before the first search are picked up when the index is built.
+        """
+        self._contacts.clear()
+        self._entries.clear()
+        for field in SEARCH_FIELDS:
+            self._postings[field].clear()
+            self._entry_cache[field].clear()
+        self._pending = contacts
+
+    def _build_pending(self):
+        if self._pending is None:
+            return
+        contacts, self._pending = self._pending, None
+        # The index allocates millions of small objects; cyclic GC passes over them are wasted work
+        gc_was_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            with trace.span("build_search_index") as span:
+                for contact in contacts:
+                    self.add(contact)
+                span.set(contacts=len(self._contacts))
+        finally:
+            if gc_was_enabled:
+                gc.enable()
+
+    def _field_entry(self, field, text):
+        """The trigrams of text for substring fields, its word_key for the others."""
+        cache = self._entry_cache[field]
+        entry = cache.get(text)
+        if entry is None:
+            entry = substring_trigrams(text) if field in SUBSTRING_FIELDS else word_key(text)
+            if len(cache) < 100000:
+                cache[text] = entry
+        return entry
+
+    def add(self, contact):
+        if self._pending is not None:
+            return
+        contact_id = contact.contact_id
+        if contact_id in self._contacts:
+            self.remove(contact)
+        contact_entries = []
+        for field in SEARCH_FIELDS:
+            entry = self._field_entry(field, field_text(contact, field))
+            postings = self._postings[field]
+            for key in (entry if field in SUBSTRING_FIELDS else (entry,)):
+                posting = postings.get(key)
+                if posting is None:
+                    postings[key] = {contact_id}
+                else:
+                    posting.add(contact_id)
+            contact_entries.append(entry)
+        self._contacts[contact_id] = contact
+        self._entries[contact_id] = contact_entries
+
+    def remove(self, contact):
+        if self._pending is not None:
+            return
+        contact_id = contact.contact_id
+        contact_entries = self._entries.pop(contact_id, None)
+        if contact_entries is None:
+            return
+        for field, entry in zip(SEARCH_FIELDS, contact_entries):
+            postings = self._postings[field]
+            for key in (entry if field in SUBSTRING_FIELDS else (entry,)):
+                posting = postings[key]
+                posting.discard(contact_id)
+                if not posting:
+                    del postings[key]
+        del self._contacts[contact_id]
+
+    def replace(self, old_contact, new_contact):
+        self.remove(old_contact)
+        self.add(new_contact)
+
+    def candidates(self, query, field):
+        """contact_ids of contacts that could equal or contain query in field.
+
+        Substring fields need all of the query's trigrams, and queries too
+        short to produce any fall back to every indexed contact. Other
+        fields need the query's word_key.
+        """
+        self._build_pending()
+        postings = self._postings[field]
+        if field not in SUBSTRING_FIELDS:
+            return set(postings.get(word_key(query), ()))
+
+        grams = substring_trigrams(query)
+        if not grams:
+            return set(self._contacts)
+        lists = sorted((postings.get(gram, set()) for gram in grams), key=len)
+        result = set(lists[0])
+        for posting in lists[1:]:
+            result &= posting
+            if not result:
+                break
+        return result
+
+    def fuzzy_matches(self, query, field, threshold=SIMILARITY_THRESHOLD):
+        """contact_ids of contacts whose field scores at least threshold against query with fuzz.token_set_ratio."""
+        from rapidfuzz import fuzz, process
+
+        self._build_pending()
+        postings = self._postings[field]
+        result = set()
+        # Scores within half a point of threshold may still round up to it, as thefuzz's do
+        for key, score, _ in process.extract(word_key(query), list(postings), scorer=fuzz.token_set_ratio,
+                                             processor=None, score_cutoff=threshold - 0.5, limit=None):
+            if round(score) >= threshold:
+                result |= postings[key]
+        return result
+
+    def search(self, query, fields=SEARCH_FIELDS, case_sensitive=False, exact_match=False,
+               threshold=SIMILARITY_THRESHOLD):
+        """Return the contact_ids of contacts matching query in any of fields.
+
+        Matching follows the contacts table search: exact comparison when
+        exact_match is set, substring matching for phone numbers, and
+        token_set_ratio >= threshold for every other field. Each distinct
+        value of a fuzzy field is scored once, however many contacts share it.
+        """
+        self._build_pending()
+        if not case_sensitive:
+            query = query.lower()
+
+        matches = set()
+        scored = 0
+        for field in fields:
+            if not exact_match and field not in SUBSTRING_FIELDS:
+                matches |= self.fuzzy_matches(query, field, threshold)
+                scored += len(self._postings[field])
+                continue
+            for contact_id in self.candidates(query, field) - matches:
+                text = field_text(self._contacts[contact_id], field)
+                if not case_sensitive:
+                    text = text.lower()
+                if text == query if exact_match else query in text:
+                    matches.add(contact_id)
+        trace.count("fuzzy_comparisons", scored)
+        return matches
@@ -0,0 +1,213 @@
+"""Timing spans and counters, for diagnosing slow operations without a profiler.
+
+Tracing is off unless the PHONEBOOKER_TRACE environment variable names an
+output file, or enable() is called (the command line's --trace does). While
+it is off, span() returns one shared do-nothing span and count() returns at
+once, so instrumented code pays a function call and nothing more.
+
+What is written depends on the file name:
+
+- ``*.jsonl``: one JSON object per span, appended as soon as the span ends,
+  so the log survives a crash or a hang;
+- anything else: a trace in Chrome's Trace Event Format, written at exit,
+  which chrome://tracing and https://ui.perfetto.dev show as a timeline.
+
+Either way, each span is a Trace Event ``{"name", "ph": "X", "ts", "dur",
+"pid", "tid", "args"}`` with times in microseconds. Counters (contacts
+read, fuzzy comparisons made, ...) are kept per thread: a span's args
+include how much each counter grew on its thread while it was open, and the
+totals are written at exit. Only the process that enabled tracing records
+anything; process pool workers don't.
+"""
+import atexit
+import functools
+import json
+import os
+import threading
+import time
+
+TRACE_ENV = "PHONEBOOKER_TRACE"
+
+# Set by enable(): processes started from this one inherit the environment but mustn't write the trace too
+_OWNER_ENV = "PHONEBOOKER_TRACE_OWNER"
+
+_tracer = None
+
+
+class _NullSpan:
+    """What span() returns while tracing is off."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def set(self, **args):
+        pass
+
+    def end(self, **args):
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class Span:
+    """A timed operation, ended by leaving its with block or by calling end().
+
+    set() adds arguments, such as how many contacts were processed, before
+    the span ends.
+    """
+
+    __slots__ = ("name", "args", "_tracer", "_thread_id", "_counters", "_counters_at_start", "_start")
+
+    def __init__(self, tracer, name, args):
+        self.name = name
+        self.args = args
+        self._tracer = tracer
+        self._thread_id = threading.get_ident()
+        self._counters = tracer.thread_counters()
+        self._counters_at_start = dict(self._counters)
+        self._start = time.perf_counter_ns()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        if exc_type is not None:
+            self.args["error"] = exc_type.__name__
+        self.end()
+        return False
+
+    def set(self, **args):
+        self.args.update(args)
+
+    def end(self, **args):
+        if self._tracer is None:
+            return
+        end = time.perf_counter_ns()
+        self.args.update(args)
+        for name, value in list(self._counters.items()):
+            grown = value - self._counters_at_start.get(name, 0)
+            if grown:
+                self.args[name] = grown
+        self._tracer.record(self.name, self._start, end, self._thread_id, self.args)
+        self._tracer = None
+
+
+class Tracer:
+    """Collects spans and counters and writes them to path (see the module docstring)."""
+
+    def __init__(self, path):
+        self.path = path
+        self.streaming = path.endswith(".jsonl")
+        self._pid = os.getpid()
+        self._origin = time.perf_counter_ns()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._thread_counters = []
+        self._events = []
+        self._log = open(path, "a", encoding="utf-8") if self.streaming else None
+
+    def thread_counters(self):
+        """The counters of the calling thread, a dict from counter name to value."""
+        counters = getattr(self._local, "counters", None)
+        if counters is None:
+            counters = self._local.counters = {}
+            # Names the thread in the timeline
+            self._write({"name": "thread_name", "ph": "M", "pid": self._pid, "tid": threading.get_ident(),
+                         "args": {"name": threading.current_thread().name}}, counters)
+        return counters
+
+    def count(self, name, amount):
+        counters = self.thread_counters()
+        counters[name] = counters.get(name, 0) + amount
+
+    def totals(self):
+        totals = {}
+        with self._lock:
+            for counters in self._thread_counters:
+                for name, value in list(counters.items()):
+                    totals[name] = totals.get(name, 0) + value
+        return totals
+
+    def record(self, name, start, end, thread_id, args):
+        if os.getpid() != self._pid:
+            return
+        self._write({"name": name, "ph": "X", "ts": (start - self._origin) / 1000, "dur": (end - start) / 1000,
+                     "pid": self._pid, "tid": thread_id, "args": args})
+
+    def _write(self, event, new_counters=None):
+        with self._lock:
+            if new_counters is not None:
+                self._thread_counters.append(new_counters)
+            if self._log is not None:
+                self._log.write(json.dumps(event, default=str) + "\n")
+                self._log.flush()
+            else:
+                self._events.append(event)
+
+    def close(self):
+        if os.getpid() != self._pid:
+            return
+        totals = self.totals()
+        if self._log is not None:
+            self._log.write(json.dumps({"name": "counters", "ph": "M", "pid": self._pid, "args": totals}) + "\n")
+            self._log.close()
+            return
+        with open(self.path, "w", encoding="utf-8") as output:
+            json.dump({"traceEvents": self._events, "displayTimeUnit": "ms", "otherData": {"counters": totals}},
+                      output, default=str)
+
+
+def enable(path):
+    """Start tracing to path, replacing any trace already being written; the trace is completed at exit."""
+    global _tracer
+    disable()
+    _tracer = Tracer(path)
+    os.environ[_OWNER_ENV] = str(os.getpid())
+
+
+def disable():
+    """Stop tracing and write out what was traced so far."""
+    global _tracer
+    tracer, _tracer = _tracer, None
+    if tracer is not None:
+        tracer.close()
+
+
+def is_enabled():
+    return _tracer is not None
+
+
+def span(name, **args):
+    """A Span timing name, or a do-nothing span while tracing is off. Use it in a with statement."""
+    if _tracer is None:
+        return _NULL_SPAN
+    return Span(_tracer, name, args)
+
+
+def count(name, amount=1):
+    """Add amount to the counter called name. Count a batch at a time rather than in per-item loops."""
+    if _tracer is not None:
+        _tracer.count(name, amount)
+
+
+def traced(name):
+    """Decorator timing every call of a function as a span called name."""
+    def decorate(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if _tracer is None:
+                return function(*args, **kwargs)
+            with Span(_tracer, name, {}):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+atexit.register(disable)
+
+if os.environ.get(TRACE_ENV) and os.environ.get(_OWNER_ENV, str(os.getpid())) == str(os.getpid()):
+    enable(os.environ[TRACE_ENV])
@@ -0,0 +1,436 @@
+"""vCard (VCF) reading and writing."""
+import mmap
+import os
+import quopri
+import re
+
+from . import trace
+from .core import (DEFAULT_GROUPS, PROGRESS_INTERVAL, Contact, GroupRegistry, group_registry, iter_xml_contacts,
+                   parse_complex_name, write_contacts, write_xml_phonebook)
+
+VCARD_VERSIONS = ("3.0", "4.0")
+
+# vCard TYPE values for the app's phone types
+TEL_TYPES = {"Home": "home", "Work": "work", "Mobile": "cell"}
+PHONE_TYPES = {tel_type: phone_type for phone_type, tel_type in TEL_TYPES.items()}
+
+# RFC 6350 3.2: lines longer than this many octets are folded
+FOLD_OCTETS = 75
+
+_TEXT_ESCAPES = str.maketrans({"\\": "\\\\", ",": "\\,", ";": "\\;", "\n": "\\n", "\r": ""})
+_NEEDS_ESCAPE = re.compile(r'[\\,;\n\r]')
+
+
+def escape_text(value):
+    """Escape a text value, or one component of a structured value, per RFC 6350 3.4."""
+    # Most values need no escaping, and searching is much cheaper than translating
+    if _NEEDS_ESCAPE.search(value) is None:
+        return value
+    return value.translate(_TEXT_ESCAPES)
+
+
+def fold_line(line):
+    """Fold a content line into chunks of at most FOLD_OCTETS UTF-8 octets.
+
+    Continuation lines start with a space, which counts towards their
+    length, and multi-byte characters are never split.
+    """
+    if len(line) <= FOLD_OCTETS and line.isascii():
+        return line
+    encoded = line.encode('utf-8')
+    if len(encoded) <= FOLD_OCTETS:
+        return line
+
+    pieces = []
+    start = 0
+    limit = FOLD_OCTETS
+    while len(encoded) - start > limit:
+        end = start + limit
+        # Back up to the start of a character
+        while encoded[end] & 0xC0 == 0x80:
+            end -= 1
+        pieces.append(encoded[start:end].decode('utf-8'))
+        start = end
+        limit = FOLD_OCTETS - 1
+    pieces.append(encoded[start:].decode('utf-8'))
+    return "\r\n ".join(pieces)
+
+
+class VCardSerializer:
+    """Turns contacts into complete vCards, CRLF line endings included.
+
+    The TEL and CATEGORIES line prefixes are cached by phone type and group
+    mask, since a handful of them repeat across a whole directory.
+    """
+
+    def __init__(self, version="3.0"):
+        if version not in VCARD_VERSIONS:
+            raise ValueError(f"Unsupported vCard version {version!r}; expected one of {VCARD_VERSIONS}")
+        self.version = version
+        self._header = f"BEGIN:VCARD\r\nVERSION:{version}"
+        self._tel_prefixes = {}
+        self._categories = {}
+
+    def _tel_prefix(self, phone_type):
+        prefix = self._tel_prefixes.get(phone_type)
+        if prefix is None:
+            tel_type = TEL_TYPES.get(phone_type, phone_type.lower())
+            if self.version == "3.0":
+                tel_type = tel_type.upper()
+            prefix = self._tel_prefixes[phone_type] = f"TEL;TYPE={escape_text(tel_type)}:"
+        return prefix
+
+    def _categories_line(self, contact):
+        line = self._categories.get(contact.group_mask)
+        if line is None:
+            line = self._categories[contact.group_mask] = \
+                f"CATEGORIES:{','.join(escape_text(group) for group in contact.groups)}"
+        return line
+
+    def __call__(self, contact):
+        first_name = escape_text(contact.first_name)
+        last_name = escape_text(contact.last_name)
+        full_name = f"{contact.first_name} {contact.last_name}".strip() or contact.company or contact.phone_number
+
+        lines = [self._header, f"N:{last_name};{first_name};;;", f"FN:{escape_text(full_name)}"]
+        if contact.phone_number:
+            lines.append(self._tel_prefix(contact.phone_type) + escape_text(contact.phone_number))
+        if contact.company:
+            lines.append(f"ORG:{escape_text(contact.company)}")
+        if contact.group_mask:
+            lines.append(self._categories_line(contact))
+        lines.append("END:VCARD\r\n")
+        card = "\r\n".join(lines)
+
+        # A UTF-8 character is at most 4 octets, so only long lines or non-ASCII cards can need folding
+        longest = max(map(len, lines))
+        if longest > FOLD_OCTETS // 4 and (longest > FOLD_OCTETS or not card.isascii()):
+            card = "\r\n".join([fold_line(line) for line in card.split("\r\n")])
+        return card
+
+
+def vcard_text(contact, version="3.0"):
+    """A single contact as a vCard."""
+    return VCardSerializer(version)(contact)
+
+
+def write_vcards(filename, contacts, version="3.0", progress=None):
+    """Write contacts from any iterable to a VCF file and return the number written.
+
+    Every card is built with a single join and cards are flushed to disk in
+    large buffered chunks (see write_contacts), which also handles progress.
+    """
+    return write_contacts(filename, contacts, VCardSerializer(version), progress)
+
+
+@trace.traced("convert_xml_to_vcf")
+def convert_xml_to_vcf(input_file, output_file, groups=DEFAULT_GROUPS, version="3.0"):
+    """Convert an XML phonebook to a VCF file and return the number of contacts written."""
+    return write_vcards(output_file, iter_xml_contacts(input_file, groups), version)
+
+
+# The only properties that become Contact fields
+_PROPERTIES = {name.encode(): name for name in ("N", "FN", "TEL", "ORG", "CATEGORIES")}
+_CATEGORY_PROPERTIES = {b"CATEGORIES": "CATEGORIES"}
+
+# Bare vCard 2.1 parameters that give the encoding rather than a type, e.g. "TEL;CELL;QUOTED-PRINTABLE:"
+_ENCODINGS = {"QUOTED-PRINTABLE", "BASE64", "B", "8BIT", "7BIT"}
+
+_ESCAPED = re.compile(r'\\(.)', re.DOTALL)
+_FOLD = re.compile(rb'\n[ \t]')
+
+# Bytes of a VCF file unfolded at a time
+READ_CHUNK_SIZE = 1 << 20
+
+
+def _unescape_char(match):
+    char = match.group(1)
+    return "\n" if char in "nN" else char
+
+
+def unescape_text(value):
+    """Undo the backslash escaping of a text value."""
+    if "\\" not in value:
+        return value
+    return _ESCAPED.sub(_unescape_char, value)
+
+
+def split_value(value, separator):
+    """Split a structured or list value on unescaped separators, unescaping each part."""
+    if "\\" not in value:
+        return value.split(separator)
+    parts = []
+    current = []
+    chars = iter(value)
+    for char in chars:
+        if char == "\\":
+            char = next(chars, "")
+            current.append("\n" if char in "nN" else char)
+        elif char == separator:
+            parts.append("".join(current))
+            current = []
+        else:
+            current.append(char)
+    parts.append("".join(current))
+    return parts
+
+
+def _split_outside_quotes(text, separator, maxsplit=-1):
+    """Like text.split(separator, maxsplit), ignoring separators inside double quotes; text is str or bytes."""
+    quote = '"' if isinstance(text, str) else b'"'
+    if quote not in text:
+        return text.split(separator, maxsplit)
+    parts = []
+    start = 0
+    quoted = False
+    for i in range(len(text)):
+        char = text[i:i + 1]
+        if char == quote:
+            quoted = not quoted
+        elif char == separator and not quoted and maxsplit != 0:
+            parts.append(text[start:i])
+            start = i + 1
+            maxsplit -= 1
+    parts.append(text[start:])
+    return parts
+
+
+def unfolded_lines(source, chunk_size=READ_CHUNK_SIZE):
+    """Yield the logical content lines of a vCard stream as bytes.
+
+    Folded lines (continuations starting with a space or tab) are joined, as
+    are vCard 2.1 quoted-printable values whose lines end in a soft break.
+    source is read in chunks with read(), so a memory map works, and each
+    chunk is unfolded with a single regex substitution.
+    """
+    tail = b''
+    pending = None
+    while True:
+        chunk = source.read(chunk_size)
+        data = tail + chunk
+        if chunk:
+            # Hold back everything after the last line break that isn't a fold,
+            # since the next chunk may still continue it
+            cut = data.rfind(b'\n', 0, len(data) - 1)
+            while cut >= 0 and data[cut + 1] in b' \t':
+                cut = data.rfind(b'\n', 0, cut)
+            if cut < 0:
+                tail = data
+                continue
+            data, tail = data[:cut + 1], data[cut + 1:]
+        elif not data:
+            break
+        else:
+            tail = b''
+
+        lines = _FOLD.sub(b'', data.replace(b'\r\n', b'\n')).split(b'\n')
+        if not lines[-1]:
+            lines.pop()  # data ended with a line break
+        for line in lines:
+            if pending is not None:
+                line = pending + line
+                pending = None
+            if line.endswith(b'=') and b'QUOTED-PRINTABLE' in line.partition(b':')[0].upper():
+                pending = line[:-1]
+            elif line:
+                yield line
+    if pending:
+        yield pending
+
+
+def parse_content_line(line):
+    """Split a logical content line into (name, params, value).
+
+    The property name is uppercased and stripped of any group prefix such as
+    "item1.". params maps uppercased parameter names to lists of values; bare
+    vCard 2.1 parameters count as TYPE or ENCODING values. The value is
+    decoded from quoted-printable and its CHARSET, but not unescaped.
+    Returns None for lines without a colon.
+    """
+    head_and_value = _split_outside_quotes(line, b':', 1)
+    if len(head_and_value) < 2:
+        return None
+    head, raw_value = head_and_value
+    if b';' not in head:
+        return head.decode('utf-8', 'replace').strip().rpartition('.')[2].upper(), {}, \
+            raw_value.decode('utf-8', 'replace')
+    parts = _split_outside_quotes(head.decode('utf-8', 'replace'), ';')
+    name = parts[0].strip().rpartition('.')[2].upper()
+
+    params = {}
+    for part in parts[1:]:
+        param_name, has_value, param_values = part.partition('=')
+        param_name = param_name.strip().upper()
+        if not has_value:
+            param_name, param_values = ("ENCODING" if param_name in _ENCODINGS else "TYPE"), param_name
+        params.setdefault(param_name, []).extend(
+            param_value.strip().strip('"') for param_value in _split_outside_quotes(param_values, ','))
+
+    encodings = params.get("ENCODING", ())
+    if "QUOTED-PRINTABLE" in (encoding.upper() for encoding in encodings):
+        raw_value = quopri.decodestring(raw_value)
+    charset = params.get("CHARSET", ["utf-8"])[0]
+    try:
+        value = raw_value.decode(charset, 'replace')
+    except LookupError:
+        value = raw_value.decode('utf-8', 'replace')
+    return name, params, value
+
+
+def _phone_type(types):
+    """App phone type for a TEL's TYPE values; phones without a known type count as mobiles."""
+    # A quoted list such as TYPE="voice,work" arrives as a single value
+    lowered = {tel_type.lower() for value in types for tel_type in value.split(",")}
+    if "cell" in lowered or "mobile" in lowered:
+        return "Mobile"
+    for tel_type in ("work", "home"):
+        if tel_type in lowered:
+            return PHONE_TYPES[tel_type]
+    return "Mobile"
+
+
+def _tel_preference(params):
+    """Sort key putting preferred numbers first: TYPE=pref (3.0), then PREF=1..100 (4.0)."""
+    if "pref" in (tel_type.lower() for value in params.get("TYPE", ()) for tel_type in value.split(",")):
+        return 0
+    try:
+        return int(params.get("PREF", ["101"])[0])
+    except ValueError:
+        return 101
+
+
+class _Card:
+    """The properties of one vCard that become Contact fields."""
+
+    __slots__ = ("name", "full_name", "company", "phones", "categories")
+
+    def __init__(self):
+        self.name = None
+        self.full_name = ""
+        self.company = ""
+        self.phones = []
+        self.categories = []
+
+    def add(self, name, params, value):
+        if name == "N":
+            self.name = split_value(value, ";")
+        elif name == "FN":
+            self.full_name = unescape_text(value).strip()
+        elif name == "TEL":
+            number = unescape_text(value).strip()
+            if number[:4].lower() == "tel:":
+                number = number[4:]
+            if number:
+                self.phones.append((_tel_preference(params), _phone_type(params.get("TYPE", ())), number))
+        elif name == "ORG":
+            self.company = split_value(value, ";")[0].strip()
+        elif name == "CATEGORIES":
+            self.categories.extend(category.strip() for category in split_value(value, ","))
+
+    def contacts(self, groups):
+        """One Contact per phone number, preferred numbers first, or a single one without a number."""
+        if self.name and any(self.name[:2]):
+            last_name = self.name[0].strip()
+            # Given name plus any additional names
+            first_name = " ".join(part.strip() for part in self.name[1:3] if part.strip())
+        else:
+            first_name, last_name = parse_complex_name(self.full_name)
+        if isinstance(groups, GroupRegistry):
+            card_groups = [group for group in dict.fromkeys(self.categories) if group]
+            for group in card_groups:
+                groups.add(group)
+        else:
+            card_groups = [group for group in dict.fromkeys(self.categories) if groups is None or group in groups]
+
+        phones = sorted(self.phones, key=lambda phone: phone[0]) or [(0, "Mobile", "")]
+        return [Contact(first_name, last_name, phone_type, number, card_groups, self.company)
+                for _, phone_type, number in phones]
+
+
+def _iter_cards(mapped, properties=_PROPERTIES):
+    """Yield a _Card for every top-level vCard in mapped, holding the properties named in properties."""
+    card = None
+    depth = 0
+    for line in unfolded_lines(mapped):
+        head, colon, raw_value = line.partition(b':')
+        if not colon:
+            continue
+        # Look at the property name before doing any real parsing
+        name = head.split(b';', 1)[0].upper()
+        if b'.' in name:
+            name = name.rpartition(b'.')[2]
+
+        if name == b"BEGIN" and raw_value.strip().upper() == b"VCARD":
+            depth += 1
+            if depth == 1:
+                card = _Card()
+        elif name == b"END" and raw_value.strip().upper() == b"VCARD":
+            if depth == 1:
+                yield card
+                card = None
+            depth = max(depth - 1, 0)
+        # Properties of nested cards (vCard 2.1 AGENT) are skipped
+        elif depth == 1 and name in properties:
+            if b';' in head or b'"' in line:
+                card.add(*parse_content_line(line))
+            else:
+                card.add(properties[name], {}, raw_value.decode('utf-8', 'replace'))
+
+
+def iter_vcf_contacts(filename, groups=DEFAULT_GROUPS, progress=None):
+    """Stream Contact objects out of a VCF file of vCard 2.1, 3.0 or 4.0 cards.
+
+    The file is memory-mapped and read one logical line at a time, so memory
+    use stays flat however large the export is. Folded lines, property
+    groups (item1.TEL), quoted parameters, quoted-printable values and
+    escaped text are all handled. A card with several phone numbers yields
+    one contact per number, preferred number first. Categories not in a
+    list of groups are dropped; a GroupRegistry takes them in as new
+    groups, and groups=None keeps them without registering them. progress,
+    if given, is called with (bytes read, file size).
+    """
+    if groups is not None and not isinstance(groups, GroupRegistry):
+        groups = frozenset(groups)
+    with open(filename, 'rb') as source:
+        total = os.fstat(source.fileno()).st_size
+        if total == 0:
+            return
+        with mmap.mmap(source.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            count = 0
+            for count, card in enumerate(_iter_cards(mapped), start=1):
+                yield from card.contacts(groups)
+                if progress is not None and count % PROGRESS_INTERVAL == 0:
+                    progress(mapped.tell(), total)
+
+            trace.count("vcards_read", count)
+            if progress is not None:
+                progress(total, total)
+
+
+def vcf_categories(filename):
+    """The categories used by the cards of a VCF file, in the order they first appear.
+
+    Reads only the CATEGORIES lines, so the groups of a VCF file can be
+    registered before its contacts are streamed.
+    """
+    categories = {}
+    with open(filename, 'rb') as source:
+        if os.fstat(source.fileno()).st_size == 0:
+            return []
+        with mmap.mmap(source.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            for card in _iter_cards(mapped, _CATEGORY_PROPERTIES):
+                categories.update(dict.fromkeys(card.categories))
+    return [category for category in categories if category]
+
+
+@trace.traced("convert_vcf_to_xml")
+def convert_vcf_to_xml(input_file, output_file, groups=DEFAULT_GROUPS):
+    """Convert a VCF file to an XML phonebook and return the number of contacts written.
+
+    Categories not in groups become new groups of the phonebook.
+    """
+    registry = group_registry(groups)
+    # The group table is written before the contacts, so it must already hold every category
+    for category in vcf_categories(input_file):
+        registry.add(category)
+    return write_xml_phonebook(output_file, iter_vcf_contacts(input_file, registry), registry)
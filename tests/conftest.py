@@ -0,0 +1,22 @@
+import json
+import os
+import subprocess
+import sys
+import textwrap
+
+import pytest
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _run_session(code, **variables):
+    """Run code in a fresh interpreter, whose GROUP_TABLE only holds the default groups, and return its JSON output."""
+    prelude = "".join(f"{name} = {value!r}\n" for name, value in variables.items())
+    result = subprocess.run([sys.executable, "-c", prelude + textwrap.dedent(code)], cwd=REPO_ROOT,
+                            capture_output=True, text=True, check=True)
+    return json.loads(result.stdout)
+
+
+@pytest.fixture
+def run_session():
+    return _run_session
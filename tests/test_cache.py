@@ -0,0 +1,94 @@
+import os
+import threading
+
+from phonebooker.cache import build_cache, cache_path, cached_contacts, read_cache, write_cache
+from phonebooker.core import DEFAULT_GROUPS, Contact, GroupRegistry, iter_xml_contacts, write_xml_phonebook
+from phonebooker.journal import contact_record
+
+CONTACTS = [Contact("Ann", "Lee", "Mobile", "0411", ["Work"]),
+            Contact("Bob", "Ray", "Home", "0422", ["Family", "Friends"], "Acme"),
+            Contact("Zoë", "Ünal", "Work", "0433", [])]
+
+
+def cached_phonebook(tmp_path, groups=DEFAULT_GROUPS):
+    """The path of a phonebook of CONTACTS whose cache is written."""
+    path = str(tmp_path / "phonebook.xml")
+    write_xml_phonebook(path, CONTACTS)
+    contacts, data = build_cache(path, iter_xml_contacts, groups)
+    assert data is not None and write_cache(path, data)
+    return path
+
+
+def records(contacts):
+    return sorted(contact_record(contact) for contact in contacts)
+
+
+def test_current_cache_is_read(tmp_path):
+    path = cached_phonebook(tmp_path)
+    assert records(read_cache(path)) == records(CONTACTS)
+
+
+def test_cache_restores_the_phonebook_group_table(tmp_path):
+    path = str(tmp_path / "phonebook.xml")
+    write_xml_phonebook(path, CONTACTS, GroupRegistry([(7, "Work"), (3, "Family"), (11, "Friends")]))
+    contacts, data = build_cache(path, iter_xml_contacts, GroupRegistry.from_names(DEFAULT_GROUPS))
+    write_cache(path, data)
+
+    registry = GroupRegistry.from_names(DEFAULT_GROUPS)
+    assert records(read_cache(path, registry)) == records(CONTACTS)
+    assert list(registry.items()) == [(7, "Work"), (3, "Family"), (11, "Friends")]
+
+
+def test_content_change_with_the_same_size_and_mtime_invalidates(tmp_path):
+    path = cached_phonebook(tmp_path)
+    stat = os.stat(path)
+    with open(path, "r+b") as phonebook:
+        content = phonebook.read()
+        phonebook.seek(0)
+        phonebook.write(content.replace(b"0411", b"0499"))
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    assert (os.stat(path).st_size, os.stat(path).st_mtime_ns) == (stat.st_size, stat.st_mtime_ns)
+
+    assert read_cache(path) is None
+
+
+def test_changed_stamp_invalidates(tmp_path):
+    path = cached_phonebook(tmp_path)
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1))
+    assert read_cache(path) is None
+
+
+def test_other_groups_or_another_file_invalidate(tmp_path):
+    path = cached_phonebook(tmp_path)
+    assert read_cache(path, ["Work"]) is None
+
+    # A copy with the cache of the original next to it
+    copy = str(tmp_path / "copy.xml")
+    os.link(path, copy)
+    os.link(cache_path(path), cache_path(copy))
+    assert read_cache(copy) is None
+
+
+def test_damaged_cache_is_ignored(tmp_path):
+    path = cached_phonebook(tmp_path)
+    with open(cache_path(path), "r+b") as cache:
+        cache.truncate(os.path.getsize(cache_path(path)) - 1)
+    assert read_cache(path) is None
+
+
+def test_cached_contacts_writes_the_cache_in_the_background(tmp_path):
+    path = str(tmp_path / "phonebook.xml")
+    write_xml_phonebook(path, CONTACTS)
+    reads = []
+
+    def read_contacts(filename, groups, progress):
+        reads.append(filename)
+        return iter_xml_contacts(filename, groups, progress)
+
+    assert records(cached_contacts(path, read_contacts)) == records(CONTACTS)
+    for thread in threading.enumerate():
+        if thread.name == "phonebook-cache-writer":
+            thread.join()
+    assert records(cached_contacts(path, read_contacts)) == records(CONTACTS)
+    assert reads == [path]
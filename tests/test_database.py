@@ -0,0 +1,36 @@
+from phonebooker.core import Contact, GroupRegistry
+from phonebooker.database import ContactDatabase, write_database
+
+ODD_GROUPS = ["Research, Development", "C:\\Shares\\", "Sales\\, EMEA", "a,b", "Work"]
+
+
+def test_group_names_with_separators_and_backslashes_round_trip(tmp_path):
+    path = str(tmp_path / "phonebook.db")
+    contacts = [Contact("Ann", "Lee", "Mobile", "0411", ODD_GROUPS),
+                Contact("Bob", "Ray", "Home", "0422", ["Research, Development"]),
+                Contact("Cy", "Hu", "Work", "0433", [])]
+    write_database(path, contacts)
+
+    with ContactDatabase(path) as database:
+        read = {contact.first_name: sorted(contact.groups) for contact in database}
+        registry = database.group_registry(())
+    assert read == {"Ann": sorted(ODD_GROUPS), "Bob": ["Research, Development"], "Cy": []}
+    assert sorted(registry) == sorted(ODD_GROUPS)
+
+
+def test_edits_keep_group_names_whole(tmp_path):
+    path = str(tmp_path / "phonebook.db")
+    write_database(path, [])
+    with ContactDatabase(path) as database:
+        database.add(Contact("Ann", "Lee", "Mobile", "0411", ["Work"]))
+        (ann,) = database
+        database.replace(ann.contact_id, Contact("Ann", "Lee", "Mobile", "0411", ["Research, Development"]))
+        assert [list(contact.groups) for contact in database] == [["Research, Development"]]
+
+
+def test_databases_written_before_escaping_read_the_same(tmp_path):
+    path = str(tmp_path / "phonebook.db")
+    write_database(path, [Contact("Ann", "Lee", "Mobile", "0411", [])], groups=GroupRegistry([(4, "Work")]))
+    with ContactDatabase(path) as database:
+        database._connection.execute("UPDATE contacts SET group_names = 'Work, Friends, a,b'")
+        assert [sorted(contact.groups) for contact in database] == [["Friends", "Work", "a,b"]]
@@ -0,0 +1,108 @@
+import pytest
+
+from phonebooker.core import Contact, iter_xml_contacts, write_xml_phonebook
+from phonebooker.diff import count_changes, diff_contacts, diff_phonebooks, patch_phonebook, read_patch
+from phonebooker.journal import contact_record
+from phonebooker.vcard import iter_vcf_contacts, write_vcards
+
+
+def records(contacts):
+    return sorted(contact_record(contact) for contact in contacts)
+
+
+def test_patch_applies_in_a_session_that_registered_groups_in_another_order(tmp_path, run_session):
+    paths = {name: str(tmp_path / f"{name}.xml") for name in ("old", "new", "copy")}
+    paths["patch"] = str(tmp_path / "changes.pbpatch")
+    changes = run_session("""
+        import json
+        from phonebooker.core import GROUP_TABLE, Contact, write_xml_phonebook
+        from phonebooker.diff import count_changes, diff_phonebooks
+
+        GROUP_TABLE.mask(["Ygrp", "Xgrp"])
+        ann = Contact("Ann", "Lee", "Mobile", "0411", ["Ygrp", "Xgrp"])
+        bob = Contact("Bob", "Ray", "Work", "0422", ["Xgrp"])
+        write_xml_phonebook(paths["old"], [ann, bob], ["Ygrp", "Xgrp"])
+        write_xml_phonebook(paths["new"], [Contact("Ann", "Lee", "Mobile", "0499", ["Ygrp", "Xgrp"])],
+                            ["Ygrp", "Xgrp"])
+        print(json.dumps(count_changes(diff_phonebooks(paths["old"], paths["new"], paths["patch"]))))
+    """, paths=paths)
+    assert changes == {"added": 0, "modified": 1, "removed": 1}
+
+    result = run_session("""
+        import json
+        from phonebooker.core import Contact, GroupRegistry, iter_xml_contacts, write_xml_phonebook
+        from phonebooker.diff import patch_phonebook
+
+        # A copy with its own group table, made in a session that registered Xgrp first
+        registry = GroupRegistry([(9, "Xgrp"), (12, "Ygrp")])
+        write_xml_phonebook(paths["copy"], [Contact("Ann", "Lee", "Mobile", "0411", ["Xgrp", "Ygrp"]),
+                                            Contact("Bob", "Ray", "Work", "0422", ["Xgrp"])], registry)
+        count, missed = patch_phonebook(paths["copy"], paths["patch"])
+        contacts = [[contact.phone_number, sorted(contact.groups)] for contact in iter_xml_contacts(paths["copy"])]
+        print(json.dumps({"count": count, "missed": missed, "contacts": contacts}))
+    """, paths=paths)
+    assert result == {"count": 1, "missed": 0, "contacts": [["0499", ["Xgrp", "Ygrp"]]]}
+
+
+def test_patch_turns_a_copy_of_the_old_phonebook_into_the_new_one(tmp_path):
+    old = [Contact("Ann", "Lee", "Mobile", "0411", ["Work"]),
+           Contact("Bob", "Ray", "Home", "0422", ["Family"]),
+           Contact("Cy", "Hu", "Work", "0433", [], "Acme"),
+           Contact("Di", "Xu", "Mobile", "0444", [])]
+    new = [Contact("Ann", "Lee", "Mobile", "0499", ["Work"]),
+           Contact("Bob", "Ray", "Home", "0422", ["Family", "Friends"]),
+           Contact("Cy", "Hu", "Work", "0433", [], "Acme"),
+           Contact("Eve", "Ng", "Work", "0455", ["Work"], "Globex")]
+    paths = {name: str(tmp_path / name) for name in ("old.xml", "new.vcf", "copy.xml", "changes.pbpatch")}
+    write_xml_phonebook(paths["old.xml"], old)
+    write_vcards(paths["new.vcf"], new)
+    write_xml_phonebook(paths["copy.xml"], old)
+
+    entries = diff_phonebooks(paths["old.xml"], paths["new.vcf"], paths["changes.pbpatch"])
+    # Ann's new number is an edit, not a removal and an addition
+    assert count_changes(entries) == {"added": 1, "modified": 2, "removed": 1}
+    assert read_patch(paths["changes.pbpatch"]) == entries
+
+    assert patch_phonebook(paths["copy.xml"], paths["changes.pbpatch"]) == (4, 0)
+    assert records(iter_xml_contacts(paths["copy.xml"])) == records(new)
+    assert diff_phonebooks(paths["copy.xml"], paths["new.vcf"]) == []
+
+    # Applied again, the edits and the delete find nothing; the addition and new versions are added anyway
+    assert patch_phonebook(paths["copy.xml"], paths["changes.pbpatch"]) == (7, 3)
+
+
+def test_patch_can_write_another_format(tmp_path):
+    old = str(tmp_path / "old.xml")
+    new = str(tmp_path / "new.xml")
+    output = str(tmp_path / "patched.vcf")
+    write_xml_phonebook(old, [Contact("Ann", "Lee", "Mobile", "0411", [])])
+    write_xml_phonebook(new, [Contact("Ann", "Lee", "Mobile", "0411", []), Contact("Bob", "Ray", "Home", "0422", [])])
+    patch = str(tmp_path / "changes.pbpatch")
+    diff_phonebooks(old, new, patch)
+
+    assert patch_phonebook(old, patch, output) == (2, 0)
+    assert records(iter_vcf_contacts(output)) == records(iter_xml_contacts(new))
+
+
+def test_identical_phonebooks_have_an_empty_patch(tmp_path):
+    path = str(tmp_path / "phonebook.xml")
+    ann = Contact("Ann", "Lee", "Mobile", "0411", [])
+    write_xml_phonebook(path, [ann, ann])
+    patch = str(tmp_path / "changes.pbpatch")
+    assert diff_phonebooks(path, path, patch) == []
+    assert read_patch(patch) == []
+
+
+def test_duplicate_contacts_are_diffed_by_count():
+    ann = Contact("Ann", "Lee", "Mobile", "0411", [])
+    entries = diff_contacts([ann, ann, ann], [ann])
+    assert count_changes(entries) == {"added": 0, "modified": 0, "removed": 2}
+
+
+def test_files_that_arent_patches_are_rejected(tmp_path):
+    path = tmp_path / "changes.pbpatch"
+    for text in ["", "not json\n", '{"patch": 99}\n', '{"patch": 1}\n["rename", null, null]\n',
+                 '{"patch": 1}\n["add", null]\n']:
+        path.write_text(text, encoding="utf-8")
+        with pytest.raises(ValueError, match="not a phonebook patch"):
+            read_patch(str(path))
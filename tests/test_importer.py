@@ -0,0 +1,119 @@
+import csv
+import os
+
+import pytest
+
+from phonebooker import importer
+from phonebooker.core import Contact, OperationCancelled, PhoneIndex
+from phonebooker.database import ContactDatabase, write_database
+from phonebooker.importer import import_csv_into_database, read_csv_contacts
+
+ROWS = [
+    ["", "ann@example.com", "0411 111 111", "Ann Lee"],
+    ["", "bob@example.com", "0422 222 222", "Bob Ray"],
+    ["", "cy@example.com", "0433 333 333", "Cy Hu"],
+    # Repeats Ann's number across the chunk boundary, written another way
+    ["", "ann@example.org", "(04) 1111-1111", "Ann Lee"],
+    ["", "", "0444"],
+    ["", "di@example.com", "0455 555 555", "Di Ng"],
+    # Already in the database
+    ["", "ed@example.com", "0466 666 666", "Ed Xu"],
+    ["", "fay@example.com", "0477 777 777", "Fay Oh"],
+]
+IMPORTED = [("Ann", "Lee", "0411 111 111"), ("Bob", "Ray", "0422 222 222"), ("Cy", "Hu", "0433 333 333"),
+            ("Di", "Ng", "0455 555 555"), ("Fay", "Oh", "0477 777 777")]
+EXISTING = Contact("Ed", "Xu", "Mobile", "0466666666", [])
+
+
+@pytest.fixture(autouse=True)
+def small_chunks(monkeypatch):
+    # Chunks of three rows, so the duplicate of Ann lands in the second one
+    monkeypatch.setattr(importer, "CHUNK_ROWS", 3)
+
+
+@pytest.fixture
+def csv_file(tmp_path):
+    path = str(tmp_path / "contacts.csv")
+    with open(path, "w", newline="", encoding="utf-8") as csvfile:
+        writer = csv.writer(csvfile)
+        writer.writerow(["Template", "Email", "Phone Number", "Name"])
+        writer.writerows(ROWS)
+    return path
+
+
+@pytest.fixture
+def database(tmp_path):
+    path = str(tmp_path / "phonebook.db")
+    write_database(path, [EXISTING])
+    with ContactDatabase(path) as database:
+        yield database
+
+
+def imported(database):
+    """(first name, last name, number) of the contacts imported into database, in id order."""
+    return [(contact.first_name, contact.last_name, contact.phone_number)
+            for contact in sorted(database, key=lambda contact: contact.contact_id) if contact.first_name != "Ed"]
+
+
+def counts(report):
+    return report.added, report.existing_duplicates, report.file_duplicates, report.skipped_rows
+
+
+@pytest.mark.parametrize("jobs", [1, 2])
+def test_duplicates_across_chunks_are_skipped(csv_file, jobs):
+    contacts, report = read_csv_contacts(csv_file, PhoneIndex([EXISTING]), jobs=jobs)
+    assert [(contact.first_name, contact.last_name, contact.phone_number) for contact in contacts] == IMPORTED
+    assert counts(report) == (5, 1, 1, 1)
+
+
+def cancel_at_chunk(chunk):
+    """A progress callback cancelling before chunk (counting from 1) is imported."""
+    calls = []
+
+    def progress(done, total):
+        calls.append(done)
+        if len(calls) == chunk:
+            raise OperationCancelled
+
+    return progress
+
+
+@pytest.mark.parametrize("jobs", [1, 2])
+def test_cancelled_import_keeps_the_committed_chunks(csv_file, database, jobs):
+    with pytest.raises(OperationCancelled):
+        import_csv_into_database(csv_file, database, cancel_at_chunk(2), jobs)
+    assert imported(database) == IMPORTED[:3]
+    checkpoint = database.import_checkpoint(os.path.abspath(csv_file))
+    assert (checkpoint.rows, checkpoint.added) == (3, 3)
+
+
+@pytest.mark.parametrize("chunk", [2, 3])
+def test_resumed_import_adds_every_row_once(csv_file, database, chunk):
+    with pytest.raises(OperationCancelled):
+        import_csv_into_database(csv_file, database, cancel_at_chunk(chunk), 1)
+
+    report = import_csv_into_database(csv_file, database, jobs=1)
+    assert report.resumed_rows == 3 * (chunk - 1)
+    assert counts(report) == (5, 1, 1, 1)
+    assert imported(database) == IMPORTED
+    assert database.import_checkpoint(os.path.abspath(csv_file)) is None
+
+    # Importing the finished file again only finds existing duplicates
+    report = import_csv_into_database(csv_file, database, jobs=1)
+    assert counts(report) == (0, 7, 0, 1)
+    assert imported(database) == IMPORTED
+
+
+@pytest.mark.parametrize("restart", [True, False])
+def test_restart_or_a_changed_file_ignores_the_checkpoint(csv_file, database, restart):
+    with pytest.raises(OperationCancelled):
+        import_csv_into_database(csv_file, database, cancel_at_chunk(2), 1)
+    if not restart:
+        stat = os.stat(csv_file)
+        os.utime(csv_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1))
+
+    report = import_csv_into_database(csv_file, database, jobs=1, restart=restart)
+    assert report.resumed_rows == 0
+    # The contacts imported before the interruption now count as existing
+    assert counts(report) == (2, 5, 0, 1)
+    assert imported(database) == IMPORTED
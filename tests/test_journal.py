@@ -0,0 +1,124 @@
+import json
+
+from phonebooker import journal
+from phonebooker.core import Contact, iter_xml_contacts, write_xml_phonebook
+from phonebooker.journal import EditJournal
+
+
+def test_replay_matches_contacts_whose_groups_were_registered_in_another_order(tmp_path, run_session):
+    path = str(tmp_path / "phonebook.xml")
+    run_session("""
+        from phonebooker import journal
+        from phonebooker.core import GROUP_TABLE, Contact, write_xml_phonebook
+        from phonebooker.journal import EditJournal
+
+        GROUP_TABLE.mask(["Ygrp", "Xgrp"])
+        contact = Contact("Ann", "Lee", "Mobile", "0411", ["Ygrp", "Xgrp"])
+        write_xml_phonebook(path, [contact], ["Ygrp", "Xgrp"])
+        updated = Contact("Ann", "Lee", "Mobile", "0499", ["Ygrp", "Xgrp"])
+        print(EditJournal(path).append([journal.edited(contact, updated)]))
+    """, path=path)
+
+    numbers = run_session("""
+        import json
+        from phonebooker.core import DEFAULT_GROUPS, GROUP_TABLE, GroupRegistry, iter_xml_contacts
+        from phonebooker.journal import EditJournal
+
+        GROUP_TABLE.mask(["Xgrp"])
+        GROUP_TABLE.mask(["Ygrp"])
+        contacts = EditJournal(path).replay(iter_xml_contacts(path, GroupRegistry.from_names(DEFAULT_GROUPS)))
+        print(json.dumps([contact.phone_number for contact in contacts]))
+    """, path=path)
+    assert numbers == ["0499"]
+
+
+def test_replay_matches_journals_written_with_unsorted_groups(tmp_path):
+    path = str(tmp_path / "phonebook.xml")
+    contact = Contact("Ann", "Lee", "Mobile", "0411", ["Zgrp", "Agrp"])
+    write_xml_phonebook(path, [contact])
+    EditJournal(path).append([journal.deleted(Contact("Bob", "Ray", "Mobile", "1", ()))])
+    # An edit as a journal from before group names were sorted holds it
+    old = ["Ann", "Lee", "Mobile", "0411", ["Zgrp", "Agrp"], ""]
+    new = ["Ann", "Lee", "Mobile", "0499", ["Zgrp", "Agrp"], ""]
+    with open(journal.journal_path(path), "a", encoding="utf-8") as journal_file:
+        journal_file.write(json.dumps(["edit", old, new]) + "\n")
+
+    contacts = EditJournal(path).replay(iter_xml_contacts(path))
+    assert [contact.phone_number for contact in contacts] == ["0499"]
+
+
+def write_phonebook(path, contacts):
+    write_xml_phonebook(path, contacts)
+    return contacts
+
+
+def test_append_and_replay_apply_adds_edits_and_deletes(tmp_path):
+    path = str(tmp_path / "phonebook.xml")
+    ann, bob = write_phonebook(path, [Contact("Ann", "Lee", "Mobile", "0411", ["Work"]),
+                                      Contact("Bob", "Ray", "Home", "0422", [])])
+    edit_journal = EditJournal(path)
+    assert not edit_journal.is_current()
+
+    assert edit_journal.append([journal.edited(ann, Contact("Ann", "Lee", "Mobile", "0499", ["Family"]))]) == 1
+    assert edit_journal.append([journal.deleted(bob), journal.added(Contact("Cy", "Hu", "Work", "0433", []))]) == 2
+    assert edit_journal.is_current()
+    assert len(edit_journal) == 3
+
+    contacts = edit_journal.replay(iter_xml_contacts(path))
+    assert sorted(journal.contact_record(contact) for contact in contacts) == [
+        ("Ann", "Lee", "Mobile", "0499", ("Family",), ""),
+        ("Cy", "Hu", "Work", "0433", (), ""),
+    ]
+
+
+def test_replay_passes_contacts_through_when_an_edit_misses(tmp_path):
+    path = str(tmp_path / "phonebook.xml")
+    (ann,) = write_phonebook(path, [Contact("Ann", "Lee", "Mobile", "0411", [])])
+    ghost = Contact("Ghost", "", "Mobile", "0400", [])
+    EditJournal(path).append([journal.edited(ghost, Contact("Ghost", "", "Mobile", "0401", []))])
+
+    contacts = EditJournal(path).replay(iter_xml_contacts(path))
+    assert sorted(contact.phone_number for contact in contacts) == ["0401", "0411"]
+
+
+def test_journal_of_an_older_version_of_the_phonebook_is_stale(tmp_path):
+    path = str(tmp_path / "phonebook.xml")
+    (ann,) = write_phonebook(path, [Contact("Ann", "Lee", "Mobile", "0411", [])])
+    EditJournal(path).append([journal.deleted(ann)])
+    # A full save that crashed before discarding the journal
+    write_phonebook(path, [ann, Contact("Bob", "Ray", "Home", "0422", [])])
+
+    edit_journal = EditJournal(path)
+    assert not edit_journal.is_current()
+    assert edit_journal.entries() == []
+    assert len(edit_journal.replay(iter_xml_contacts(path))) == 2
+
+    # Appending to a stale journal starts a new one
+    edit_journal.append([journal.added(Contact("Cy", "Hu", "Work", "0433", []))])
+    assert [operation for operation, _, _ in edit_journal.entries()] == ["add"]
+
+
+def test_torn_last_line_is_dropped(tmp_path):
+    path = str(tmp_path / "phonebook.xml")
+    ann, bob = write_phonebook(path, [Contact("Ann", "Lee", "Mobile", "0411", []),
+                                      Contact("Bob", "Ray", "Home", "0422", [])])
+    edit_journal = EditJournal(path)
+    edit_journal.append([journal.deleted(ann), journal.deleted(bob)])
+    with open(edit_journal.path, "r+", encoding="utf-8") as journal_file:
+        text = journal_file.read()
+        journal_file.seek(0)
+        journal_file.truncate()
+        journal_file.write(text[:-10])
+
+    assert [old[0] for _, old, _ in edit_journal.entries()] == ["Ann"]
+    assert [contact.first_name for contact in edit_journal.replay(iter_xml_contacts(path))] == ["Bob"]
+
+
+def test_discard_removes_the_journal(tmp_path):
+    path = str(tmp_path / "phonebook.xml")
+    (ann,) = write_phonebook(path, [Contact("Ann", "Lee", "Mobile", "0411", [])])
+    edit_journal = EditJournal(path)
+    edit_journal.append([journal.deleted(ann)])
+    edit_journal.discard()
+    assert not edit_journal.is_current()
+    assert edit_journal.entries() == []
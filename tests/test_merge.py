@@ -0,0 +1,97 @@
+import pytest
+
+from phonebooker import merge
+from phonebooker.core import Contact, iter_xml_contacts, write_xml_phonebook
+from phonebooker.journal import contact_record
+from phonebooker.merge import merge_phonebooks
+from phonebooker.vcard import write_vcards
+
+
+def phonebook(tmp_path, name, contacts):
+    path = str(tmp_path / name)
+    if path.endswith(".vcf"):
+        write_vcards(path, contacts)
+    else:
+        write_xml_phonebook(path, contacts)
+    return path
+
+
+def merged(tmp_path, sources, rule=merge.DEFAULT_CONFLICT_RULE):
+    output = str(tmp_path / "merged.xml")
+    report = merge_phonebooks(sources, output, rule)
+    return report, [contact_record(contact) for contact in iter_xml_contacts(output)]
+
+
+@pytest.fixture
+def sources(tmp_path):
+    return [
+        phonebook(tmp_path, "sales.xml", [Contact("Ann", "Lee", "Work", "0411 111 111", ["Work"]),
+                                          Contact("Cy", "Hu", "Mobile", "0433", ["Work"], "Acme")]),
+        phonebook(tmp_path, "support.vcf", [Contact("Ann", "Lee", "Mobile", "(04) 1111-1111", ["Friends"], "Acme"),
+                                            Contact("Bob", "Ray", "Home", "0422", [])]),
+        phonebook(tmp_path, "staff.xml", [Contact("Ann", "Lee", "Home", "0411111111", ["Family", "Work"], "Globex")]),
+    ]
+
+
+def test_combine_keeps_the_first_contact_in_the_groups_of_all(tmp_path, sources):
+    report, contacts = merged(tmp_path, sources)
+    assert contacts == [
+        ("Cy", "Hu", "Mobile", "0433", ("Work",), "Acme"),
+        ("Ann", "Lee", "Work", "0411 111 111", ("Family", "Friends", "Work"), "Acme"),
+        ("Bob", "Ray", "Home", "0422", (), ""),
+    ]
+    assert (report.read, report.written, report.duplicates) == (5, 3, 2)
+    assert "2 contacts with the same name and number merged" in report.summary()
+
+
+def test_first_and_last_keep_one_source_contact_as_it_is(tmp_path, sources):
+    _, contacts = merged(tmp_path, sources, "first")
+    assert contacts[1] == ("Ann", "Lee", "Work", "0411 111 111", ("Work",), "")
+    _, contacts = merged(tmp_path, sources, "last")
+    assert contacts[1] == ("Ann", "Lee", "Home", "0411111111", ("Family", "Work"), "Globex")
+
+
+def test_only_the_same_name_and_number_are_duplicates(tmp_path):
+    sources = [
+        phonebook(tmp_path, "a.xml", [Contact("Ann", "Lee", "Work", "0411", []),
+                                      Contact("Switchboard", "", "Work", "1300 000 000", [])]),
+        phonebook(tmp_path, "b.xml", [Contact("Ann", "Lee", "Mobile", "0499", []),
+                                      Contact("Reception", "", "Work", "1300 000 000", [])]),
+    ]
+    report, contacts = merged(tmp_path, sources)
+    assert report.duplicates == 0
+    assert len(contacts) == 4
+
+
+def test_duplicates_within_one_source_merge_in_file_order(tmp_path, monkeypatch):
+    # Runs small enough that the duplicates end up in different ones
+    monkeypatch.setattr(merge, "RUN_CONTACTS", 2)
+    monkeypatch.setattr(merge, "SPILL_BATCH", 1)
+    source = phonebook(tmp_path, "a.xml", [Contact("Ann", "Lee", "Work", "0411", ["Work"]),
+                                           Contact("Zed", "Zu", "Work", "0400", []),
+                                           Contact("Ann", "Lee", "Home", "0411", ["Family"], "Acme"),
+                                           Contact("Bob", "Ray", "Home", "0422", [])])
+    report, contacts = merged(tmp_path, [source])
+    assert contacts == [
+        ("Ann", "Lee", "Work", "0411", ("Family", "Work"), "Acme"),
+        ("Bob", "Ray", "Home", "0422", (), ""),
+        ("Zed", "Zu", "Work", "0400", (), ""),
+    ]
+    assert report.duplicates == 1
+
+
+def test_combine_unions_group_masks():
+    duplicates = [Contact("Ann", "Lee", "Work", "0411", ["Work"]),
+                  Contact("Ann", "Lee", "Work", "0411", ["Family"]),
+                  Contact("Ann", "Lee", "Work", "0411", ["Work", "Friends"], "Acme")]
+    combined = merge.combine(duplicates)
+    assert combined.group_mask == duplicates[0].group_mask | duplicates[1].group_mask | duplicates[2].group_mask
+    assert sorted(combined.groups) == ["Family", "Friends", "Work"]
+    assert combined.company == "Acme"
+
+
+def test_bad_arguments_are_rejected(tmp_path, sources):
+    with pytest.raises(ValueError, match="conflict rule"):
+        merge_phonebooks(sources, str(tmp_path / "merged.xml"), "newest")
+    with pytest.raises(ValueError, match="Cannot merge into"):
+        merge_phonebooks(sources, str(tmp_path / "merged.csv"))
@@ -0,0 +1,42 @@
+import pytest
+
+from phonebooker.core import phone_key
+from phonebooker.phones import PhoneNormalizer, normalize_phone, normalize_phones
+
+
+@pytest.mark.parametrize("raw, phone_type, number", [
+    # A mobile in international and in local form keeps its number and type
+    ("+61 412 345 678", "Mobile", "+61 412 345 678"),
+    ("61412345678", "Mobile", "61412345678"),
+    ("0412 345 678", "Mobile", "0412 345 678"),
+    ("0412345678", "Mobile", "0412345678"),
+    # Landlines lose the country code or area code
+    ("61298765432", "Home", "298765432"),
+    ("+61 2 9876 5432", "Home", "2 9876 5432"),
+    ("298765432", "Home", "98765432"),
+    ("", "Mobile", ""),
+])
+def test_default_plan(raw, phone_type, number):
+    normalized = normalize_phone(raw)
+    assert (normalized.phone_type, normalized.number) == (phone_type, number)
+    assert normalized.key == phone_key(number)
+
+
+def test_normalize_phones_matches_normalize_phone():
+    numbers = ["+61 412 345 678", "0412345678", "61298765432"]
+    assert normalize_phones(numbers) == [normalize_phone(number) for number in numbers]
+    assert [phone.key for phone in normalize_phones(numbers)] == ["61412345678", "0412345678", "298765432"]
+
+
+def test_longest_prefix_wins():
+    normalizer = PhoneNormalizer([("", "Mobile", 0), ("1", "Work", 0), ("13", "Home", 1)])
+    assert normalizer.normalize("1300 000").phone_type == "Home"
+    assert normalizer.normalize("1300 000").number == "300 000"
+    assert normalizer.normalize("1200").phone_type == "Work"
+
+
+def test_plan_needs_a_default_rule():
+    with pytest.raises(ValueError):
+        PhoneNormalizer([("61", "Home", 2)])
+    with pytest.raises(ValueError):
+        PhoneNormalizer([("", "Mobile", 0), ("6", "Home", 2)])
@@ -0,0 +1,92 @@
+import random
+
+import pytest
+from thefuzz import fuzz
+
+from phonebooker.core import Contact
+from phonebooker.search import SEARCH_FIELDS, SIMILARITY_THRESHOLD, TrigramIndex, field_text
+
+FIRST_NAMES = ["Ann", "Anne", "Bob", "Jo", "José", "Kate", "Kathryn", "Li", "Mary-Jane", "O'Brien", "Zoë"]
+LAST_NAMES = ["Lee", "Leigh", "Ng", "Nguyen", "Smith", "Smyth", "van der Berg", "Ó Súilleabháin", "Xu"]
+COMPANIES = ["", "Acme", "Acme Pty Ltd", "ACME, Inc.", "Globex", "Initech"]
+GROUPS = ["Work", "Family", "Friends"]
+
+
+def typo(rng, text):
+    """text with a letter dropped, doubled or swapped, or as it is."""
+    if len(text) < 2:
+        return text
+    i = rng.randrange(len(text) - 1)
+    return rng.choice([text[:i] + text[i + 1:], text[:i] + text[i] + text[i:],
+                       text[:i] + text[i + 1] + text[i] + text[i + 2:], text])
+
+
+@pytest.fixture(scope="module")
+def contacts():
+    rng = random.Random(4)
+    contacts = []
+    for contact_id in range(1, 401):
+        contact = Contact(typo(rng, rng.choice(FIRST_NAMES)), typo(rng, rng.choice(LAST_NAMES)),
+                          rng.choice(["Home", "Work", "Mobile"]), f"04{rng.randrange(10 ** 8):08d}",
+                          rng.sample(GROUPS, rng.randrange(3)), rng.choice(COMPANIES))
+        contact.contact_id = contact_id
+        contacts.append(contact)
+    return contacts
+
+
+def brute_force(contacts, query, field, case_sensitive=False, exact_match=False):
+    """contact_ids matching query in field, scoring every contact."""
+    if not case_sensitive:
+        query = query.lower()
+    matches = set()
+    for contact in contacts:
+        text = field_text(contact, field)
+        if not case_sensitive:
+            text = text.lower()
+        if exact_match:
+            matched = text == query
+        elif field == "phone_number":
+            matched = query in text
+        else:
+            matched = fuzz.token_set_ratio(query, text) >= SIMILARITY_THRESHOLD
+        if matched:
+            matches.add(contact.contact_id)
+    return matches
+
+
+QUERIES = ["ann", "Kate Smith", "kathy", "smyth", "nguyn", "van berg", "jose", "zoe", "o brien", "li", "x",
+           "acme", "acme inc", "glob", "work", "friend", "family work", "mobile", "0412", "04", "", "!!"]
+
+
+@pytest.mark.parametrize("field", SEARCH_FIELDS)
+def test_search_matches_scoring_every_contact(contacts, field):
+    index = TrigramIndex(contacts)
+    queries = QUERIES + [contacts[7].phone_number[3:8], contacts[11].first_name, contacts[12].last_name]
+    for query in queries:
+        assert index.search(query, (field,)) == brute_force(contacts, query, field), query
+    assert index.search("Kate", (field,), case_sensitive=True) == brute_force(contacts, "Kate", field, True)
+    for query in ["kate", "Kate", "work", "acme pty ltd", contacts[3].phone_number, field_text(contacts[5], field)]:
+        assert index.search(query, (field,), exact_match=True) == brute_force(contacts, query, field, exact_match=True)
+        assert index.search(query, (field,), case_sensitive=True, exact_match=True) == \
+            brute_force(contacts, query, field, True, True)
+
+
+def test_all_fields_search_matches_scoring_every_field(contacts):
+    index = TrigramIndex(contacts)
+    for query in QUERIES:
+        expected = set().union(*(brute_force(contacts, query, field) for field in SEARCH_FIELDS))
+        assert index.search(query) == expected, query
+
+
+def test_index_follows_edits(contacts):
+    contacts = list(contacts)
+    index = TrigramIndex(contacts)
+    index.search("ann")
+    edited = Contact("Rumpelstiltskin", "Lee", "Home", "0400", [])
+    edited.contact_id = contacts[0].contact_id
+    index.replace(contacts[0], edited)
+    contacts[0] = edited
+    index.remove(contacts[1])
+    del contacts[1]
+    for query in ["rumpelstiltskin", "ann", "lee"]:
+        assert index.search(query) == set().union(*(brute_force(contacts, query, field) for field in SEARCH_FIELDS))
@@ -0,0 +1,108 @@
+from phonebooker.core import Contact
+from phonebooker.vcard import (FOLD_OCTETS, escape_text, fold_line, iter_vcf_contacts, unescape_text, vcard_text,
+                               write_vcards)
+
+
+def unfold(text):
+    return text.replace("\r\n ", "")
+
+
+def test_escape_text_round_trips():
+    for value in ["plain", "Smith, Jr.", "a;b", "back\\slash", "two\nlines", "\\n is not a newline", ",;\\\n"]:
+        assert unescape_text(escape_text(value)) == value
+    assert escape_text("Smith, Jr.; Esq.\\") == "Smith\\, Jr.\\; Esq.\\\\"
+
+
+def test_fold_line_keeps_every_line_within_the_octet_limit():
+    for line in ["N:" + "x" * 200, "FN:" + "é" * 100, "ORG:" + "日本語" * 40, "FN:" + "a😀" * 50]:
+        folded = fold_line(line)
+        pieces = folded.split("\r\n")
+        assert len(pieces) > 1
+        assert all(len(piece.encode("utf-8")) <= FOLD_OCTETS for piece in pieces)
+        assert all(piece.startswith(" ") for piece in pieces[1:])
+        assert unfold(folded) == line
+
+
+def test_short_lines_are_not_folded():
+    line = "N:" + "x" * (FOLD_OCTETS - 2)
+    assert fold_line(line) == line
+    assert fold_line("FN:Zoë") == "FN:Zoë"
+
+
+def test_cards_are_folded_and_escaped():
+    contact = Contact("Zoë", "Ünal-" + "ß" * 60, "Work", "+61 400 000 000", [], "Acme, Inc.; Sydney")
+    card = vcard_text(contact)
+    assert all(len(line.encode("utf-8")) <= FOLD_OCTETS for line in card.split("\r\n"))
+    lines = unfold(card).split("\r\n")
+    assert "ORG:Acme\\, Inc.\\; Sydney" in lines
+    assert "TEL;TYPE=WORK:+61 400 000 000" in lines
+    assert f"N:{contact.last_name};Zoë;;;" in lines
+
+
+def read_vcf(tmp_path, text, groups=None):
+    path = tmp_path / "contacts.vcf"
+    path.write_bytes(text.replace("\n", "\r\n").encode("utf-8"))
+    return list(iter_vcf_contacts(str(path), groups))
+
+
+def test_quoted_printable_values_are_decoded(tmp_path):
+    (contact,) = read_vcf(tmp_path, """\
+BEGIN:VCARD
+VERSION:2.1
+N;ENCODING=QUOTED-PRINTABLE;CHARSET=UTF-8:M=C3=BCller;J=C3=B6rg;;;
+FN;QUOTED-PRINTABLE;CHARSET=UTF-8:J=C3=B6rg M=C3=BC=
+ller
+TEL;CELL:0411 111 111
+ORG;ENCODING=QUOTED-PRINTABLE:Caf=C3=A9 =
+Ltd
+END:VCARD
+""")
+    assert (contact.first_name, contact.last_name, contact.company) == ("Jörg", "Müller", "Café Ltd")
+    assert (contact.phone_type, contact.phone_number) == ("Mobile", "0411 111 111")
+
+
+def test_grouped_properties_and_preferred_numbers(tmp_path):
+    contacts = read_vcf(tmp_path, """\
+BEGIN:VCARD
+VERSION:3.0
+N:Lee;Ann;;;
+item1.TEL;type=HOME:0422 222 222
+item2.TEL;type="voice,work";type=pref:0433 333 333
+item2.X-ABLabel:Office
+END:VCARD
+""")
+    assert [(contact.phone_type, contact.phone_number) for contact in contacts] == [
+        ("Work", "0433 333 333"), ("Home", "0422 222 222")]
+    assert all((contact.first_name, contact.last_name) == ("Ann", "Lee") for contact in contacts)
+
+
+def test_folded_lines_are_joined(tmp_path):
+    (contact,) = read_vcf(tmp_path, """\
+BEGIN:VCARD
+VERSION:4.0
+N:Lee;An
+ n;;;
+TEL;VALUE=uri;TYPE=work;PREF=1:tel:+61-4
+\t00-000-000
+CATEGORIES:Work,Fri
+ ends
+END:VCARD
+""")
+    assert (contact.first_name, contact.phone_number) == ("Ann", "+61-400-000-000")
+    assert list(contact.groups) == ["Work", "Friends"]
+
+
+def test_written_cards_read_back(tmp_path):
+    path = str(tmp_path / "contacts.vcf")
+    contacts = [
+        Contact("Zoë", "Ünal-" + "ß" * 60, "Work", "+61 400 000 000", ["Work"], "Acme, Inc.; Sydney"),
+        Contact("Back\\slash", "O'Neil", "Home", "0422", ["Family", "Friends"], "Line\nbreak"),
+        Contact("Ann", "Lee", "Mobile", "0411", []),
+    ]
+    for version in ("3.0", "4.0"):
+        assert write_vcards(path, contacts, version) == 3
+        read = iter_vcf_contacts(path, ["Work", "Family", "Friends"])
+        assert [(contact.first_name, contact.last_name, contact.phone_type, contact.phone_number,
+                 contact.groups, contact.company) for contact in read] == [
+            (contact.first_name, contact.last_name, contact.phone_type, contact.phone_number,
+             contact.groups, contact.company) for contact in contacts]